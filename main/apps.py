@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        # Connect the signal receivers publishing websocket topics
+        from main import signals
+        # Make the retained topics depending on time expire and refresh at their boundaries
+        from main import schedule
@@ -0,0 +1,313 @@
+# Import necessary modules
+import asyncio
+import hashlib
+import threading
+from collections import namedtuple, OrderedDict
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from main import broadcast
+
+
+# Identity of an authenticated user: team_id is None for users who are not managers
+Identity = namedtuple('Identity', ['user_id', 'is_staff', 'team_id'])
+
+# Cached value marking a token that doesn't exist
+INVALID_TOKEN = 0
+
+# Lookups of the same token running concurrently in this process
+_pending_lookups = {}
+
+# Fields of the users kept in the REST token cache. The others, like the password hash, are
+# deferred and only loaded if a view reads them
+USER_FIELDS = ('id', 'username', 'first_name', 'last_name', 'email', 'is_staff', 'is_superuser', 'is_active',
+               'date_joined')
+# Redis channel telling every process to drop tokens from its cache, messages are token digests
+INVALIDATION_CHANNEL = 'auth:invalidate'
+
+# Snapshots of recently used tokens kept by this process: digest -> snapshot, least recently used
+# first, trusted only while the invalidation listener runs
+_local_tokens = OrderedDict()
+_local_tokens_lock = threading.Lock()
+# Number of invalidations received, so a token read before one of them isn't kept after it
+_generation = 0
+
+
+def _digest(key):
+    # Tokens are credentials, so only their digest is used in cache keys
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def _cache_key(key):
+    # Key of the cached identity of a token
+    return _identity_key(_digest(key))
+
+
+def _identity_key(digest):
+    return 'auth:token:' + digest
+
+
+def _snapshot_key(digest):
+    # Key of the cached snapshot of a token, see authenticate_token
+    return 'auth:user:' + digest
+
+
+def _forget(digest=None):
+    # Drops a token, or all of them, from the cache of this process
+    global _generation
+    with _local_tokens_lock:
+        _generation += 1
+        if digest is None:
+            _local_tokens.clear()
+        else:
+            _local_tokens.pop(digest, None)
+
+
+# Receives the invalidations sent by every process
+_listener = broadcast.InvalidationListener(INVALIDATION_CHANNEL, _forget, _forget)
+
+
+# Function to resolve a token into the identity of its user
+def resolve_token(key):
+    """
+    Resolves an authentication token into the identity of its user.
+
+    Identities are cached for settings.AUTH_CACHE_TTL seconds and invalid tokens for
+    settings.AUTH_NEGATIVE_CACHE_TTL seconds. On a cache miss the identity is loaded with one
+    joined query.
+
+    Args:
+        key (str): The token key.
+
+    Returns:
+        Identity or None: Identity of the user, or None if the token doesn't exist.
+    """
+    if not isinstance(key, str) or not key:
+        return None
+    cache_key = _cache_key(key)
+    cached = cache.get(cache_key)
+    if cached == INVALID_TOKEN:
+        return None
+    if cached is not None:
+        return Identity(*cached)
+
+    row = Token.objects.filter(key=key).values_list(
+        'user_id', 'user__is_staff', 'user__manager__team_id').first()
+    if row is None:
+        cache.set(cache_key, INVALID_TOKEN, settings.AUTH_NEGATIVE_CACHE_TTL)
+        return None
+    cache.set(cache_key, tuple(row), settings.AUTH_CACHE_TTL)
+    return Identity(*row)
+
+
+# Function to resolve a token from asynchronous code
+async def aresolve_token(key):
+    """
+    Resolves an authentication token from asynchronous code.
+
+    Concurrent lookups of the same token in this process share one cache read and at most one
+    database query, so reconnect storms don't multiply auth queries.
+
+    Args:
+        key (str): The token key.
+
+    Returns:
+        Identity or None: Identity of the user, or None if the token doesn't exist.
+    """
+    if not isinstance(key, str) or not key:
+        return None
+    future = _pending_lookups.get(key)
+    if future is None:
+        future = asyncio.ensure_future(database_sync_to_async(resolve_token)(key))
+        _pending_lookups[key] = future
+        future.add_done_callback(lambda _: _pending_lookups.pop(key, None))
+    return await asyncio.shield(future)
+
+
+# Function to load the snapshot of a token
+def _load_snapshot(key, digest):
+    cached = cache.get(_snapshot_key(digest))
+    if cached is not None:
+        return cached
+    fields = ['created', 'user__manager__team_id'] + ['user__' + field for field in USER_FIELDS]
+    row = Token.objects.filter(key=key).values_list(*fields).first()
+    if row is None:
+        cache.set(_snapshot_key(digest), INVALID_TOKEN, settings.AUTH_NEGATIVE_CACHE_TTL)
+        return INVALID_TOKEN
+    snapshot = tuple(row)
+    cache.set(_snapshot_key(digest), snapshot, settings.AUTH_CACHE_TTL)
+    return snapshot
+
+
+# Function to authenticate a REST token
+def authenticate_token(key):
+    """
+    Resolves a token into its user, from the cache of this process, then the shared cache.
+
+    On a miss of both caches the token, its user and the team they manage are loaded with one
+    joined query. The process keeps settings.AUTH_LOCAL_CACHE_SIZE tokens, dropped by every
+    process when the token, its user or its manager changes, see invalidate_tokens.
+
+    Args:
+        key (str): The token key.
+
+    Returns:
+        tuple or None: (user, token) where the token carries the identity of the user under
+            `identity`, or None if the token doesn't exist.
+    """
+    digest = _digest(key)
+    listening = _listener.running()
+    with _local_tokens_lock:
+        snapshot = _local_tokens.get(digest) if listening else None
+        if snapshot is not None:
+            _local_tokens.move_to_end(digest)
+    if snapshot is None:
+        generation = _generation
+        snapshot = _load_snapshot(key, digest)
+        if snapshot == INVALID_TOKEN:
+            return None
+        with _local_tokens_lock:
+            if listening and generation == _generation:
+                _local_tokens[digest] = snapshot
+                while len(_local_tokens) > settings.AUTH_LOCAL_CACHE_SIZE:
+                    _local_tokens.popitem(last=False)
+    return _user_and_token(key, snapshot)
+
+
+def _user_and_token(key, snapshot):
+    # Fresh instances on every request, views may change them
+    created, team_id, *values = snapshot
+    # Loaded fields are given in the order of the model, the others are deferred
+    values = dict(zip(USER_FIELDS, values))
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    user = User.from_db(DEFAULT_DB_ALIAS, fields, [values[field] for field in fields])
+    token = Token.from_db(DEFAULT_DB_ALIAS, ['key', 'user_id', 'created'], [key, user.pk, created])
+    token.user = user
+    token.identity = Identity(user.pk, user.is_staff, team_id)
+    return user, token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement of TokenAuthentication serving tokens from process and shared caches.
+
+    Authenticated requests run no query for their token, see authenticate_token.
+    """
+    def authenticate_credentials(self, key):
+        resolved = authenticate_token(key)
+        if resolved is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        user, token = resolved
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        return user, token
+
+
+# Function to get the identity of a REST request
+def request_identity(request):
+    """
+    Retrieves the identity of the user authenticated by a REST request.
+
+    The identity is resolved from the token of the request once and kept on the request, so views,
+    permissions and serializers read the user, staff flag and team without any further query. It
+    is cached along with the token, see resolve_token.
+
+    Args:
+        request (Request): The REST framework request.
+
+    Returns:
+        Identity or None: Identity of the user, or None if the request isn't authenticated.
+    """
+    if 'identity' not in request.__dict__:
+        # Tokens authenticated by CachedTokenAuthentication already carry the identity
+        identity = getattr(request.auth, 'identity', None)
+        if identity is None:
+            key = getattr(request.auth, 'key', None)
+            identity = resolve_token(key) if key else None
+        request.__dict__['identity'] = identity
+    return request.__dict__['identity']
+
+
+# Function to drop cached identities of tokens
+def invalidate_tokens(keys):
+    """
+    Removes tokens from the identity cache, e.g. after they were deleted or their user changed.
+
+    The cache entries are removed once the current transaction is committed, so a concurrent
+    lookup can't cache the identity as it was before the change.
+
+    Args:
+        keys (iterable): Token keys.
+
+    Returns:
+        None
+    """
+    digests = [_digest(key) for key in keys]
+    if digests:
+        transaction.on_commit(lambda: _drop(digests))
+
+
+def _drop(digests):
+    # Removes tokens from the shared cache and from the cache of every process
+    cache.delete_many([_identity_key(digest) for digest in digests] + [_snapshot_key(digest) for digest in digests])
+    for digest in digests:
+        _listener.publish(digest)
+
+
+# Function to drop cached identities of a user
+def invalidate_user(user_id):
+    """
+    Removes all tokens of a user from the identity cache.
+
+    Args:
+        user_id (int): ID of the user.
+
+    Returns:
+        None
+    """
+    invalidate_tokens(Token.objects.filter(user=user_id).values_list('key', flat=True))
+
+
+# Function to authenticate a websocket connection
+async def authenticate(scope, key=None):
+    """
+    Retrieves the identity of a websocket connection.
+
+    Args:
+        scope (dict): ASGI scope of the connection.
+        key (str): Token sent by the client in a message, takes precedence over the handshake.
+
+    Returns:
+        Identity or None: Identity of the user, or None if the connection isn't authenticated.
+    """
+    if key is not None:
+        return await aresolve_token(key)
+    return scope.get('identity')
+
+
+class TokenAuthMiddleware(BaseMiddleware):
+    """
+    ASGI middleware authenticating websocket handshakes with DRF tokens.
+
+    The token is read from the `token` query string parameter or the `Authorization: Token <key>`
+    header. The resolved identity, or None, is stored in scope['identity']. Clients that send
+    their token in the first message are authenticated by the consumers instead.
+    """
+    async def __call__(self, scope, receive, send):
+        key = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+        for name, value in scope.get('headers', []):
+            if name == b'authorization':
+                keyword, _, token = value.decode().partition(' ')
+                if keyword == 'Token' and token:
+                    key = token
+        scope = dict(scope, identity=await aresolve_token(key) if key else None)
+        return await super().__call__(scope, receive, send)
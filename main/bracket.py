@@ -0,0 +1,113 @@
+# Import necessary modules
+import datetime
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from main.models import Tournament
+
+
+# Playoff tournaments are placed in a binary bracket by (season, stage, inline_number): the
+# tournaments 2k and 2k + 1 of a stage are siblings, and their winners play the tournament k of the
+# next stage, the winner of the even sibling as team one and the winner of the odd one as team two.
+
+
+# Function to build the start time of a tournament created for the next stage
+def next_stage_start_time():
+    """
+    Returns the default start time of a next stage tournament: tomorrow at 15:00, local time.
+
+    Returns:
+        datetime.datetime: The aware start time.
+    """
+    return timezone.make_aware(datetime.datetime.combine(
+        timezone.localdate() + datetime.timedelta(days=1), datetime.time(15, 0)))
+
+
+# Function to lock the tournaments a winner change may touch
+def lock(tournament_id):
+    """
+    Locks a tournament, its sibling and its parent in primary key order.
+
+    Called before the winner of the tournament changes, so the advances of both siblings wait for
+    each other on the first row instead of each holding its own tournament while waiting for the
+    other one. The IDs are read first, so the rows are locked in the order of the primary key rather
+    than the order of the index the filter uses.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+
+    Returns:
+        None
+    """
+    tournament = Tournament.objects.filter(pk=tournament_id).values('season', 'stage', 'inline_number').first()
+    if tournament is None or tournament['inline_number'] is None:
+        return
+    number = tournament['inline_number']
+    ids = list(Tournament.objects.filter(
+        Q(pk=tournament_id)
+        | Q(stage=tournament['stage'], inline_number=number ^ 1)
+        | Q(stage=tournament['stage'] + 1, inline_number=number >> 1),
+        season=tournament['season']).values_list('pk', flat=True))
+    list(Tournament.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk', flat=True))
+
+
+# Function to advance the winner of a tournament in the bracket
+@transaction.atomic
+def advance(tournament):
+    """
+    Places the winner of a tournament in the tournament of the next stage.
+
+    The sibling and the parent tournaments are loaded and locked with one indexed query. Callers
+    lock them with `lock` before changing the winner, so concurrent advances of both siblings are
+    serialized and create the parent only once. The parent is created when both siblings have a
+    winner, otherwise the winner takes its slot in it.
+
+    Args:
+        tournament (Tournament): The tournament, with its new winner.
+
+    Returns:
+        Tournament or None: The parent tournament, or None if it doesn't exist yet.
+    """
+    if tournament.inline_number is None or tournament.winner_id is None:
+        return None
+    number = tournament.inline_number
+    # Flipping the lowest bit gives the sibling, dropping it gives the parent
+    sibling_number, parent_number = number ^ 1, number >> 1
+    slot = 'team_one_id' if number % 2 == 0 else 'team_two_id'
+
+    rows = Tournament.objects.select_for_update().filter(
+        Q(stage=tournament.stage, inline_number=sibling_number)
+        | Q(stage=tournament.stage + 1, inline_number=parent_number),
+        season=tournament.season_id)
+    sibling = parent = None
+    for row in rows:
+        if row.stage == tournament.stage:
+            sibling = row
+        else:
+            parent = row
+
+    if parent is None:
+        if sibling is None or sibling.winner_id is None:
+            # The parent is created by the advance of the sibling
+            return None
+        # Both siblings are won, create the tournament of the next stage
+        parent = Tournament(
+            season_id=tournament.season_id,
+            stage=tournament.stage + 1,
+            inline_number=parent_number,
+            is_finished=False,
+            match_start_time=next_stage_start_time())
+        setattr(parent, slot, tournament.winner_id)
+        setattr(parent, 'team_two_id' if slot == 'team_one_id' else 'team_one_id', sibling.winner_id)
+        parent.save()
+    elif getattr(parent, slot) != tournament.winner_id:
+        # Replace the previous winner in the slot of the tournament
+        setattr(parent, slot, tournament.winner_id)
+        parent.save()
+
+    # Linking both siblings to their parent
+    children = [tournament.pk] + ([sibling.pk] if sibling is not None else [])
+    Tournament.objects.filter(pk__in=children).exclude(next_stage_tournament=parent).update(
+        next_stage_tournament=parent)
+    return parent
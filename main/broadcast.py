@@ -0,0 +1,608 @@
+# Import necessary modules
+import asyncio
+import json
+import logging
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+
+import msgpack
+import redis
+import redis.asyncio as aioredis
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+
+
+# Lua script assigning the next version of a topic and appending the payload to its replay log.
+# Running it as one script keeps version numbers and log order consistent between publishers.
+# Retained topics also keep their latest payload, so snapshots don't have to be rebuilt, with the
+# timestamp it expires at if it depends on time.
+PUBLISH_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+local entry = redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[2], '*', 'version', version, 'payload', ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+if ARGV[4] == '1' then
+    redis.call('HSET', KEYS[3], 'version', version, 'payload', ARGV[1])
+    if ARGV[5] == '' then
+        redis.call('HDEL', KEYS[3], 'expires')
+    else
+        redis.call('HSET', KEYS[3], 'expires', ARGV[5])
+    end
+end
+return {version, entry}
+"""
+
+# Redis clients are created lazily, so importing this module doesn't open any connection
+_redis = None
+_publish_script = None
+_async_redis = weakref.WeakKeyDictionary()
+
+# Alias of the channel layer topic groups are sent over, see CHANNEL_LAYERS. Pub/sub delivery is at
+# most once, a lost reference is covered by the next version since every version is a full payload.
+TOPICS_LAYER = 'topics'
+
+# Encoded payloads of recent versions, shared by all consumers of the process.
+# Every subscriber of a version sends the same text, so it is fetched and kept once per process.
+PAYLOAD_CACHE_SIZE = 256
+_payloads = OrderedDict()
+_payloads_lock = threading.Lock()
+_pending_fetches = {}
+
+# Encodings and compressions clients can negotiate, the first ones are the defaults
+ENCODINGS = ('json', 'msgpack')
+COMPRESSIONS = (None, 'deflate')
+
+# Frames of recent versions in each negotiated encoding, so every encoding is produced once
+FRAME_CACHE_SIZE = 256
+_frames = OrderedDict()
+_frames_lock = threading.Lock()
+
+# Slices of recent versions by window, for subscribers viewing part of a topic
+_windows = OrderedDict()
+_windows_lock = threading.Lock()
+
+# Retained topics whose payload changes with time, without any write:
+# topic -> (function returning the next time the payload changes or None, function called with the
+# topic and that time after the payload is retained, to refresh it then), see `expire_at_boundary`
+_boundaries = {}
+
+
+def get_redis():
+    """
+    Returns the synchronous Redis client used for publishing topics.
+
+    Returns:
+        redis.Redis: Redis client connected to settings.REDIS_URL.
+    """
+    global _redis, _publish_script
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        _publish_script = _redis.register_script(PUBLISH_SCRIPT)
+    return _redis
+
+
+def get_async_redis():
+    """
+    Returns the asynchronous Redis client bound to the running event loop.
+
+    Returns:
+        redis.asyncio.Redis: Redis client connected to settings.REDIS_URL.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_redis.get(loop)
+    if client is None:
+        client = aioredis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+        _async_redis[loop] = client
+    return client
+
+
+class InvalidationListener:
+    """
+    Thread of this process receiving the messages of a Redis channel, so caches kept in process
+    memory can drop the entries other processes changed.
+
+    A process cache must only be trusted while `running` returns True: messages may be missed
+    before the listener starts or after its connection breaks, so `on_reset` is then called to
+    drop the whole cache. The thread is started on first use, and again after a fork.
+
+    Args:
+        channel (str): Name of the Redis channel.
+        on_message (callable): Function called in the listener thread with the data of a message.
+        on_reset (callable): Function without arguments dropping the whole cache.
+    """
+    def __init__(self, channel, on_message, on_reset):
+        self.channel = channel
+        self.on_message = on_message
+        self.on_reset = on_reset
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def running(self):
+        """
+        Starts the listener if it isn't running.
+
+        Returns:
+            bool: True if the listener runs, False if Redis can't be reached.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return True
+            self.on_reset()
+            try:
+                pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{self.channel: lambda message: self.on_message(message['data'])})
+                self._thread = pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=self._stopped)
+            except redis.RedisError as error:
+                logging.warning(f'Listener of {self.channel} not started: {error}')
+                return False
+        return True
+
+    def publish(self, data=''):
+        """
+        Sends a message to the listeners of every process, this one included.
+
+        Args:
+            data (str): Data of the message.
+
+        Returns:
+            None
+        """
+        get_redis().publish(self.channel, data)
+
+    def _stopped(self, error, pubsub, thread):
+        # The connection broke, the listener is started again on next use
+        logging.warning(f'Listener of {self.channel} stopped: {error}')
+        thread.stop()
+        pubsub.close()
+        self.on_reset()
+
+
+def _version_key(topic):
+    # Key of the counter holding the last version published to the topic
+    return f'topic:{topic}:version'
+
+
+def _log_key(topic):
+    # Key of the stream holding recent versions of the topic
+    return f'topic:{topic}:log'
+
+
+def _latest_key(topic):
+    # Key of the hash holding the latest version of a retained topic
+    return f'topic:{topic}:latest'
+
+
+def _retained(retained):
+    # Read the hash of a retained topic, an expired payload is treated as not retained
+    if not retained or ('expires' in retained and float(retained['expires']) <= time.time()):
+        return 0, None
+    return int(retained['version']), retained['payload']
+
+
+def _remember(topic, version, text):
+    # Store an encoded payload in the process cache, dropping the least recently used ones
+    with _payloads_lock:
+        _payloads[(topic, version)] = text
+        _payloads.move_to_end((topic, version))
+        while len(_payloads) > PAYLOAD_CACHE_SIZE:
+            _payloads.popitem(last=False)
+
+
+def _recall(topic, version):
+    # Retrieve an encoded payload from the process cache
+    with _payloads_lock:
+        text = _payloads.get((topic, version))
+        if text is not None:
+            _payloads.move_to_end((topic, version))
+        return text
+
+
+def negotiate(encoding, compression):
+    """
+    Picks the frame encoding and compression requested by a client.
+
+    Unsupported values fall back to the defaults, plain JSON text frames.
+
+    Args:
+        encoding (str): Requested encoding, 'json' or 'msgpack'.
+        compression (str): Requested compression, 'deflate' or None.
+
+    Returns:
+        tuple: Supported (encoding, compression) pair.
+    """
+    if encoding not in ENCODINGS:
+        encoding = ENCODINGS[0]
+    if compression not in COMPRESSIONS:
+        compression = COMPRESSIONS[0]
+    return encoding, compression
+
+
+def encode_frame(text, version, encoding, compression, versioned, labelled=None):
+    """
+    Encodes a JSON payload into a websocket frame.
+
+    Args:
+        text (str): JSON encoded payload.
+        version (int): Version of the payload.
+        encoding (str): Negotiated encoding, 'json' or 'msgpack'.
+        compression (str): Negotiated compression, 'deflate' or None.
+        versioned (bool): Flag indicating whether the payload is wrapped with its version.
+        labelled (str): Topic name added to the wrapper, for connections multiplexing topics.
+
+    Returns:
+        str or bytes: Text frame for uncompressed JSON, binary frame otherwise.
+    """
+    if encoding == 'msgpack':
+        data = json.loads(text)
+        if labelled is not None:
+            frame = msgpack.packb({'topic': labelled, 'version': version, 'data': data})
+        else:
+            frame = msgpack.packb({'version': version, 'data': data} if versioned else data)
+    elif labelled is not None:
+        frame = '{"topic": %s, "version": %d, "data": %s}' % (json.dumps(labelled), version, text)
+    elif versioned:
+        frame = '{"version": %d, "data": %s}' % (version, text)
+    else:
+        frame = text
+    if compression == 'deflate':
+        if isinstance(frame, str):
+            frame = frame.encode()
+        frame = zlib.compress(frame)
+    return frame
+
+
+def shared_frame(topic, version, text, encoding, compression, versioned, labelled=False):
+    """
+    Encodes a published version of a topic, reusing the frame built for previous subscribers.
+
+    Args:
+        topic (str): Name of the topic.
+        version (int): Version of the payload.
+        text (str): JSON encoded payload published under this version.
+        encoding (str): Negotiated encoding.
+        compression (str): Negotiated compression.
+        versioned (bool): Flag indicating whether the payload is wrapped with its version.
+        labelled (bool): Flag indicating whether the topic name is added to the wrapper.
+
+    Returns:
+        str or bytes: The encoded frame.
+    """
+    # Plain JSON frames are the payload itself
+    if encoding == 'json' and compression is None and not versioned and not labelled:
+        return text
+    key = (topic, version, encoding, compression, versioned, labelled)
+    with _frames_lock:
+        frame = _frames.get(key)
+        if frame is not None:
+            _frames.move_to_end(key)
+            return frame
+    frame = encode_frame(text, version, encoding, compression, versioned, topic if labelled else None)
+    with _frames_lock:
+        _frames[key] = frame
+        while len(_frames) > FRAME_CACHE_SIZE:
+            _frames.popitem(last=False)
+    return frame
+
+
+# Function to get the slice of a published version seen through a window
+def windowed_text(topic, version, text, window, shared=True):
+    """
+    Applies a window to a version of a topic, reusing the slice built for previous subscribers.
+
+    Args:
+        topic (str): Name of the topic.
+        version (int): Version of the payload.
+        text (str): JSON encoded payload.
+        window: Hashable window with an `apply(payload)` method returning the slice.
+        shared (bool): Flag indicating whether the text is the one published under this version,
+            only those slices are kept for the other subscribers.
+
+    Returns:
+        str: JSON encoded slice.
+    """
+    key = (topic, version, window)
+    if shared:
+        with _windows_lock:
+            sliced = _windows.get(key)
+            if sliced is not None:
+                _windows.move_to_end(key)
+                return sliced
+    sliced = json.dumps(window.apply(json.loads(text)), ensure_ascii=False)
+    if shared:
+        with _windows_lock:
+            _windows[key] = sliced
+            while len(_windows) > FRAME_CACHE_SIZE:
+                _windows.popitem(last=False)
+    return sliced
+
+
+def publish(topic, message_type, payload, retain=False):
+    """
+    Publishes a new version of a topic payload to its subscribers.
+
+    The payload is encoded once and appended to the replay log of the topic under the next version
+    number. The channel layer group named after the topic only receives a reference to the log
+    entry, which consumers resolve with `fetch`.
+
+    Args:
+        topic (str): Name of the topic, also used as the channel layer group name.
+        message_type (str): Name of the consumer handler the message is dispatched to.
+        payload: JSON-serializable payload of the topic.
+        retain (bool): Flag indicating whether the payload is kept as the snapshot of the topic.
+
+    Returns:
+        int: Version assigned to the payload.
+    """
+    get_redis()
+    text = json.dumps(payload, ensure_ascii=False)
+    boundary = _boundaries.get(topic) if retain else None
+    expires = boundary[0]() if boundary is not None else None
+    version, entry = _publish_script(
+        keys=[_version_key(topic), _log_key(topic), _latest_key(topic)],
+        args=[text, settings.REPLAY_LOG_MAXLEN, settings.REPLAY_LOG_TTL, int(retain),
+              expires.timestamp() if expires is not None else ''])
+    version = int(version)
+    if expires is not None:
+        boundary[1](topic, expires)
+    # Consumers of this process don't need to read the payload back from Redis
+    _remember(topic, version, text)
+    async_to_sync(get_channel_layer(TOPICS_LAYER).group_send)(
+        topic,
+        {
+            'type': message_type,
+            'topic': topic,
+            'version': version,
+            'entry': entry
+        }
+    )
+    return version
+
+
+def on_commit_once(key, func):
+    """
+    Registers a commit hook that runs once per transaction for a given key.
+
+    A unit of work often saves several rows feeding the same topic; only the first hook registered
+    under a key is kept until the transaction is committed or rolled back. Outside of a
+    transaction the hook runs immediately.
+
+    Args:
+        key (str): Key identifying the hook, e.g. the topic it publishes.
+        func (callable): Function without arguments to run after commit.
+
+    Returns:
+        None
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        func()
+        return
+    if hook_pending(key):
+        return
+    pending = connection.__dict__.setdefault('pending_topic_hooks', {})
+
+    def run():
+        pending.pop(key, None)
+        func()
+
+    pending[key] = run
+    transaction.on_commit(run)
+
+
+def hook_pending(key):
+    """
+    Tells whether a hook registered with `on_commit_once` waits for the current transaction.
+
+    Args:
+        key (str): Key of the hook.
+
+    Returns:
+        bool: True if the hook will run when the current transaction is committed.
+    """
+    connection = transaction.get_connection()
+    hook = connection.__dict__.get('pending_topic_hooks', {}).get(key)
+    # The hook is dropped from run_on_commit once it ran or its transaction was rolled back
+    return hook is not None and any(entry[1] is hook for entry in connection.run_on_commit)
+
+
+def publish_on_commit(topic, message_type, builder, retain=False):
+    """
+    Publishes a topic payload once the current transaction is committed.
+
+    The payload is built by calling the builder inside the commit hook, so subscribers never see
+    data of a transaction that was rolled back. Several calls for the same topic in one
+    transaction publish once. Nothing is published if the builder returns None.
+
+    Args:
+        topic (str): Name of the topic.
+        message_type (str): Name of the consumer handler the message is dispatched to.
+        builder (callable): Function without arguments returning the payload.
+        retain (bool): Flag indicating whether the payload is kept as the snapshot of the topic.
+
+    Returns:
+        None
+    """
+    def publish_built():
+        payload = builder()
+        if payload is not None:
+            publish(topic, message_type, payload, retain)
+
+    on_commit_once(topic, publish_built)
+
+
+def latest(topic):
+    """
+    Retrieves the snapshot kept for a retained topic.
+
+    Args:
+        topic (str): Name of the topic.
+
+    Returns:
+        tuple: (version, JSON encoded payload), or (0, None) if nothing was retained yet or the
+            retained payload expired.
+    """
+    return _retained(get_redis().hgetall(_latest_key(topic)))
+
+
+def expire_at_boundary(topic, boundary, refresh):
+    """
+    Makes the retained payload of a topic expire when it changes with time.
+
+    Every retained publish of the topic stores the next boundary returned by `boundary` along with
+    the payload: from that time on, `latest` and `alatest` treat the payload as missing so readers
+    rebuild it, and `refresh` is called to schedule the recompute and push at that exact time.
+
+    Args:
+        topic (str): Name of the retained topic.
+        boundary (callable): Function without arguments returning the next time the payload changes
+            without any write, or None if it doesn't.
+        refresh (callable): Function of the topic and the boundary scheduling the refresh.
+
+    Returns:
+        None
+    """
+    _boundaries[topic] = (boundary, refresh)
+
+
+def move_boundary(topic):
+    """
+    Updates the boundary of a retained topic after a write changed it without changing the payload,
+    e.g. a tournament created to start before the current boundary.
+
+    Args:
+        topic (str): Name of the topic registered with `expire_at_boundary`.
+
+    Returns:
+        None
+    """
+    boundary, refresh = _boundaries[topic]
+    expires = boundary()
+    client = get_redis()
+    if not client.hexists(_latest_key(topic), 'version'):
+        # Nothing retained, the next publish stores the boundary
+        return
+    if expires is None:
+        client.hdel(_latest_key(topic), 'expires')
+        return
+    client.hset(_latest_key(topic), 'expires', expires.timestamp())
+    refresh(topic, expires)
+
+
+def snapshot(topic, message_type, builder):
+    """
+    Retrieves the snapshot of a retained topic, publishing a freshly built one if none is kept.
+
+    Args:
+        topic (str): Name of the topic.
+        message_type (str): Name of the consumer handler the message is dispatched to.
+        builder (callable): Function without arguments returning the payload.
+
+    Returns:
+        tuple: (version, JSON encoded payload) of the snapshot.
+    """
+    version, text = latest(topic)
+    if text is None:
+        payload = builder()
+        version = publish(topic, message_type, payload, retain=True)
+        text = json.dumps(payload, ensure_ascii=False)
+    return version, text
+
+
+async def alatest(topic):
+    """
+    Retrieves the snapshot kept for a retained topic from asynchronous code.
+
+    Args:
+        topic (str): Name of the topic.
+
+    Returns:
+        tuple: (version, JSON encoded payload), or (0, None) if nothing was retained yet or the
+            retained payload expired.
+    """
+    return _retained(await get_async_redis().hgetall(_latest_key(topic)))
+
+
+async def current_version(topic):
+    """
+    Retrieves the last version published to a topic.
+
+    Args:
+        topic (str): Name of the topic.
+
+    Returns:
+        int: The last version, 0 if nothing was published yet.
+    """
+    version = await get_async_redis().get(_version_key(topic))
+    return int(version) if version else 0
+
+
+async def _load(topic, version, entry):
+    # Read a payload from the replay log of the topic and keep it in the process cache
+    entries = await get_async_redis().xrange(_log_key(topic), min=entry, max=entry)
+    if not entries:
+        return None
+    text = entries[0][1]['payload']
+    _remember(topic, version, text)
+    return text
+
+
+async def fetch(topic, version, entry):
+    """
+    Retrieves the encoded payload of a published version.
+
+    The payload is read from Redis at most once per process: later calls are served from the
+    process cache and concurrent calls for the same version wait for the same read.
+
+    Args:
+        topic (str): Name of the topic.
+        version (int): Version of the payload.
+        entry (str): ID of the replay log entry holding the payload.
+
+    Returns:
+        str or None: JSON encoded payload, or None if the entry already left the replay log.
+    """
+    text = _recall(topic, version)
+    if text is not None:
+        return text
+    key = (topic, version)
+    future = _pending_fetches.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_load(topic, version, entry))
+        _pending_fetches[key] = future
+        future.add_done_callback(lambda _: _pending_fetches.pop(key, None))
+    # Shield the shared read, so a consumer closing meanwhile doesn't cancel it for the others
+    return await asyncio.shield(future)
+
+
+async def replay(topic, since):
+    """
+    Retrieves the events a client missed since the given version.
+
+    Args:
+        topic (str): Name of the topic.
+        since (int): Last version received by the client.
+
+    Returns:
+        list or None: List of (version, payload text) tuples newer than `since`, in version order,
+            or None if the replay log no longer holds them and a snapshot has to be sent instead.
+    """
+    client = get_async_redis()
+    last_version = await current_version(topic)
+    if since == last_version:
+        return []
+    if since > last_version:
+        # The client comes from another history (e.g. the counter was reset)
+        return None
+    # Entries older than the log lifetime are ignored even if the stream still holds them
+    oldest = int(time.time() * 1000) - settings.REPLAY_LOG_TTL * 1000
+    entries = await client.xrange(_log_key(topic), min=oldest)
+    events = sorted((int(fields['version']), fields['payload']) for _, fields in entries)
+    if not events or events[0][0] > since + 1:
+        return None
+    return [event for event in events if event[0] > since]
@@ -1,45 +1,524 @@
 from channels.consumer import AsyncConsumer
+from channels.db import database_sync_to_async
 from channels.exceptions import StopConsumer
-from rest_framework.authtoken.models import Token
-from asgiref.sync import sync_to_async, async_to_sync
 import asyncio
+import collections
 import json
-import environ
-import os
-import datetime
-import uuid
+import time
+from urllib.parse import parse_qs
 
 # Django imports
 from django.conf import settings
-from django.db.models.signals import post_save
-from django.contrib.auth.models import User
-from channels.layers import get_channel_layer
-from django.db.models import Q
-from django.utils import timezone
-from django.core.exceptions import ValidationError, FieldDoesNotExist
+from django.core.exceptions import ValidationError, FieldDoesNotExist, ObjectDoesNotExist
 
 # Importing models, serializers, and utilities
-from main.models import Tournament, Match, Player, Manager, Season, Map, Team, GroupStage
-from main.serializers import MatchesSerializer, TeamsSerializer, PlayerToTournament, MapSerializer
-from main.utils import get_season_data
+from main.models import Tournament
+from main.payloads import (match_list, match_detail, manager_feed, admin_tournaments, admin_counts, group_standings,
+                           info_snapshot, TournamentWindow)
+from main import auth, broadcast, metrics, services, timers, topics
 
-# Load environment variables
-env = environ.Env()
-environ.Env.read_env(os.path.join(settings.BASE_DIR, '.env'))
 
+# Function to build the websocket message carrying an encoded frame
+def frame_message(frame):
+    """
+    Builds the websocket send message of a frame.
+
+    Args:
+        frame (str or bytes): Text frame or binary frame.
+
+    Returns:
+        dict: Message for AsyncConsumer.send.
+    """
+    if isinstance(frame, bytes):
+        return {'type': 'websocket.send', 'bytes': frame}
+    return {'type': 'websocket.send', 'text': frame}
+
+
+class Subscription:
+    """
+    Subscription of a connection to a versioned topic.
+
+    Clients that send a `version` key in their subscribe message (null on the first connection)
+    receive frames wrapped as {"version": ..., "data": ...}. When they reconnect with the last
+    version they received, they only get the events they missed, or a snapshot if the replay log
+    no longer holds them. Clients without the key receive bare payloads. On connections
+    multiplexing topics, frames are always wrapped as {"topic": ..., "version": ..., "data": ...}.
+
+    Clients may also send `encoding` ('msgpack') and `compression` ('deflate') keys to receive
+    binary frames instead of JSON text.
+
+    Versions go through a bounded send queue written by a separate task, so a slow client doesn't
+    hold up the messages of the channel layer. The task stops sending while the connection has more
+    unacknowledged bytes than its send window, see TimersMixin, so the queue fills up for clients
+    that don't keep up instead of the buffer of the server. Every version carries the full payload,
+    so when the queue is full the pending versions are dropped for the latest one. A client that
+    acknowledges nothing for settings.WEBSOCKET_MAX_LAG seconds while versions wait is
+    disconnected.
+
+    Attributes:
+        consumer (AsyncConsumer): The consumer of the connection.
+        topic (str): Name of the subscribed topic.
+        versioned (bool): Flag indicating whether frames are wrapped with their version.
+        labelled (bool): Flag indicating whether frames are wrapped with the topic name.
+        topic_version (int): Last version sent to the client.
+        queued_version (int): Last version added to the send queue.
+        snapshot_builder (callable): Function building the full payload of the topic.
+        retained_type (str): Message type of topics whose latest payload is kept in Redis,
+            None for topics whose snapshots are built on demand.
+        encoding (str): Frame encoding negotiated on subscribe, 'json' or 'msgpack'.
+        compression (str): Frame compression negotiated on subscribe, 'deflate' or None.
+        outbox (collections.deque): Send queue of (version, entry, text, shared, queued at) items.
+        writer (asyncio.Task): Task sending the queued versions.
+        window: Window of the topic viewed by the client, see payloads.TournamentWindow, None
+            for the whole payload.
+        window_text (str): Last slice sent to the client, versions leaving it unchanged are skipped.
+    """
+    def __init__(self, consumer, topic, data, snapshot_builder, retained_type=None, labelled=False, window=None):
+        self.consumer = consumer
+        self.topic = topic
+        self.snapshot_builder = snapshot_builder
+        self.retained_type = retained_type
+        self.labelled = labelled
+        self.versioned = labelled or 'version' in data
+        self.encoding, self.compression = broadcast.negotiate(
+            data.get('encoding'), data.get('compression'))
+        self.topic_version = -1
+        self.queued_version = -1
+        self.outbox = collections.deque()
+        self.writer = None
+        self.window = window
+        self.window_text = None
+
+    async def start(self, since):
+        """
+        Brings the client up to date.
+
+        Args:
+            since (int): Last version received by the client, None for a new client.
+
+        Returns:
+            None
+        """
+        events = None
+        if isinstance(since, int):
+            events = await broadcast.replay(self.topic, since)
+        if events is None:
+            # The client is new or missed more than the replay log holds, send a snapshot
+            snapshot = await self.load_snapshot()
+            if snapshot is not None:
+                self.enqueue(*snapshot)
+        else:
+            # Send only the events the client missed
+            self.topic_version = self.queued_version = since
+            for version, text in events:
+                self.enqueue(version, text, True)
+
+    async def load_snapshot(self):
+        """
+        Loads the full payload of the topic at its current version.
+
+        Returns:
+            tuple or None: (version, text, shared) where shared tells whether the text is the one
+                published under this version, or None if the topic has no payload.
+        """
+        if self.retained_type is not None:
+            # Retained topics are read from Redis, the payload is only built if nothing is kept yet
+            version, text = await broadcast.alatest(self.topic)
+            if text is None:
+                version, text = await database_sync_to_async(broadcast.snapshot)(
+                    self.topic, self.retained_type, self.snapshot_builder)
+            return version, text, True
+        version = await broadcast.current_version(self.topic)
+        payload = await database_sync_to_async(self.snapshot_builder)()
+        if payload is None:
+            return None
+        # The snapshot may be newer than the version published, so its frame is not shared
+        return version, json.dumps(payload, ensure_ascii=False), False
+
+    def enqueue(self, version, text, shared, entry=None):
+        """
+        Queues a version of the topic for the client.
+
+        Args:
+            version (int): Version of the payload.
+            text (str): JSON encoded payload, None to fetch it from the replay log when sent.
+            shared (bool): Flag indicating whether the text is the one published under this
+                version, so its frame can be shared with the other subscribers of the process.
+            entry (str): Replay log entry of the version, for payloads fetched when sent.
+
+        Returns:
+            None
+        """
+        # Skip versions the client already has or will get
+        if version <= self.queued_version:
+            return
+        self.queued_version = version
+        if len(self.outbox) >= settings.WEBSOCKET_SEND_QUEUE_SIZE:
+            # The queue is full, the new version replaces all pending ones
+            metrics.dropped(self.topic, len(self.outbox))
+            metrics.queued(self.topic, -len(self.outbox))
+            self.outbox.clear()
+        self.outbox.append((version, entry, text, shared, time.monotonic()))
+        metrics.queued(self.topic, 1)
+        if self.writer is None or self.writer.done():
+            self.writer = asyncio.ensure_future(self.write())
+
+    async def write(self):
+        """
+        Sends the queued versions to the client until the queue is empty.
+
+        Returns:
+            None
+        """
+        heap = timers.get_heap()
+        while self.outbox:
+            if self.consumer.window_full():
+                # Versions wait until the client acknowledges the frames it has, it must do so in time
+                heap.schedule((self, 'lag'), settings.WEBSOCKET_MAX_LAG, self.lag_expired)
+                await self.consumer.wait_acknowledged()
+                heap.cancel((self, 'lag'))
+                # The queue may have been collapsed meanwhile
+                continue
+            version, entry, text, shared, queued_at = self.outbox.popleft()
+            metrics.queued(self.topic, -1)
+            if version <= self.topic_version:
+                metrics.dropped(self.topic, 1)
+                continue
+            if text is None:
+                text = await broadcast.fetch(self.topic, version, entry)
+                if text is None:
+                    # The version left the replay log before it was read, send the whole payload
+                    snapshot = await self.load_snapshot()
+                    if snapshot is None:
+                        metrics.dropped(self.topic, 1)
+                        continue
+                    version, text, shared = snapshot
+            self.topic_version = version
+            if self.window is not None:
+                text = broadcast.windowed_text(self.topic, version, text, self.window, shared)
+                if text == self.window_text:
+                    # The version only changed tournaments outside the window
+                    continue
+                self.window_text = text
+                shared = False
+            if shared:
+                frame = broadcast.shared_frame(
+                    self.topic, version, text, self.encoding, self.compression, self.versioned, self.labelled)
+            else:
+                frame = broadcast.encode_frame(
+                    text, version, self.encoding, self.compression, self.versioned,
+                    self.topic if self.labelled else None)
+            await self.consumer.send_frame(frame)
+            metrics.sent(self.topic, time.monotonic() - queued_at)
+
+    async def set_window(self, window):
+        """
+        Changes the window viewed by the client and sends the slice of the current version.
+
+        Args:
+            window: The new window.
+
+        Returns:
+            None
+        """
+        self.window = window
+        self.window_text = None
+        snapshot = await self.load_snapshot()
+        if snapshot is not None:
+            # The current version may already be sent, it is sent again through the new window
+            version = snapshot[0]
+            self.topic_version = min(self.topic_version, version - 1)
+            self.queued_version = min(self.queued_version, version - 1)
+            self.enqueue(*snapshot)
+
+    async def lag_expired(self):
+        # The client acknowledged nothing while versions were waiting, it is disconnected
+        metrics.disconnected(self.topic)
+        self.stop()
+        await self.consumer.close_connection()
+
+    def stop(self):
+        # Stop sending and forget the pending versions
+        timers.get_heap().cancel((self, 'lag'))
+        if self.writer is not None:
+            self.writer.cancel()
+        if self.outbox:
+            metrics.dropped(self.topic, len(self.outbox))
+            metrics.queued(self.topic, -len(self.outbox))
+            self.outbox.clear()
+
+
+class TopicMixin:
+    """
+    Mixin for consumers subscribed to versioned topics, see Subscription.
 
-class MatchConsumer(AsyncConsumer):
+    Attributes:
+        subscriptions (dict): Subscriptions of the connection by topic name.
+        retained_type (str): Message type of the topic if its latest payload is kept in Redis.
+        multiplexed (bool): Flag indicating whether the connection carries several topics, so
+            frames are labelled with their topic.
+    """
+    # Topic groups are broadcast over the sharded pub/sub layer
+    channel_layer_alias = broadcast.TOPICS_LAYER
+    subscriptions = None
+    retained_type = None
+    multiplexed = False
+
+    async def subscribe_topic(self, topic, data, snapshot_builder, retained_type=None, window=None, labelled=None):
+        """
+        Subscribes the consumer to a topic and brings the client up to date.
+
+        Args:
+            topic (str): Name of the topic.
+            data (dict): Subscribe message received from the client.
+            snapshot_builder (callable): Function without arguments building the full payload.
+            retained_type (str): Message type of the topic if it is retained, defaults to the
+                retained_type attribute of the consumer.
+            window: Window of the topic viewed by the client, None for the whole payload.
+            labelled (bool): Flag indicating whether frames are labelled with the topic, defaults
+                to the multiplexed attribute of the consumer.
+
+        Returns:
+            None
+        """
+        if self.subscriptions is None:
+            self.subscriptions = {}
+        if topic in self.subscriptions:
+            return
+        # Join the group first, so events published meanwhile are not lost
+        await self.channel_layer.group_add(topic, self.channel_name)
+        subscription = self.subscriptions[topic] = Subscription(
+            self, topic, data, snapshot_builder, retained_type or self.retained_type,
+            self.multiplexed if labelled is None else labelled, window)
+        await subscription.start(data.get('version'))
+
+    async def forward_topic(self, event):
+        """
+        Queues a version published to a topic, given the reference received from the channel layer.
+
+        The payload is only fetched when the version is sent, so versions dropped from a full queue
+        are never read.
+
+        Args:
+            event (dict): Channel layer message with 'topic', 'version' and 'entry' keys.
+
+        Returns:
+            None
+        """
+        subscription = (self.subscriptions or {}).get(event['topic'])
+        if subscription is not None:
+            subscription.enqueue(event['version'], None, True, event['entry'])
+
+    async def unsubscribe_topic(self, topic=None):
+        """
+        Removes the consumer from the group of a topic and stops sending it to the client.
+
+        Args:
+            topic (str): Name of the topic, None for all topics.
+
+        Returns:
+            None
+        """
+        if not self.subscriptions:
+            return
+        topics = list(self.subscriptions) if topic is None else [topic]
+        for name in topics:
+            subscription = self.subscriptions.pop(name, None)
+            if subscription is not None:
+                subscription.stop()
+                await self.channel_layer.group_discard(name, self.channel_name)
+
+
+class MatchDetailMixin:
+    """
+    Mixin for consumers of feeds carrying only tournament summaries, answering requests for the
+    matches of a tournament with {"action": "match_detail", "id": ..., "matches": [...]}.
+    """
+    async def send_match_detail(self, tournament_id):
+        """
+        Sends the cached match list of a tournament, `matches` is null if it doesn't exist.
+
+        Args:
+            tournament_id (int): ID of the tournament.
+
+        Returns:
+            None
+        """
+        text = None
+        if isinstance(tournament_id, int) and not isinstance(tournament_id, bool):
+            text = await database_sync_to_async(match_detail)(tournament_id)
+        # The cached list is already encoded, it is embedded without decoding it
+        await self.send({
+            'type': 'websocket.send',
+            'text': '{"action": "match_detail", "id": %s, "matches": %s}' % (
+                json.dumps(tournament_id), text if text is not None else 'null')
+        })
+
+
+class TimersMixin:
+    """
+    Mixin for consumers whose deadlines are kept in the deadline heap shared by the process.
+
+    - Authentication: the connection is closed if the first message isn't received within
+      settings.WEBSOCKET_AUTH_TIMEOUT seconds.
+    - Idle: the connection is closed if nothing is received for settings.WEBSOCKET_IDLE_TIMEOUT
+      seconds.
+    - Heartbeat: a `ping` text frame is sent every settings.WEBSOCKET_HEARTBEAT_INTERVAL seconds,
+      clients answer with a `pong` text frame, which only refreshes the idle deadline.
+    - Send window: a pong acknowledges every frame sent before its ping, since the client handles
+      frames in order. Topic frames stop once settings.WEBSOCKET_SEND_WINDOW bytes are sent and
+      not acknowledged, an extra ping asking the client to acknowledge them.
+
+    Idle reaping and heartbeats are disabled when their setting is 0, and the send window is only
+    enforced with heartbeats, clients answering pings being part of their protocol.
+
+    Attributes:
+        bytes_sent (int): Bytes of topic frames sent to the client.
+        bytes_acked (int): Bytes of topic frames the client acknowledged.
+        unanswered (collections.deque): Bytes sent before each ping the client didn't answer yet.
+        acknowledged (asyncio.Event): Event set when the client acknowledges frames.
+    """
+    def start_timers(self, authenticate=True):
+        """
+        Schedules the deadlines of a new connection.
+
+        Args:
+            authenticate (bool): Flag indicating whether the connection must authenticate.
+
+        Returns:
+            None
+        """
+        self.bytes_sent = self.bytes_acked = 0
+        self.unanswered = collections.deque()
+        self.acknowledged = asyncio.Event()
+        heap = timers.get_heap()
+        if authenticate:
+            heap.schedule((self, 'auth'), settings.WEBSOCKET_AUTH_TIMEOUT, self.auth_expired)
+        if settings.WEBSOCKET_IDLE_TIMEOUT:
+            heap.schedule((self, 'idle'), settings.WEBSOCKET_IDLE_TIMEOUT, self.close_connection)
+        if settings.WEBSOCKET_HEARTBEAT_INTERVAL:
+            heap.schedule((self, 'heartbeat'), settings.WEBSOCKET_HEARTBEAT_INTERVAL, self.send_heartbeat)
+
+    def stop_timers(self):
+        # Remove the deadlines of a closed connection
+        timers.get_heap().cancel((self, 'auth'), (self, 'idle'), (self, 'heartbeat'))
+
+    async def dispatch(self, message):
+        if message['type'] == 'websocket.receive':
+            if settings.WEBSOCKET_IDLE_TIMEOUT:
+                # Any message shows the client is alive, postponing only updates the heap entry
+                timers.get_heap().schedule((self, 'idle'), settings.WEBSOCKET_IDLE_TIMEOUT, self.close_connection)
+            if message.get('text') == 'pong':
+                if self.unanswered:
+                    # Pongs answer the pings in order
+                    self.bytes_acked = self.unanswered.popleft()
+                    self.acknowledged.set()
+                return
+        await super().dispatch(message)
+
+    def window_full(self):
+        """
+        Tells whether topic frames must wait for the client to acknowledge the ones it has.
+
+        Returns:
+            bool: True if the unacknowledged bytes reach the send window.
+        """
+        window = settings.WEBSOCKET_SEND_WINDOW
+        if not window or not settings.WEBSOCKET_HEARTBEAT_INTERVAL:
+            return False
+        return self.bytes_sent - self.bytes_acked >= window
+
+    async def wait_acknowledged(self):
+        """
+        Waits for the client to acknowledge frames, pinging it if the last frames aren't pinged yet.
+
+        Returns:
+            None
+        """
+        if not self.unanswered or self.unanswered[-1] < self.bytes_sent:
+            await self.send_ping()
+        self.acknowledged.clear()
+        await self.acknowledged.wait()
+
+    async def send_frame(self, frame):
+        # Topic frames count against the send window
+        await self.send(frame_message(frame))
+        self.bytes_sent += len(frame)
+
+    async def auth_expired(self):
+        # Close connections that didn't send their first message in time
+        if not self.is_first_message_received:
+            await self.close_connection()
+
+    async def close_connection(self):
+        # The client answers with a disconnect, which stops the consumer
+        self.stop_timers()
+        await self.send({
+            'type': 'websocket.close',
+        })
+
+    async def send_ping(self):
+        # The pong will acknowledge the frames sent so far
+        self.unanswered.append(self.bytes_sent)
+        await self.send({
+            'type': 'websocket.send',
+            'text': 'ping'
+        })
+
+    async def send_heartbeat(self):
+        await self.send_ping()
+        timers.get_heap().schedule((self, 'heartbeat'), settings.WEBSOCKET_HEARTBEAT_INTERVAL, self.send_heartbeat)
+
+
+class BatchMixin:
+    """
+    Mixin for consumers accepting a `batch` action.
+
+    A batch message carries an `operations` list, each operation having the shape of a single
+    action message, and an optional `id` echoed in the acknowledgement. The batch is applied in one
+    transaction and acknowledged once with {"action": "batch", "id": ..., "applied": n}, or with
+    {"action": "batch", "id": ..., "failed": index, "error": ...} after it was rolled back.
+    """
+    async def apply_batch(self, data, service, *args):
+        """
+        Applies the operations of a batch message with a service and acknowledges it.
+
+        Args:
+            data (dict): The batch message.
+            service (callable): Service applying the operations, called with args and the operations.
+            *args: Leading arguments of the service.
+
+        Returns:
+            None
+        """
+        ack = {'action': 'batch', 'id': data.get('id')}
+        try:
+            ack['applied'] = await database_sync_to_async(service)(*args, data.get('operations'))
+        except services.BatchError as error:
+            ack['failed'] = error.index
+            if isinstance(error.error, FieldDoesNotExist):
+                ack['error'] = 'Field not found'
+            elif isinstance(error.error, ObjectDoesNotExist):
+                ack['error'] = 'Not found'
+            else:
+                ack['error'] = 'Incorrect Value'
+        await self.send({
+            'type': 'websocket.send',
+            'text': json.dumps(ack)
+        })
+
+
+class MatchConsumer(TimersMixin, BatchMixin, TopicMixin, AsyncConsumer):
     """
     WebSocket consumer for handling match-related operations.
 
     This consumer manages WebSocket connections for handling match-related actions such as subscribing to matches,
-    updating match details, creating new matches, and deleting matches.
+    updating match details, creating new matches, and deleting matches, one by one or in batches.
 
     Attributes:
         is_first_message_received (bool): Flag to track if the first message is received.
-        timeout_task (asyncio.Task): Task for handling timeout.
         group_name (str): Name of the group associated with the WebSocket connection.
-        user (User): User associated with the WebSocket connection.
+        user_id (int): ID of the user associated with the WebSocket connection.
         is_admin_user (bool): Flag to indicate if the user is an admin user.
     """
     async def websocket_connect(self, event):
@@ -60,10 +539,10 @@ class MatchConsumer(AsyncConsumer):
         # Initialize flags and variables
         # Flag to track if the first message is received
         self.is_first_message_received = False
-        self.timeout_task = asyncio.create_task(
-            self.timeout_handler())  # Task for handling timeout
+        # Close the connection if it isn't authenticated in time
+        self.start_timers()
         self.group_name = None  # Name of the group associated with the WebSocket connection
-        self.user = None  # User associated with the WebSocket connection
+        self.user_id = None  # ID of the user associated with the WebSocket connection
         self.is_admin_user = False  # Flag to indicate if the user is an admin user
 
     async def websocket_receive(self, event):
@@ -93,39 +572,17 @@ class MatchConsumer(AsyncConsumer):
                 })
                 raise StopConsumer()
             try:
-                # Extract token and action from the received data
-                token = data['token']
+                # Extract token and action from the received data, the token may also come with the handshake
+                token = data.get('token')
                 action = data['action']
-                if action == 'subscribe':
-                    # Extract group name if provided
-                    self.group_name = data.get('group')
-                    try:
-                        # Query matches for the specified tournament asynchronously
-                        match_objects = await sync_to_async(Match.objects.filter)(tournament=self.group_name)
-                        # Serialize match objects
-                        matches_data = await sync_to_async(lambda: MatchesSerializer(match_objects, many=True).data)()
-                        # Send serialized matches data through websocket
-                        await self.send({
-                            'type': 'websocket.send',
-                            'text': json.dumps(matches_data)
-                        })
-                    except Match.DoesNotExist:
-                        # If no matches found for the given tournament, close websocket connection and stop the consumer
-                        await self.send({
-                            'type': 'websocket.close',
-                        })
-                        raise StopConsumer()
-                    if self.group_name:
-                        # Add the consumer to a group corresponding to the tournament
-                        await self.channel_layer.group_add(
-                            f'match_{self.group_name}', self.channel_name
-                        )
-                else:
+                if action != 'subscribe':
                     # If action is not 'subscribe', close the websocket connection and stop the consumer
                     await self.send({
                         'type': 'websocket.close',
                     })
                     raise StopConsumer()
+                # Extract group name if provided
+                self.group_name = data.get('group')
             except json.JSONDecodeError:
                 # If any JSON decoding error occurs, close the websocket connection and stop the consumer
                 await self.send({
@@ -138,21 +595,28 @@ class MatchConsumer(AsyncConsumer):
                     'type': 'websocket.close',
                 })
                 raise StopConsumer()
-            try:
-                # Retrieve user token object asynchronously
-                token_obj = await sync_to_async(Token.objects.get)(key=token)
-            except Token.DoesNotExist:
+            # Resolve the identity of the user from the token cache
+            identity = await auth.authenticate(self.scope, token)
+            if identity is None:
                 # If the token does not exist, close the websocket connection and stop the consumer
                 await self.send({
                     'type': 'websocket.close',
                 })
                 raise StopConsumer()
-            # Retrieve user associated with the token
-            self.user = await sync_to_async(lambda: token_obj.user)()
+            self.user_id = identity.user_id
             # Check if the user is an admin
-            self.is_admin_user = await sync_to_async(lambda: self.user.is_staff)()
-            # Connect a signal handler for match updates
-            post_save.connect(self.match_update_handler, sender=Match)
+            self.is_admin_user = identity.is_staff
+            if self.group_name:
+                # Subscribe to the match list of the tournament, replaying missed versions if possible
+                group_name = self.group_name
+                await self.subscribe_topic(
+                    f'match_{group_name}', data, lambda: match_list(group_name), 'new_match_list')
+            else:
+                # Without a tournament there are no matches to follow
+                await self.send({
+                    'type': 'websocket.send',
+                    'text': json.dumps([])
+                })
         else:
             try:
                 # Try to parse the incoming message as JSON
@@ -167,75 +631,46 @@ class MatchConsumer(AsyncConsumer):
                 # Extract action from the received data
                 action = data['action']
                 if action == 'update':
-                    try:
-                        # Extract required fields for updating a match
-                        updated_field = data['updated_field']
-                    except Match.DoesNotExist:
-                        # If match does not exist, send an empty response
-                        await self.send({
-                            'type': 'websocket.send',
-                            'text': json.dumps({})
-                        })
-                    # Extract other fields for match update
+                    # Extract the fields for the match update
+                    updated_field = data['updated_field']
                     updated_column = data['updated_column']
                     updated_value = data['updated_value']
-                    if updated_column == 'winner':
-                        # If the updated column is 'winner', update the score
-                        await self.update_score(updated_value, updated_field)
-                    # Update match with the provided data
-                    await self.match_patch(updated_field, updated_column, updated_value)
+                    # Update the match and the counters depending on it in one unit of work
+                    await database_sync_to_async(services.patch_match)(
+                        updated_field, self.group_name, updated_column, updated_value)
                 elif action == 'create':
                     # Create a new match
-                    await self.match_create(event)
+                    await database_sync_to_async(services.create_match)(self.group_name, self.user_id)
                 elif action == 'delete':
-                    # Delete a match
-                    match_pk = data['match_pk']
-                    await self.match_delete(match_pk)
+                    # Only admins can delete matches
+                    if self.is_admin_user:
+                        await database_sync_to_async(services.delete_match)(data['match_pk'], self.group_name)
+                elif action == 'batch':
+                    # Apply several actions in one transaction, with one acknowledgement
+                    await self.apply_batch(
+                        data, services.apply_match_batch, self.group_name, self.user_id, self.is_admin_user)
                 else:
                     # No action specified, do nothing
                     pass
-            except json.JSONDecodeError:
-                # If any JSON decoding error occurs, send an empty response
+            except ObjectDoesNotExist:
+                # If the match or a related object does not exist, send an empty response
                 await self.send({
                     'type': 'websocket.send',
                     'text': json.dumps({})
                 })
-
-    async def timeout_handler(self):
-        """
-        Handle timeout for WebSocket authentication.
-
-        This function is responsible for handling the timeout period for WebSocket authentication.
-        If the first message is not received within the specified duration, it closes the WebSocket connection
-        and halts further processing by raising a StopConsumer exception.
-
-        Args:
-            self: The WebSocketConsumer instance.
-
-        Returns:
-            None
-        """
-        try:
-            # Wait for the specified duration for the first message to be received
-            await asyncio.sleep(int(env('WEBSOCKET_AUTH_TIMEOUT')))
-
-            # If the first message has not been received, close the WebSocket connection
-            # and raise StopConsumer to halt further processing
-            if not self.is_first_message_received:
+            except (ValidationError, ValueError):
+                # If the value doesn't fit the column, e.g. a winner who isn't a player of the match
                 await self.send({
-                    'type': 'websocket.close',
+                    'type': 'websocket.send',
+                    'text': 'Incorrect Value'
                 })
-                raise StopConsumer()
-        except asyncio.CancelledError:
-            # Handle cancellation if the task is cancelled before the timeout
-            pass
 
     async def websocket_disconnect(self, event):
         """
         Handle WebSocket disconnection.
 
         This function is called when a WebSocket disconnection event occurs.
-        It cancels the timeout task if it exists, removes the channel from the group,
+        It removes the deadlines of the connection, removes the channel from the group,
         sends a close message to the client, and stops the consumer.
 
         Args:
@@ -245,16 +680,11 @@ class MatchConsumer(AsyncConsumer):
         Returns:
             None
         """
-        # Cancel the timeout task if it exists
-        if self.timeout_task:
-            self.timeout_task.cancel()
+        # Remove the deadlines of the connection
+        self.stop_timers()
 
-        # Remove the channel from the group
-        await self.channel_layer.group_discard(
-            # Group name corresponding to the WebSocket connection
-            f'match_{self.group_name}',
-            self.channel_name  # Channel name to remove from the group
-        )
+        # Remove the channel from the group of the tournament
+        await self.unsubscribe_topic()
 
         # Send a close message to the client
         await self.send({
@@ -264,196 +694,6 @@ class MatchConsumer(AsyncConsumer):
         # Stop the consumer, indicating that it should no longer handle incoming messages
         raise StopConsumer()  # Raise StopConsumer to stop the consumer loop
 
-    async def match_patch(self, field, column, data):
-        """
-        Patch a match object with new data asynchronously.
-
-        This function retrieves a Match object asynchronously and updates it based on the provided field, column, and data.
-        Depending on the column, it may update winner, player_one, player_two, or any other attribute of the Match object.
-
-        Args:
-            self: The instance of the class calling the method.
-            field: The ID of the Match object to be updated.
-            column: The column/attribute of the Match object to be updated.
-            data: The new data to be assigned to the specified column.
-
-        Returns:
-            None
-        """
-        # Retrieve the Match object asynchronously
-        obj = await sync_to_async(Match.objects.get)(id=field)
-
-        # Retrieve winner information asynchronously
-        match_winner = await sync_to_async(lambda: obj.winner)()
-
-        # Retrieve old player one and player two asynchronously
-        old_player_one = await sync_to_async(lambda: obj.player_one)()
-        old_player_two = await sync_to_async(lambda: obj.player_two)()
-
-        # Update logic based on the provided column
-        if column == 'winner':
-            # Retrieve the winner object asynchronously
-            winner = await sync_to_async(Player.objects.get)(pk=data)
-
-            # Update winner and match_winner wins count if necessary
-            if (match_winner is not None and match_winner != winner):
-                match_winner.wins -= 1
-                await sync_to_async(match_winner.save)()
-            if (winner is not None and winner != match_winner):
-                winner.wins += 1
-                await sync_to_async(winner.save)()
-
-            # Update the match object with the new winner
-            obj.winner = winner
-        elif column == 'player_one':
-            # Retrieve the player object asynchronously
-            player = await sync_to_async(Player.objects.get)(pk=data)
-
-            # Update total_games count for old_player_one and player if necessary
-            if (old_player_one is not None and old_player_one != player):
-                old_player_one.total_games -= 1
-                await sync_to_async(old_player_one.save)()
-            if (player is not None and player != old_player_one):
-                player.total_games += 1
-                await sync_to_async(player.save)()
-
-            # Update winner of the match if old_player_one is the match_winner
-            if match_winner == old_player_one and old_player_one is not None:
-                obj.winner = player
-
-            # Update the match object with the new player_one
-            obj.player_one = player
-        elif column == 'player_two':
-            # Retrieve the player object asynchronously
-            player = await sync_to_async(Player.objects.get)(pk=data)
-
-            # Update total_games count for old_player_two and player if necessary
-            if (old_player_two is not None and old_player_two != player):
-                old_player_two.total_games -= 1
-                await sync_to_async(old_player_two.save)()
-            if (player is not None and player != old_player_two):
-                player.total_games += 1
-                await sync_to_async(player.save)()
-
-            # Update winner of the match if old_player_two is the match_winner
-            if match_winner == old_player_two and old_player_two is not None:
-                obj.winner = player
-
-            # Update the match object with the new player_two
-            obj.player_two = player
-        elif column == 'map':
-            # Update the match object with the new map
-            map = await sync_to_async(Map.objects.get)(pk=data)
-            obj.map = map
-        else:
-            # For any other column, simply update the match object attribute
-            setattr(obj, column, data)
-
-        # Save the updated match object asynchronously
-        await sync_to_async(obj.save)()
-
-    async def match_create(self, event):
-        """
-        Create a new match asynchronously.
-
-        This function creates a new match object for a tournament asynchronously and saves it to the database.
-
-        Args:
-            event: The event containing information about the match creation.
-
-        Returns:
-            None
-        """
-        # Retrieve the tournament object asynchronously
-        tournament = await sync_to_async(Tournament.objects.get)(pk=self.group_name)
-
-        # Create a new match asynchronously
-        await sync_to_async(Match.objects.create)(
-            tournament=tournament,
-            user=self.user,
-        )
-
-    async def match_delete(self, match_pk):
-        """
-        Delete a match asynchronously.
-
-        This function deletes a match object from the database asynchronously. If the user is an admin,
-        it retrieves the match object, deletes it, retrieves all matches for the tournament, and sends
-        a WebSocket message with updated match information.
-
-        Args:
-            match_pk: The primary key of the match to be deleted.
-
-        Returns:
-            None
-        """
-        # Check if the user is an admin
-        if (self.is_admin_user):
-            # Retrieve the match object asynchronously
-            match = await sync_to_async(Match.objects.get)(pk=match_pk)
-
-            # Delete the match asynchronously
-            await sync_to_async(match.delete)()
-
-            # Retrieve all matches for the tournament asynchronously
-            matches = await sync_to_async(Match.objects.filter)(tournament=match.tournament)
-
-            # Send WebSocket message with updated match information
-            await self.send({
-                'type': 'websocket.send',
-                'text': json.dumps(matches)
-            })
-
-    async def update_score(self, winner, field):
-        """
-        Update tournament scores based on match results.
-
-        This function updates the scores of teams participating in a tournament based on the outcome of a match.
-
-        Args:
-            self: The instance of the class.
-            winner (int): The primary key of the winning player.
-            field (int): The primary key of the match.
-
-        Returns:
-            None
-        """
-        # Check if there is a winner
-        if winner:
-            # Retrieve the player object asynchronously
-            player = await sync_to_async(Player.objects.get)(pk=winner)
-
-            # Retrieve the match object asynchronously
-            match = await sync_to_async(Match.objects.get)(pk=field)
-
-            # Retrieve the winner of the match
-            match_winner = await sync_to_async(lambda: match.winner)()
-
-            # Retrieve the team of the player
-            team = await sync_to_async(lambda: player.team)()
-
-            # Retrieve the tournament object asynchronously
-            tournament = await sync_to_async(Tournament.objects.get)(pk=self.group_name)
-
-            # Retrieve the teams participating in the tournament asynchronously
-            team_one = await sync_to_async(lambda: tournament.team_one)()
-            team_two = await sync_to_async(lambda: tournament.team_two)()
-
-            # Update the tournament's team wins based on the winner of the match
-            if team_one == team:
-                tournament.team_one_wins += 1
-                if match_winner is not None:
-                    tournament.team_two_wins -= 1
-            elif team_two == team:
-                tournament.team_two_wins += 1
-                if match_winner is not None:
-                    tournament.team_one_wins -= 1
-            else:
-                pass
-
-            # Save the tournament asynchronously
-            await sync_to_async(tournament.save)()
-
     async def match_update(self, event):
         await self.send({
             'type': 'websocket.send',
@@ -464,46 +704,11 @@ class MatchConsumer(AsyncConsumer):
             })
         })
 
-    @staticmethod
-    def match_update_handler(instance, **kwargs):
-        """
-        Handle match update event and send updated match list to clients.
-
-        This static method handles the match update event and sends the updated match list to clients
-        who are subscribed to the corresponding group.
-
-        Args:
-            instance: The instance of the match being updated.
-            kwargs: Additional keyword arguments.
-
-        Returns:
-            None
-        """
-        channel_layer = get_channel_layer()
-        matches_data = MatchesSerializer(instance).data
-
-        # If the instance is of type Match, retrieve all matches for the associated tournament.
-        if type(instance) == Match:
-            matches = Match.objects.filter(tournament=instance.tournament)
-            matches_data = MatchesSerializer(matches, many=True).data
-
-        # Send the updated match list to the corresponding group.
-        async_to_sync(channel_layer.group_send)(
-            f"match_{instance.tournament.id}",
-            {
-                "type": "new_match_list",
-                "text": matches_data
-            }
-        )
-
     async def new_match_list(self, event):
-        await self.send({
-            'type': 'websocket.send',
-            'text': json.dumps(event['text'])
-        })
+        await self.forward_topic(event)
 
 
-class TournamentStatusConsumer(AsyncConsumer):
+class TournamentStatusConsumer(TimersMixin, MatchDetailMixin, TopicMixin, AsyncConsumer):
     """
     WebSocket consumer for handling tournament status updates.
 
@@ -513,9 +718,9 @@ class TournamentStatusConsumer(AsyncConsumer):
 
     Attributes:
         is_first_message_received (bool): Flag indicating whether the first message has been received.
-        timeout_task (asyncio.Task): Task for handling WebSocket timeout.
         group_name (str): Name of the group associated with the WebSocket connection.
-        user (User): User associated with the WebSocket connection.
+        user_id (int): ID of the user associated with the WebSocket connection.
+        team_id (int): ID of the team managed by the user.
     """
 
     async def websocket_connect(self, event):
@@ -532,9 +737,10 @@ class TournamentStatusConsumer(AsyncConsumer):
             'type': 'websocket.accept'
         })
         self.is_first_message_received = False
-        self.timeout_task = asyncio.create_task(self.timeout_handler())
+        self.start_timers()
         self.group_name = None
-        self.user = None
+        self.user_id = None
+        self.team_id = None
 
     async def websocket_receive(self, event):
         """
@@ -564,14 +770,13 @@ class TournamentStatusConsumer(AsyncConsumer):
                 raise StopConsumer()
 
             try:
-                # Extract token from the data
-                token = data['token']
+                # Extract token from the data, it may also come with the handshake
+                token = data.get('token')
                 # Extract optional group name from the data
                 self.group_name = data.get('group')
-                try:
-                    # Retrieve user associated with the token
-                    token_obj = await sync_to_async(Token.objects.get)(key=token)
-                except Token.DoesNotExist:
+                # Resolve the identity of the user from the token cache
+                identity = await auth.authenticate(self.scope, token)
+                if identity is None:
                     # If token is not valid, close the WebSocket connection
                     await self.send({
                         'type': 'websocket.close',
@@ -581,42 +786,17 @@ class TournamentStatusConsumer(AsyncConsumer):
                 # Extract action from the data
                 action = data['action']
                 if action == 'subscribe':
-                    try:
-                        # Retrieve user and associated manager
-                        user = await sync_to_async(lambda: token_obj.user)()
-                        user_id = await sync_to_async(lambda: user.id)()
-                        manager = await sync_to_async(Manager.objects.get)(user=user)
-                        team = await sync_to_async(lambda: manager.team)()
-                        # Retrieve tournaments associated with the team
-                        tournaments = await sync_to_async(Tournament.objects.filter)(
-                            Q(team_one=team) | Q(team_two=team)
-                        )
-                        if self.group_name:
-                            if self.group_name == user_id:
-                                # Add consumer to manager's group
-                                await self.channel_layer.group_add(
-                                    f'manager_{self.group_name}', self.channel_name
-                                )
-                            else:
-                                # If group name is specified and doesn't match user id, close connection
-                                await self.send({
-                                    'type': 'websocket.close',
-                                })
-                                raise StopConsumer()
-                        # Update tournaments for the manager
-                        await sync_to_async(self.tournament_update_handler)(
-                            manager_id=self.group_name, instance=tournaments
-                        )
-                    except Manager.DoesNotExist:
-                        await self.send({
-                            'type': 'websocket.close',
-                        })
-                        raise StopConsumer()
-                    except Tournament.DoesNotExist:
+                    # Check that the user is a manager
+                    user_id = identity.user_id
+                    if identity.team_id is None or self.group_name != user_id:
+                        # If the user is not a manager or the group doesn't match user id, close connection
                         await self.send({
                             'type': 'websocket.close',
                         })
                         raise StopConsumer()
+                    # Subscribe to the manager's feed, replaying missed versions if possible
+                    await self.subscribe_topic(
+                        f'manager_{user_id}', data, lambda: manager_feed(user_id))
                 else:
                     # If action is not 'subscribe', close the WebSocket connection
                     await self.send({
@@ -630,10 +810,9 @@ class TournamentStatusConsumer(AsyncConsumer):
                 })
                 raise StopConsumer()
 
-            # Set the user associated with the token
-            self.user = await sync_to_async(lambda: token_obj.user)()
-            # Connect the tournament update handler
-            post_save.connect(self.tournament_update_handler, sender=Tournament)
+            # Set the user and the team associated with the token
+            self.user_id = identity.user_id
+            self.team_id = identity.team_id
         else:
             try:
                 # Attempt to parse the JSON data from the message
@@ -650,271 +829,78 @@ class TournamentStatusConsumer(AsyncConsumer):
                 action = data['action']
                 tournament_id = data['id']
                 if action == 'start_now':
-                    # If action is 'start_now', update the start time of the tournament
-                    obj = await sync_to_async(Tournament.objects.get)(pk=tournament_id)
-                    is_tournament_started = await sync_to_async(lambda: obj.match_start_time.replace(tzinfo=timezone.utc) < datetime.datetime.utcnow().replace(tzinfo=timezone.utc))()
-                    if not is_tournament_started:
-                        obj.match_start_time = datetime.datetime.utcnow()
-                        await sync_to_async(obj.save)()
+                    # If action is 'start_now', move the start time of the tournament to now
+                    await database_sync_to_async(services.start_tournament_now)(tournament_id, self.team_id)
                 elif action == 'finish':
-                    # If action is 'finish', handle finishing the tournament
-                    obj = await sync_to_async(Tournament.objects.get)(pk=tournament_id)
-                    obj_inline = await sync_to_async(lambda: obj.inline_number)()
-                    if obj_inline is not None:
-                        paired_number = obj_inline + 1 if obj_inline % 2 == 0 else obj_inline - 1
-                        try:
-                            paired_tournament = await sync_to_async(lambda: Tournament.objects.get(inline_number=paired_number, stage=obj.stage, season=obj.season))()
-                            paired_tournament_winner = await sync_to_async(lambda: paired_tournament.winner)()
-                        except Tournament.DoesNotExist:
-                            paired_tournament_winner = None
-                    else:
-                        paired_tournament_winner = None
-                    asked_team = await sync_to_async(lambda: obj.asked_team)()
-                    manager = await sync_to_async(Manager.objects.get)(user=self.user)
-                    team = await sync_to_async(lambda: manager.team)()
-                    team_one = await sync_to_async(lambda: obj.team_one)()
-                    team_two = await sync_to_async(lambda: obj.team_two)()
-                    team_one_wins = await sync_to_async(lambda: obj.team_one_wins)()
-                    team_two_wins = await sync_to_async(lambda: obj.team_two_wins)()
-                    if obj.ask_for_finished and asked_team != team:
-                        # If tournament is finished, update winner and proceed to next stage if applicable
-                        obj.is_finished = True
-                        obj.ask_for_finished = False
-                        obj.asked_team = None
-                        if team_one_wins > team_two_wins:
-                            obj.winner = team_one
-                        elif team_one_wins < team_two_wins:
-                            obj.winner = team_two
-                        else:
-                            obj.winner = None
-                        if paired_tournament_winner is not None and obj.winner is not None:
-                            # If paired tournament winner and current tournament winner are both available, create next stage tournament
-                            next_stage_tournament = await sync_to_async(lambda: Tournament(
-                                team_one=obj.winner,
-                                team_two=paired_tournament_winner,
-                                season=obj.season,
-                                stage=obj.stage + 1,
-                                inline_number=obj.inline_number // 2,
-                                match_start_time=(
-                                    datetime.datetime.combine(
-                                        datetime.datetime.now() + datetime.timedelta(days=1),
-                                        datetime.time(15, 0)))
-                            ))()
-                            await sync_to_async(next_stage_tournament.save)()
-                            obj.next_stage_tournament = next_stage_tournament
-                            paired_tournament.next_stage_tournament = next_stage_tournament
-                            await sync_to_async(paired_tournament.save)()
-                    else:
-                        # If tournament is not finished, mark it as asking for finish
-                        obj.ask_for_finished = True
-                        obj.asked_team = team
-                    await sync_to_async(obj.save)()
-            except KeyError:
-                # If required keys are missing, close the WebSocket connection
+                    # If action is 'finish', ask to finish the tournament or finish it if the other team asked
+                    await database_sync_to_async(services.finish_tournament)(tournament_id, self.team_id)
+                elif action == 'match_detail':
+                    # The feed only carries summaries, the matches of a tournament are sent on demand
+                    await self.send_match_detail(tournament_id)
+            except Tournament.DoesNotExist:
+                # The tournament doesn't exist or the team of the manager doesn't play in it
                 await self.send({
-                    'type': 'websocket.close',
+                    'type': 'websocket.send',
+                    'text': json.dumps({})
                 })
-                raise StopConsumer()
-
-    async def websocket_disconnect(self, event):
-        """
-        Handle WebSocket disconnection event.
-
-        This method is called when a WebSocket connection is disconnected.
-        It cancels any ongoing timeout task, removes the consumer from
-        the corresponding group, sends a WebSocket close message, and
-        stops the consumer.
-
-        Args:
-            event (dict): The disconnection event.
-
-        Returns:
-            None
-        """
-        if self.timeout_task:
-            self.timeout_task.cancel()
-        await self.channel_layer.group_discard(
-            f'manager_{self.group_name}',
-            self.channel_name
-        )
-        await self.send({
-            'type': 'websocket.close',
-        })
-        raise StopConsumer()
-
-    async def timeout_handler(self):
-        """
-        Handle WebSocket timeout.
-
-        This method handles WebSocket timeout by waiting for a specified
-        duration. If the first message is not received within this duration,
-        it sends a WebSocket close message and stops the consumer.
-
-        Returns:
-            None
-        """
-        try:
-            await asyncio.sleep(int(env('WEBSOCKET_AUTH_TIMEOUT')))
-            if not self.is_first_message_received:
+            except KeyError:
+                # If required keys are missing, close the WebSocket connection
                 await self.send({
                     'type': 'websocket.close',
                 })
                 raise StopConsumer()
-        except asyncio.CancelledError:
-            pass
 
-    def tournament_update_handler(self, instance, **kwargs):
+    async def websocket_disconnect(self, event):
         """
-        Handle tournament update event and send updated tournament list to clients.
+        Handle WebSocket disconnection event.
 
-        This method handles the tournament update event and sends the updated tournament list to clients
-        who are subscribed to the corresponding group.
+        This method is called when a WebSocket connection is disconnected.
+        It removes the deadlines of the connection, removes the consumer from
+        the corresponding group, sends a WebSocket close message, and
+        stops the consumer.
 
         Args:
-            self: The instance of the class.
-            instance: The instance of the tournament being updated.
-            **kwargs: Additional keyword arguments.
+            event (dict): The disconnection event.
 
         Returns:
             None
         """
-
-        # Get the channel layer
-        channel_layer = get_channel_layer()
-
-        # Get the user associated with the group
-        user = User.objects.get(pk=self.group_name)
-
-        # Get the current season that is not finished
-        season = Season.objects.get(is_finished=False)
-
-        # Get the manager associated with the user
-        manager = Manager.objects.get(user=user)
-
-        # Get the team associated with the manager
-        team = manager.team
-
-        # Get tournaments involving the team in the current season
-        tournaments = Tournament.objects.filter(
-            Q(team_one=team) | Q(team_two=team), season=season)
-
-        # If no tournaments found, send empty list to client
-        if tournaments.count() == 0:
-            async_to_sync(channel_layer.group_send)(
-                f'manager_{self.group_name}',
-                {
-                    'type': 'send_tournaments',
-                    'text': json.dumps([])
-                }
-            )
-
-        # Order tournaments by match start time
-        tournaments = tournaments.order_by('match_start_time')
-
-        # Prepare response data to send to clients
-        response_data = []
-        for tournament in tournaments:
-            # Determine opponent team and team number
-            opponent = tournament.team_two if tournament.team_one == team else tournament.team_one
-            team_in_tour_num = 1 if tournament.team_one == team else 2
-
-            # Serialize opponent team data
-            opponent_data = TeamsSerializer(opponent).data
-
-            # Get players of opponent team participating in the tournament
-            opp_players_to_tournament = PlayerToTournament.objects.filter(
-                user=opponent.user, Season=season)
-            opp_players_to_tournament_data = []
-            for player in opp_players_to_tournament:
-                opp_players_to_tournament_data.append({
-                    'id': player.player.id,
-                    'username': player.player.username
-                })
-            opponent_data['players'] = opp_players_to_tournament_data
-
-            # Determine if the team has been asked for finishing the tournament
-            asked_team = True if tournament.asked_team == team else False if tournament.ask_for_finished else None
-
-            # Determine winner if the tournament is finished
-            winner = tournament.winner.id if tournament.winner is not None else None
-
-            # Prepare data for tournaments
-            if not tournament.is_finished:
-                response_data.append({
-                    'id': tournament.id,
-                    'startTime': tournament.match_start_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
-                    'opponent': opponent_data,
-                    'isFinished': tournament.is_finished,
-                    'teamInTournament': team_in_tour_num,
-                    'askForFinished': tournament.ask_for_finished,
-                    'teamOneWins': tournament.team_one_wins,
-                    'teamTwoWins': tournament.team_two_wins,
-                    'askedTeam': asked_team,
-                    'tournamentInGroup': True if tournament.group is not None else False,
-                })
-            else:
-                # If tournament is finished, include match data
-                matches = Match.objects.filter(tournament=tournament)
-                matches_data = MatchesSerializer(matches, many=True).data
-                response_data.append({
-                    'id': tournament.id,
-                    'startTime': tournament.match_start_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
-                    'opponent': opponent_data,
-                    'isFinished': tournament.is_finished,
-                    'teamInTournament': team_in_tour_num,
-                    'teamOneWins': tournament.team_one_wins,
-                    'teamTwoWins': tournament.team_two_wins,
-                    'matches': matches_data,
-                    'winner': winner,
-                    'tournamentInGroup': True if tournament.group is not None else False,
-                })
-
-        maps = Map.objects.filter(seasons=season)
-        maps_data = []
-        for map in maps:
-            maps_data.append({
-                'id': map.id,
-                'name': map.name
-            })
-
-        # Send tournament data to clients
-        async_to_sync(channel_layer.group_send)(
-            f"manager_{self.group_name}",
-            {
-                "type": "send_tournaments",
-                "text": {
-                    'tournaments': response_data,
-                    'maps': maps_data
-                }
-            }
-        )
-
-
-    async def send_tournaments(self, event):
+        self.stop_timers()
+        await self.unsubscribe_topic()
         await self.send({
-            'type': 'websocket.send',
-            'text': json.dumps(event['text'])
+            'type': 'websocket.close',
         })
+        raise StopConsumer()
+
+    async def send_tournaments(self, event):
+        await self.forward_topic(event)
 
 
-class AdminConsumer(AsyncConsumer):
+class AdminConsumer(TimersMixin, BatchMixin, TopicMixin, AsyncConsumer):
     """
     Handle WebSocket connections and events for admin users.
 
     This class implements methods to handle WebSocket connections, receive events from clients,
     and manage WebSocket disconnections for admin users.
 
+    After subscribing to the tournament list, admins may also follow the topics of extra_topics with
+    {"action": "subscribe", "topic": ..., "version": ...} and {"action": "unsubscribe", "topic": ...}.
+    Their frames are labelled as {"topic": ..., "version": ..., "data": ...}, so they can't be
+    mistaken for the tournament list.
+
     Attributes:
         is_first_message_received (bool): Flag to track if the first message is received.
-        timeout_task (asyncio.Task): Task for handling authentication timeout.
         group_name (str): Name of the group associated with the admin user.
+        extra_topics (dict): Builders of the other topics admins may subscribe to, by topic name.
     """
+    extra_topics = {'admin_counts': admin_counts}
+
     async def websocket_connect(self, event):
         """
         Handle WebSocket connection event.
 
         This method is called when a WebSocket connection is established. It accepts the connection,
-        initializes necessary variables, and starts a timeout handler.
+        initializes necessary variables, and schedules the authentication deadline.
 
         Args:
             event: The WebSocket connection event.
@@ -930,20 +916,19 @@ class AdminConsumer(AsyncConsumer):
         # Initialize flag to track if the first message is received
         self.is_first_message_received = False
         
-        # Start a task for timeout handling
-        self.timeout_task = asyncio.create_task(self.timeout_handler())
+        # Close the connection if it isn't authenticated in time
+        self.start_timers()
         
         # Initialize variable for storing group name
         self.group_name = None
 
-
     async def websocket_receive(self, event):
         """
         Receives websocket events and handles them accordingly.
 
         This method receives websocket events and performs actions based on the event data,
         such as subscribing users to a group, updating tournament details, setting winners,
-        or creating new tournaments.
+        creating new tournaments, or applying a batch of these actions.
 
         Args:
             event (dict): The websocket event containing data sent by the client.
@@ -963,12 +948,11 @@ class AdminConsumer(AsyncConsumer):
                 })
                 raise StopConsumer()
             try:
-                token = data['token']
+                token = data.get('token')
                 self.group_name = data.get('group')
-                try:
-                    # Attempt to retrieve user token object asynchronously
-                    token_obj = await sync_to_async(Token.objects.get)(key=token)
-                except Token.DoesNotExist:
+                # Resolve the identity of the user from the token cache
+                identity = await auth.authenticate(self.scope, token)
+                if identity is None:
                     # If token does not exist, close websocket connection and stop the consumer
                     await self.send({
                         'type': 'websocket.close',
@@ -978,19 +962,12 @@ class AdminConsumer(AsyncConsumer):
                 if action == 'subscribe':
                     try:
                         # Subscribe user to appropriate group and handle tournament updates
-                        user = await sync_to_async(lambda: token_obj.user)()
-                        self.group_name = await sync_to_async(lambda: user.id)()
-                        is_admin = await sync_to_async(lambda: user.is_staff)()
-                        season = await sync_to_async(Season.objects.get)(is_finished=False)
-                        tournaments = await sync_to_async(Tournament.objects.filter)(season=season)
-                        if is_admin:
-                            await self.channel_layer.group_add(
-                                f'admin_{self.group_name}',
-                                self.channel_name
-                            )
-                            await sync_to_async(self.tournament_update_handler)(instance=tournaments)
-                            post_save.connect(
-                                self.tournament_update_handler, sender=Tournament)
+                        self.group_name = identity.user_id
+                        if identity.is_staff:
+                            # All admins share the tournament list of the current season, each one
+                            # may only view a window of it
+                            window = TournamentWindow.parse(data['window']) if 'window' in data else None
+                            await self.subscribe_topic('admin_tournaments', data, admin_tournaments, window=window)
                         else:
                             await self.send({
                                 'type': 'websocket.close',
@@ -1019,210 +996,85 @@ class AdminConsumer(AsyncConsumer):
                 })
                 raise StopConsumer()
             if data['action'] == 'set_winner':
-                # Handle setting winner action
-                tournament_id = data['tournament_id']
-                winner_id = data['winner_id']
-                tournament = await sync_to_async(Tournament.objects.get)(id=tournament_id)
-                winner = await sync_to_async(Team.objects.get)(id=winner_id)
-                tournament.is_finished = True
-                tournament.ask_for_finished = False
-                tournament.asked_team = None
-                tournament.winner = winner
-                await sync_to_async(tournament.save)()
+                try:
+                    # Handle setting winner action, the winner also moves to the next stage
+                    await database_sync_to_async(services.advance_winner)(
+                        data['tournament_id'], data['winner_id'])
+                except ObjectDoesNotExist:
+                    await self.send({
+                        'type': 'websocket.send',
+                        'text': json.dumps({})
+                    })
+                except ValidationError:
+                    await self.send({
+                        'type': 'websocket.send',
+                        'text': 'Incorrect Value'
+                    })
             if data['action'] == 'update':
                 # Handle tournament update action
                 tournament_id = data['tournament_id']
                 field = data['field']
                 value = data['value']
-                if field == 'is_finished':
-                    try:
-                        # Handle updating 'is_finished' field of the tournament
-                        tournament = await sync_to_async(Tournament.objects.get)(id=tournament_id)
-                        team_one = await sync_to_async(lambda: tournament.team_one)()
-                        team_two = await sync_to_async(lambda: tournament.team_two)()
-                        team_one_wins = await sync_to_async(lambda: tournament.team_one_wins)()
-                        team_two_wins = await sync_to_async(lambda: tournament.team_two_wins)()
-                        try:
-                            tournament.is_finished = value
-                            if value is True:
-                                tournament.ask_for_finished = False
-                                tournament.asked_team = None
-                                if team_one_wins > team_two_wins:
-                                    tournament.winner = team_one
-                                elif team_one_wins < team_two_wins:
-                                    tournament.winner = team_two
-                                else:
-                                    tournament.winner = None
-                            else:
-                                tournament.winner = None
-                            await sync_to_async(tournament.save)()
-                        except ValidationError:
-                            await self.send({
-                                'type': 'websocket.send',
-                                'text': 'Incorrect Value'
-                            })
-                    except FieldDoesNotExist:
-                        await self.send({
-                            'type': 'websocket.send',
-                            'text': 'Field not found'
-                        })
-                elif field == 'winner':
-                    try:
-                        # Handle updating 'winner' field of the tournament
-                        tournament = await sync_to_async(Tournament.objects.get)(id=tournament_id)
-                        obj_inline = tournament.inline_number
-                        if (obj_inline):
-                            try:
-                                paired_number = obj_inline + 1 if obj_inline % 2 == 0 else obj_inline - 1
-                            except:
-                                paired_number = None
-                        else:
-                            paired_number = None
-                        try:
-                            if paired_number is not None:
-                                paired_tournament = await sync_to_async(lambda: Tournament.objects.get(
-                                    inline_number=paired_number, stage=tournament.stage, season=tournament.season))()
-                            else:
-                                paired_tournament = None
-                        except Tournament.DoesNotExist:
-                            paired_tournament = None
-                        if paired_tournament is not None:
-                            paired_tournament_winner = await sync_to_async(lambda: paired_tournament.winner)()
-                        else:
-                            paired_tournament_winner = None
-                        winner = await sync_to_async(Team.objects.get)(pk=value)
-                        try:
-                            tournament.is_finished = True
-                            tournament.ask_for_finished = False
-                            tournament.asked_team = None
-                            tournament.winner = winner
-                            try:
-                                next_stage_tournament = await sync_to_async(lambda: tournament.next_stage_tournament)()
-                            except:
-                                next_stage_tournament = None
-                            if paired_tournament_winner is not None and next_stage_tournament is None:
-                                next_stage_tournament = await sync_to_async(lambda: Tournament(
-                                    team_one=paired_tournament_winner,
-                                    team_two=winner,
-                                    season=paired_tournament.season,
-                                    stage=paired_tournament.stage + 1,
-                                    is_finished=False,
-                                    inline_number=paired_number // 2,
-                                    match_start_time=(
-                                        datetime.datetime.combine(
-                                            datetime.datetime.now() + datetime.timedelta(days=1),
-                                            datetime.time(15, 0)))))()
-                                await sync_to_async(next_stage_tournament.save)()
-                                paired_tournament.next_stage_tournament = next_stage_tournament
-                                await sync_to_async(paired_tournament.save)()
-                                tournament.next_stage_tournament = next_stage_tournament
-                            if next_stage_tournament is not None:
-                                next_stage_tournament_team_one = await sync_to_async(lambda: next_stage_tournament.team_one)()
-                                if next_stage_tournament_team_one == paired_tournament_winner:
-                                    next_stage_tournament.team_two = winner
-                                else:
-                                    next_stage_tournament.team_one = winner
-                                await sync_to_async(next_stage_tournament.save)()
-                            await sync_to_async(tournament.save)()
-                        except ValidationError:
-                            await self.send({
-                                'type': 'websocket.send',
-                                'text': 'Incorrect Value'
-                            })
-                    except FieldDoesNotExist:
-                        await self.send({
-                            'type': 'websocket.send',
-                            'text': 'Field not found'
-                        })
-                elif field == 'team_two':
-                    try:
-                        # Handle updating 'team_two' field of the tournament
-                        tournament = await sync_to_async(Tournament.objects.get)(id=tournament_id)
-                        team_two = await sync_to_async(Team.objects.get)(pk=value)
-                        try:
-                            tournament.team_two = team_two
-                            await sync_to_async(tournament.save)()
-                        except ValidationError:
-                            await self.send({
-                                'type': 'websocket.send',
-                                'text': 'Incorrect Value'
-                            })
-                    except FieldDoesNotExist:
-                        await self.send({
-                            'type': 'websocket.send',
-                            'text': 'Field not found'
-                        })
-                elif field == 'team_one':
-                    try:
-                        # Handle updating 'team_one' field of the tournament
-                        tournament = await sync_to_async(Tournament.objects.get)(id=tournament_id)
-                        team_one = await sync_to_async(Team.objects.get)(pk=value)
-                        try:
-                            tournament.team_one = team_one
-                            await sync_to_async(tournament.save)()
-                        except ValidationError:
-                            await self.send({
-                                'type': 'websocket.send',
-                                'text': 'Incorrect Value'
-                            })
-                    except FieldDoesNotExist:
-                        await self.send({
-                            'type': 'websocket.send',
-                            'text': 'Field not found'
-                        })
-                else:
-                    try:
-                        # Handle updating other fields of the tournament
-                        await sync_to_async(lambda: Tournament._meta.get_field(field))()
-                        tournament = await sync_to_async(Tournament.objects.get)(id=tournament_id)
-                        try:
-                            setattr(tournament, field, value)
-                            await sync_to_async(tournament.save)()
-                        except ValidationError:
-                            await self.send({
-                                'type': 'websocket.send',
-                                'text': 'Incorrect Value'
-                            })
-                    except FieldDoesNotExist:
-                        await self.send({
-                            'type': 'websocket.send',
-                            'text': 'Field not found'
-                        })
+                try:
+                    # Finishing and setting the winner also update the score and the bracket
+                    await database_sync_to_async(services.update_tournament)(tournament_id, field, value)
+                except (ValidationError, ValueError):
+                    await self.send({
+                        'type': 'websocket.send',
+                        'text': 'Incorrect Value'
+                    })
+                except FieldDoesNotExist:
+                    await self.send({
+                        'type': 'websocket.send',
+                        'text': 'Field not found'
+                    })
+                except ObjectDoesNotExist:
+                    await self.send({
+                        'type': 'websocket.send',
+                        'text': json.dumps({})
+                    })
+            if data['action'] == 'batch':
+                # Apply several actions, e.g. a whole bracket, in one transaction
+                await self.apply_batch(data, services.apply_admin_batch)
+            topic = data.get('topic') if isinstance(data.get('topic'), str) else None
+            if data['action'] == 'subscribe' and topic in self.extra_topics:
+                # Follow the counts of the tournaments next to the list
+                await self.subscribe_topic(topic, data, self.extra_topics[topic], labelled=True)
+            if data['action'] == 'unsubscribe' and topic in self.extra_topics:
+                await self.unsubscribe_topic(topic)
+            subscription = (self.subscriptions or {}).get('admin_tournaments')
+            if data['action'] == 'window' and subscription is not None:
+                # Move the window viewed by the admin, e.g. to another stage or page
+                try:
+                    await subscription.set_window(TournamentWindow.parse(data.get('window')))
+                except ValueError:
+                    await self.send({
+                        'type': 'websocket.send',
+                        'text': 'Incorrect Value'
+                    })
             if data['action'] == 'create_tournament':
                 try:
                     # Handle creating a new tournament
-                    match_start_time = data['match_start_time']
-                    team_one_pk = data['team_one']
-                    team_two_pk = data['team_two']
-                    inline_number = data.get('inline_number')
-                    if team_one_pk == team_two_pk:
-                        raise ValidationError("Teams can't be equal")
-                    stage = data['stage']
-                    season = await sync_to_async(Season.objects.get)(is_finished=False)
-                    team_one = await sync_to_async(Team.objects.get)(pk=team_one_pk)
-                    team_two = await sync_to_async(Team.objects.get)(pk=team_two_pk)
-                    data = {
-                        'season': season,
-                        'match_start_time': match_start_time,
-                        'team_one': team_one,
-                        'team_two': team_two,
-                        'stage': stage,
-                        'is_finished': False,
-                        'inline_number': inline_number
-                    }
-                    await sync_to_async(Tournament.objects.create)(**data)
+                    await database_sync_to_async(services.create_tournament)(
+                        data['match_start_time'], data['team_one'], data['team_two'],
+                        data['stage'], data.get('inline_number'))
                 except ValidationError:
                     await self.send({
                         'type': 'websocket.send',
                         'text': 'Incorrect Value'
                     })
-
+                except ObjectDoesNotExist:
+                    # The team or the current season doesn't exist
+                    await self.send({
+                        'type': 'websocket.send',
+                        'text': json.dumps({})
+                    })
 
     async def websocket_disconnect(self, event):
         """
         Handles WebSocket disconnection event.
 
-        This method cancels any timeout task, removes the consumer from the admin group,
+        This method removes the deadlines of the connection, removes the consumer from the admin group,
         sends a close message to the client, and stops the consumer.
 
         Args:
@@ -1231,128 +1083,18 @@ class AdminConsumer(AsyncConsumer):
         Returns:
             None
         """
-        if self.timeout_task:
-            self.timeout_task.cancel()
-        await self.channel_layer.group_discard(
-            f'admin_{self.group_name}',
-            self.channel_name
-        )
+        self.stop_timers()
+        await self.unsubscribe_topic()
         await self.send({
             'type': 'websocket.close',
         })
         raise StopConsumer()
 
-    async def timeout_handler(self):
-        """
-        Timeout handler for WebSocket authentication.
-
-        This method asynchronously sleeps for a specified timeout duration and closes the WebSocket
-        connection if the first message is not received within the timeout period.
-
-        Returns:
-            None
-        """
-        try:
-            await asyncio.sleep(int(env('WEBSOCKET_AUTH_TIMEOUT')))
-            if not self.is_first_message_received:
-                await self.send({
-                    'type': 'websocket.close',
-                })
-                raise StopConsumer()
-        except asyncio.CancelledError:
-            pass
-        
-
-    def tournament_update_handler(self, instance, **kwargs):
-        """
-        Handle tournament update event and send updated tournament list to clients.
-
-        This method is responsible for handling the tournament update event and sending the updated
-        tournament list to clients subscribed to the corresponding group.
-
-        Args:
-            instance: The instance of the tournament being updated.
-            kwargs: Additional keyword arguments.
-
-        Returns:
-            None
-        """
-        # Get the channel layer
-        channel_layer = get_channel_layer()
-        
-        # Get the current ongoing season
-        season = Season.objects.get(is_finished=False)
-        
-        # Get all tournaments associated with the current season
-        tournaments = Tournament.objects.filter(season=season)
-        
-        # Initialize an empty list to store response data
-        tournaments_data = []
-        
-        # Iterate over each tournament
-        for tournament in tournaments:
-            # Get all matches associated with the tournament
-            matches = Match.objects.filter(tournament=tournament)
-            
-            # Check if matches exist for the tournament
-            if matches:
-                matchesExists = True
-            else:
-                matchesExists = False
-            
-            # Prepare tournament data to be sent as response
-            tournament_data = {
-                'id': tournament.id,
-                'season': tournament.season.number,
-                'startTime': tournament.match_start_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
-                'isFinished': tournament.is_finished,
-                'teamOne': tournament.team_one.pk,
-                'teamOneName': tournament.team_one.name,
-                'teamOneWins': tournament.team_one_wins,
-                'teamTwo': tournament.team_two.pk,
-                'teamTwoName': tournament.team_two.name,
-                'teamTwoWins': tournament.team_two_wins,
-                'stage': tournament.stage,
-                'group': tournament.group.pk if tournament.group else None,
-                'winner': tournament.winner.pk if tournament.winner else None,
-                'askedTeam': tournament.asked_team.pk if tournament.asked_team else None,
-                'askForFinished': tournament.ask_for_finished,
-                'matchesExists': matchesExists,
-                'inlineNumber': tournament.inline_number
-            }
-            
-            # Append tournament data to the response data list
-            tournaments_data.append(tournament_data)
-        
-        maps = Map.objects.filter(seasons=season)
-        maps_data = []
-        for map in maps:
-            maps_data.append({
-                'id': map.id,
-                'name': map.name
-            })
-        # Send the updated tournament data to the corresponding group of clients
-        async_to_sync(channel_layer.group_send)(
-            f"admin_{self.group_name}",
-            {
-                "type": "send_tournaments",
-                "text": {
-                    'tournaments': tournaments_data,
-                    'maps': maps_data
-
-                }
-            }
-        )
-
-
     async def send_tournaments(self, event):
-        await self.send({
-            'type': 'websocket.send',
-            'text': json.dumps(event['text'])
-        })
+        await self.forward_topic(event)
 
 
-class groupsConsumer(AsyncConsumer):
+class groupsConsumer(TimersMixin, TopicMixin, AsyncConsumer):
     """
     WebSocket consumer for handling group interactions.
 
@@ -1361,9 +1103,8 @@ class groupsConsumer(AsyncConsumer):
 
     Attributes:
         is_first_message_received (bool): Indicates if the first message has been received.
-        timeout_task (asyncio.Task): Task for handling authentication timeout.
         group_name (str): Name of the group associated with the client.
-        user: User object associated with the WebSocket connection.
+        user_id (int): ID of the user associated with the WebSocket connection.
         is_admin_user (bool): Indicates if the user is an admin.
 
     """
@@ -1372,7 +1113,7 @@ class groupsConsumer(AsyncConsumer):
         Accepts a WebSocket connection and initializes necessary attributes.
 
         This method is called when a WebSocket connection is established.
-        It accepts the connection, initializes necessary attributes, and starts a timeout handler task.
+        It accepts the connection, initializes necessary attributes, and schedules the authentication deadline.
 
         Args:
             event: WebSocket connection event.
@@ -1385,9 +1126,9 @@ class groupsConsumer(AsyncConsumer):
         })
         # Initialize attributes
         self.is_first_message_received = False
-        self.timeout_task = asyncio.create_task(self.timeout_handler())
+        self.start_timers()
         self.group_name = None
-        self.user = None
+        self.user_id = None
         self.is_admin_user = False
 
     async def websocket_receive(self, event):
@@ -1416,13 +1157,12 @@ class groupsConsumer(AsyncConsumer):
                 })
                 raise StopConsumer()
             try:
-                # Extract token from the received data
-                token = data['token']
+                # Extract token from the received data, it may also come with the handshake
+                token = data.get('token')
                 self.group_name = data.get('group')
-                try:
-                    # Retrieve token object asynchronously
-                    token_obj = await sync_to_async(Token.objects.get)(key=token)
-                except Token.DoesNotExist:
+                # Resolve the identity of the user from the token cache
+                identity = await auth.authenticate(self.scope, token)
+                if identity is None:
                     # If token does not exist, close the WebSocket connection
                     await self.send({
                         'type': 'websocket.close',
@@ -1431,23 +1171,13 @@ class groupsConsumer(AsyncConsumer):
                 action = data['action']
                 if action == 'subscribe':
                     try:
-                        # Retrieve user, check if admin, and fetch related data
-                        user = await sync_to_async(lambda: token_obj.user)()
-                        self.group_name = await sync_to_async(lambda: user.id)()
-                        is_admin = await sync_to_async(lambda: user.is_staff)()
-                        season = await sync_to_async(Season.objects.get)(is_finished=False)
-                        tournaments = await sync_to_async(Tournament.objects.filter)(season=season)
-                        if is_admin:
-                            # If user is admin, add to group and update data
+                        # Check if the user is an admin
+                        self.group_name = identity.user_id
+                        if identity.is_staff:
+                            # If user is admin, subscribe to the standings shared by all admins
                             self.is_admin_user = True
-                            self.user = user
-                            await self.channel_layer.group_add(
-                                f'groups_{self.group_name}',
-                                self.channel_name
-                            )
-                            await sync_to_async(self.group_update_handler)(instance=tournaments)
-                            post_save.connect(
-                                self.group_update_handler, sender=Tournament)
+                            self.user_id = identity.user_id
+                            await self.subscribe_topic('groups_standings', data, group_standings)
                         else:
                             # If user is not admin, close WebSocket connection
                             await self.send({
@@ -1468,12 +1198,11 @@ class groupsConsumer(AsyncConsumer):
                 })
                 raise StopConsumer()
 
-
     async def websocket_disconnect(self, event):
         """
         Handles disconnection of websocket clients.
 
-        This method cancels the timeout task if it exists, removes the client from the group,
+        This method removes the deadlines of the connection, removes the client from the group,
         sends a close signal to the client, and stops the consumer.
 
         Args:
@@ -1482,122 +1211,132 @@ class groupsConsumer(AsyncConsumer):
         Returns:
             None
         """
-        if self.timeout_task:
-            self.timeout_task.cancel()
-        await self.channel_layer.group_discard(
-            f'groups_{self.group_name}',
-            self.channel_name
-        )
+        self.stop_timers()
+        await self.unsubscribe_topic()
         await self.send({
             'type': 'websocket.close',
         })
         raise StopConsumer()
 
-    async def timeout_handler(self):
+    async def send_groups(self, event):
+        await self.forward_topic(event)
+
+
+class InfoConsumer(TimersMixin, TopicMixin, AsyncConsumer):
+    """
+    Handle WebSocket connections for providing information to clients.
+
+    This consumer class manages WebSocket connections and sends relevant information to clients
+    regarding previous seasons, current season status, tournaments, and player data.
+
+    All connections share one snapshot kept in Redis, so connecting doesn't run any query.
+    Options are passed in the query string: `encoding`, `compression` and `version` (empty on the
+    first connection, then the last version received) like in the subscribe message of the other
+    topics.
+
+    Attributes:
+        retained_type (str): Message type of the retained `info` topic.
+    """
+    retained_type = 'send_groups'
+
+    async def websocket_connect(self, event):
         """
-        Handles the timeout for authentication.
+        Handle WebSocket connection event.
+
+        This method is called when a WebSocket connection is established.
+        It accepts the connection and subscribes it to the shared landing page snapshot.
 
-        This method waits for the specified time for the first message from the client. If no
-        message is received within the timeout period, it closes the websocket connection.
+        Args:
+            event (dict): WebSocket connect event.
 
         Returns:
             None
         """
-        try:
-            await asyncio.sleep(int(env('WEBSOCKET_AUTH_TIMEOUT')))
-            if not self.is_first_message_received:
-                await self.send({
-                    'type': 'websocket.close',
-                })
-                raise StopConsumer()
-        except asyncio.CancelledError:
-            pass
+        # Accept the WebSocket connection
+        await self.send({
+            'type': 'websocket.accept'
+        })
+        # The connection is public, only idle reaping and heartbeats apply
+        self.start_timers(authenticate=False)
+
+        # Read the subscribe options from the query string,
+        # e.g. /ws/information/?encoding=msgpack&compression=deflate
+        params = parse_qs(self.scope.get('query_string', b'').decode(), keep_blank_values=True)
+        data = {key: params[key][0] for key in ('encoding', 'compression') if key in params}
+        if 'version' in params:
+            version = params['version'][0]
+            data['version'] = int(version) if version.isdigit() else None
 
-    def group_update_handler(self, instance, **kwargs):
+        await self.subscribe_topic('info', data, info_snapshot)
+
+    async def send_groups(self, event):
+        await self.forward_topic(event)
+
+    async def websocket_disconnect(self, event):
         """
-        Handles updates to group information.
+        Handle WebSocket disconnect event.
 
-        This method retrieves information about active seasons, groups, tournaments, and team wins.
-        It then formats this information and sends it to clients subscribed to the corresponding group.
+        This method is called when a WebSocket connection is disconnected.
 
         Args:
-            instance: The instance of the match being updated.
-            kwargs: Additional keyword arguments.
+            event (dict): WebSocket disconnect event.
 
         Returns:
             None
         """
-        # Importing necessary function to get channel layer
-        channel_layer = get_channel_layer()
-        
-        # Getting the active season that is not finished
-        season = Season.objects.get(is_finished=False)
-        
-        # Getting all group stages related to the active season
-        groups = GroupStage.objects.filter(season=season)
-        
-        # Getting all tournaments related to the active season and having a group
-        tournaments = Tournament.objects.filter(season=season, group__isnull=False)
-        
-        # Dictionary to store team wins
-        wins = {}
-        
-        # Looping through tournaments to count wins for each team
-        for tournament in tournaments:
-            if tournament.winner:
-                wins[tournament.winner.pk] = wins.get(tournament.winner.pk, 0) + 1
-        
-        # Dictionary to store groups data
-        groups_data = {}
-        
-        # Looping through groups to collect teams data
-        for group in groups:
-            teams_data = {}
-            # Looping through teams in each group
-            for team in group.teams.all():
-                # Storing team wins in teams_data
-                teams_data[str(team.pk)] = wins.get(team.pk, 0)
-            # Storing teams_data in groups_data
-            groups_data[str(group.pk)] = teams_data
-        
-        # Checking if groups_data is not empty
-        if groups_data:
-            # Sending groups_data to the corresponding group channel
-            async_to_sync(channel_layer.group_send)(
-                f'groups_{self.group_name}',
-                {
-                    'type': 'send_groups',
-                    'text': groups_data
-                }
-            )
+        self.stop_timers()
+        await self.unsubscribe_topic()
+        raise StopConsumer()
 
+    async def websocket_receive(self, event):
+        """
+        Handle WebSocket receive event.
 
-    async def send_groups(self, event):
+        This method is called when a WebSocket receives a message.
+        It closes the WebSocket connection.
+
+        Args:
+            event (dict): WebSocket receive event.
+
+        Returns:
+            None
+        """
         await self.send({
-            'type': 'websocket.send',
-            'text': json.dumps(event['text'])
+            'type': 'websocket.close'
         })
+        raise StopConsumer()
 
 
-class InfoConsumer(AsyncConsumer):
+class TopicsConsumer(TimersMixin, BatchMixin, MatchDetailMixin, TopicMixin, AsyncConsumer):
     """
-    Handle WebSocket connections for providing information to clients.
+    WebSocket consumer multiplexing the topics of all the other endpoints over one connection.
 
-    This consumer class manages WebSocket connections and sends relevant information to clients
-    regarding previous seasons, current season status, tournaments, and player data.
+    The client authenticates once, with the handshake or a `token` key in any message, then
+    subscribes to topics by name with {"action": "subscribe", "topic": ..., "version": ...} and
+    unsubscribes with {"action": "unsubscribe", "topic": ...}. Topics with windows, e.g.
+    `admin_tournaments`, take a "window" key on subscribe and move it with
+    {"action": "window", "topic": ..., "window": ...}. Frames are wrapped as
+    {"topic": ..., "version": ..., "data": ...}. Topics and their permissions come from
+    main.topics, the public `info` topic needs no authentication.
 
-    Attributes:
-        group_id (str): Unique identifier for the WebSocket connection group.
-        previus_seasons (dict): Information about previous seasons.
-        players_by_league (dict): Player count by league.
+    Actions are also accepted, so a client needs no other connection: `batch` operations on a
+    `match_<id>` or `admin_tournaments` topic, the `start_now` and `finish` actions of managers,
+    and `match_detail` requests, see MatchDetailMixin.
 
+    Attributes:
+        is_first_message_received (bool): Flag indicating whether the first message has been received.
+        identity (Identity): Identity of the user, None if anonymous.
     """
+    multiplexed = True
+    # Largest number of topics a connection may subscribe to
+    max_topics = 32
+
     async def websocket_connect(self, event):
         """
         Handle WebSocket connection event.
 
-        This method is called when a WebSocket connection is established.
-        It accepts the connection, adds the channel to a group, and initializes data.
+        This method accepts the connection, keeps the identity of the handshake if any, and
+        schedules the deadline of the first message.
 
         Args:
             event (dict): WebSocket connect event.
@@ -1605,232 +1344,171 @@ class InfoConsumer(AsyncConsumer):
         Returns:
             None
         """
-        # Generate a unique group ID for the connection
-        self.group_id = uuid.uuid4().hex
-        
-        # Accept the WebSocket connection
         await self.send({
             'type': 'websocket.accept'
         })
-        
-        # Add the channel to a group using the generated group ID
-        await self.channel_layer.group_add(
-            f'groups_{self.group_id}',
-            self.channel_name
-        )
-        
-        # Initialize data: previus_seasons and players_by_league
-        self.previus_seasons = await self.async_get_previus_seasons()
-        self.players_by_league = await self.async_get_players_by_league()
-        
-        try:
-            # Try to get the current season that is not finished
-            season = await sync_to_async(Season.objects.get)(is_finished=False)
-            
-            try:
-                # Try to get tournaments associated with the current season
-                tournaments = await sync_to_async(Tournament.objects.filter)(season=season)
-                
-                # Update the group with tournament data
-                await sync_to_async(self.group_update_handler)(instance=tournaments)
-                
-            except Tournament.DoesNotExist:
-                pass
-            except TypeError:
-                pass
-            
-            # Connect the group_update_handler method to the post_save signal of the Tournament model
-            post_save.connect(self.group_update_handler, sender=Tournament)
-        
-        except Season.DoesNotExist:
-            # If no current season is found, send initial data to the client
-            await self.send({
-                'type': 'websocket.send',
-                'text': json.dumps({
-                    'state': 0,
-                    "previusSeasons": self.previus_seasons,
-                    "playersByLeague": self.players_by_league
-                })
-            })
-            
-            # Connect the wait_for_season method to the post_save signal of the Season model
-            post_save.connect(self.wait_for_season, sender=Season)
-
+        self.is_first_message_received = False
+        self.identity = self.scope.get('identity')
+        # Close the connection if it doesn't send its first message in time
+        self.start_timers()
 
-    def wait_for_season(self, instance, **kwargs):
+    async def websocket_receive(self, event):
         """
-        Handle waiting for the next season event.
+        Handle WebSocket receive event.
 
-        This method sends information about waiting for the next season to clients.
+        This method authenticates the connection if the message carries a token, then subscribes,
+        unsubscribes or applies the requested action.
 
         Args:
-            instance: The instance of the season.
-            kwargs: Additional keyword arguments.
+            event (dict): WebSocket receive event.
 
         Returns:
             None
         """
-        # Get the channel layer
-        channel_layer = get_channel_layer()
-        # Send information to clients in the group
-        async_to_sync(channel_layer.group_send)(
-            f'groups_{self.group_id}',
-            {
-                'type': 'send_groups',
-                'text': {
-                    'state': 9,  # State indicating waiting for next season
-                    "previusSeasons": self.previus_seasons,  # Previous seasons data
-                    "playersByLeague": self.players_by_league  # Players by league data
-                }
-            }
-        )
+        self.is_first_message_received = True
+        try:
+            data = json.loads(event.get('text') or '')
+        except json.JSONDecodeError:
+            data = None
+        if not isinstance(data, dict):
+            # If the message is not a JSON object, close the WebSocket connection
+            await self.close_connection()
+            raise StopConsumer()
+
+        if 'token' in data:
+            # Resolve the identity of the user from the token cache
+            self.identity = await auth.authenticate(self.scope, data['token'])
+            if self.identity is None:
+                # If the token does not exist, close the WebSocket connection
+                await self.close_connection()
+                raise StopConsumer()
 
-    @sync_to_async
-    def async_get_previus_seasons(self):
+        action = data.get('action')
+        topic = data.get('topic')
+        if action == 'subscribe':
+            await self.subscribe(topic, data)
+        elif action == 'unsubscribe':
+            if isinstance(topic, str):
+                await self.unsubscribe_topic(topic)
+        elif action == 'window':
+            await self.set_window(topic, data)
+        elif action == 'batch':
+            await self.batch(topic, data)
+        elif action in ('start_now', 'finish'):
+            await self.manage_tournament(action, data.get('id'))
+        elif action == 'match_detail':
+            await self.send_match_detail(data.get('id'))
+
+    async def subscribe(self, topic, data):
         """
-        Retrieve data about previous seasons asynchronously.
+        Subscribes the connection to a topic if the user may read it.
 
-        This method retrieves data about the previous seasons from the database.
+        Args:
+            topic (str): Name of the topic.
+            data (dict): Subscribe message received from the client.
 
         Returns:
-            dict: Dictionary containing information about previous seasons.
+            None
         """
-        # Retrieve previous seasons from the database
-        prev_seasons = Season.objects.filter(is_finished=True).order_by(
-            '-number')[:2].prefetch_related('tournament_set')
-        seasons_data = {}
-        tour_cnt = {}
-        for prev_season in prev_seasons:
-            # Count tournaments for each previous season
-            tour_cnt[str(prev_season.number)] = len(
-                prev_season.tournament_set.all())
-            # Prepare data for each previous season
-            seasons_data[str(prev_season.number)] = {
-                'tournamentsCount': tour_cnt[str(prev_season.number)],
-                'winner': prev_season.winner.name if prev_season.winner else None
-            }
-        return seasons_data
-
-
-    @sync_to_async
-    def async_get_players_by_league(self):
+        provider = topics.resolve(topic, self.identity)
+        if provider is None:
+            await self.send_error('subscribe', topic, 'Topic not found')
+            return
+        if len(self.subscriptions or ()) >= self.max_topics:
+            await self.send_error('subscribe', topic, 'Too many topics')
+            return
+        snapshot_builder, retained_type, window_type = provider
+        window = None
+        if 'window' in data:
+            try:
+                window = window_type.parse(data['window']) if window_type is not None else None
+            except ValueError:
+                window = None
+            if window is None:
+                await self.send_error('subscribe', topic, 'Incorrect Value')
+                return
+        await self.subscribe_topic(topic, data, snapshot_builder, retained_type, window)
+
+    async def set_window(self, topic, data):
         """
-        Retrieve player count by league asynchronously.
+        Moves the window viewed through a subscribed topic.
 
-        This method retrieves the count of players by league from the database.
+        Args:
+            topic (str): Name of the topic.
+            data (dict): Window message received from the client.
 
         Returns:
-            dict: Dictionary containing player counts by league.
+            None
         """
-        players_gmaster = len(Player.objects.filter(league=7))
-        players_master = len(Player.objects.filter(league=6))
-        players_diamond = len(Player.objects.filter(league=5))
-        return {'7': players_gmaster, '6': players_master, '5': players_diamond}
+        subscription = (self.subscriptions or {}).get(topic)
+        provider = topics.resolve(topic, self.identity)
+        if subscription is None or provider is None or provider[2] is None:
+            await self.send_error('window', topic, 'Topic not found')
+            return
+        try:
+            window = provider[2].parse(data.get('window'))
+        except ValueError:
+            await self.send_error('window', topic, 'Incorrect Value')
+            return
+        await subscription.set_window(window)
 
-    def group_update_handler(self, instance, **kwargs):
+    async def batch(self, topic, data):
         """
-        Handle group update event.
-
-        This method sends updated group information to clients based on the current state.
+        Applies a batch of match or admin actions, see BatchMixin.
 
         Args:
-            instance: The instance of the tournament.
-            kwargs: Additional keyword arguments.
+            topic (str): `match_<id>` for match actions, `admin_tournaments` for admin actions.
+            data (dict): Batch message received from the client.
 
         Returns:
             None
         """
-        # Get the channel layer
-        channel_layer = get_channel_layer()
-        
-        # Get the current season
-        season = Season.objects.get(is_finished=False)
-        
-        # If the season has not started yet and registration is open
-        if (season.start_datetime - timezone.now()).total_seconds() > 0 and season.can_register:
-            # Send the group information to clients
-            async_to_sync(channel_layer.group_send)(
-                f'groups_{self.group_id}',
-                {
-                    'type': 'send_groups',
-                    'text': {
-                        'state': 1,
-                        'season': season.number,
-                        "previusSeasons": self.previus_seasons,
-                        "playersByLeague": self.players_by_league
-                    }
-                }
-            )
-            # Wait for the season to start
-            async_to_sync(post_save.connect)(
-                self.wait_for_season, sender=Season)
-        
-        # If the season has not started yet but registration is closed
-        elif (season.start_datetime - timezone.now()).total_seconds() > 0:
-            # Send the group information to clients
-            async_to_sync(channel_layer.group_send)(
-                f'groups_{self.group_id}',
-                {
-                    'type': 'send_groups',
-                    'text': {
-                        'state': 0,
-                        "previusSeasons": self.previus_seasons,
-                        "playersByLeague": self.players_by_league
-                    }
-                }
-            )
-        
-        # If the season has started
+        identity = self.identity
+        if identity is not None and isinstance(topic, str) and topic.startswith('match_') and topic[6:].isdigit():
+            await self.apply_batch(
+                data, services.apply_match_batch, int(topic[6:]), identity.user_id, identity.is_staff)
+        elif identity is not None and identity.is_staff and topic == 'admin_tournaments':
+            await self.apply_batch(data, services.apply_admin_batch)
         else:
-            # Get season and playoff data
-            groups_data, playoff_data = get_season_data(season.number)
-            
-            # If there is data available for the season and playoffs
-            if groups_data:
-                # Send the group information to clients
-                async_to_sync(channel_layer.group_send)(
-                    f'groups_{self.group_id}',
-                    {
-                        'type': 'send_groups',
-                        'text': {
-                            "state": 2,
-                            "startedSeason": {
-                                "groups": groups_data,
-                                "playoff": playoff_data
-                            },
-                            "season": season.number,
-                            "previusSeasons": self.previus_seasons,
-                            "playersByLeague": self.players_by_league
-                        }
-                    }
-                )
-            # If there is no data available for the season and playoffs
-            else:
-                # Send the group information to clients
-                async_to_sync(channel_layer.group_send)(
-                    f'groups_{self.group_id}',
-                    {
-                        'type': 'send_groups',
-                        'text': {
-                            "state": 0,
-                            "previusSeasons": self.previus_seasons,
-                            "playersByLeague": self.players_by_league
-                        }
-                    }
-                )
+            await self.send_error('batch', topic, 'Forbidden')
 
+    async def manage_tournament(self, action, tournament_id):
+        """
+        Starts a tournament now or handles its finish handshake for a manager.
 
-    async def send_groups(self, event):
+        Args:
+            action (str): 'start_now' or 'finish'.
+            tournament_id (int): ID of the tournament.
+
+        Returns:
+            None
+        """
+        if self.identity is None or self.identity.team_id is None:
+            await self.send_error(action, None, 'Forbidden')
+            return
+        if not isinstance(tournament_id, int) or isinstance(tournament_id, bool):
+            # IDs are numbers, anything else would fail in the query
+            await self.send_error(action, None, 'Incorrect Value')
+            return
+        service = services.start_tournament_now if action == 'start_now' else services.finish_tournament
+        try:
+            await database_sync_to_async(service)(tournament_id, self.identity.team_id)
+        except Tournament.DoesNotExist:
+            # The tournament doesn't exist or the team of the manager doesn't play in it
+            await self.send_error(action, None, 'Not found')
+
+    async def send_error(self, action, topic, error):
+        # Errors are labelled like frames, so clients can route them
         await self.send({
             'type': 'websocket.send',
-            'text': json.dumps(event['text'], ensure_ascii=False)
+            'text': json.dumps({'action': action, 'topic': topic, 'error': error})
         })
 
     async def websocket_disconnect(self, event):
         """
         Handle WebSocket disconnect event.
 
-        This method is called when a WebSocket connection is disconnected.
+        This method removes the deadlines of the connection and unsubscribes it from all topics.
 
         Args:
             event (dict): WebSocket disconnect event.
@@ -1838,26 +1516,15 @@ class InfoConsumer(AsyncConsumer):
         Returns:
             None
         """
-        await self.channel_layer.group_discard(
-            f'groups_{self.group_id}',
-            self.channel_name
-        )
+        self.stop_timers()
+        await self.unsubscribe_topic()
         raise StopConsumer()
 
-    async def websocket_receive(self, event):
-        """
-        Handle WebSocket receive event.
-
-        This method is called when a WebSocket receives a message.
-        It closes the WebSocket connection.
+    async def new_match_list(self, event):
+        await self.forward_topic(event)
 
-        Args:
-            event (dict): WebSocket receive event.
+    async def send_tournaments(self, event):
+        await self.forward_topic(event)
 
-        Returns:
-            None
-        """
-        await self.send({
-            'type': 'websocket.close'
-        })
-        raise StopConsumer()
+    async def send_groups(self, event):
+        await self.forward_topic(event)
@@ -0,0 +1,99 @@
+# Import necessary modules
+import asyncio
+import uuid
+
+import msgpack
+from channels_redis.pubsub import RedisPubSubChannelLayer, RedisPubSubLoopLayer, RedisSingleShardConnection
+from channels_redis.utils import _wrap_close, decode_hosts
+
+
+# Length of the loop identifier prefixed to every message
+ORIGIN_SIZE = 16
+
+
+class HybridChannelLayer(RedisPubSubChannelLayer):
+    """
+    Pub/sub channel layer delivering straight to the consumers of its own event loop.
+
+    A group send puts the message in the queues of the group members of the sending loop at once and
+    publishes it to Redis for the other loops and processes only. Messages are prefixed with an
+    identifier of the sending loop, so a loop drops its own messages when Redis echoes them back,
+    while the other loops of the process still receive them. Local members receive the same
+    serialized bytes a remote member would, so each gets its own copy of the message exactly as
+    through Redis.
+
+    The configuration is the one of RedisPubSubChannelLayer.
+    """
+    def serialize(self, message):
+        # Serializes a message, prefixed with the identifier of the running loop
+        return self._get_layer().serialize(message)
+
+    def deserialize(self, message):
+        # Deserializes a message from any loop
+        return msgpack.unpackb(message[ORIGIN_SIZE:])
+
+    def _get_layer(self):
+        # Same as RedisPubSubChannelLayer, with the hybrid layer of the event loop
+        loop = asyncio.get_running_loop()
+        layer = self._layers.get(loop)
+        if layer is None:
+            layer = self._layers[loop] = HybridLoopLayer(*self._args, **self._kwargs, channel_layer=self)
+            _wrap_close(self, loop)
+        return layer
+
+
+class HybridLoopLayer(RedisPubSubLoopLayer):
+    """
+    Event loop part of HybridChannelLayer, the channels of the loop are the local consumers.
+    """
+    def __init__(self, hosts=None, prefix='asgi', on_disconnect=None, on_reconnect=None, channel_layer=None,
+                 **kwargs):
+        # Same as RedisPubSubLoopLayer, building hybrid shard connections in place of the plain ones
+        self.prefix = prefix
+        self.on_disconnect = on_disconnect
+        self.on_reconnect = on_reconnect
+        self.channel_layer = channel_layer
+        self.channels = {}
+        self.groups = {}
+        self._shards = [HybridShardConnection(host, self) for host in decode_hosts(hosts)]
+        # Identifier of this loop, another loop of the process must receive what this one sends
+        self.origin = uuid.uuid4().bytes
+
+    def serialize(self, message):
+        # Serializes a message, prefixed with the identifier of this loop
+        return self.origin + msgpack.packb(message)
+
+    async def send(self, channel, message):
+        """
+        Sends a message to a channel, without Redis if the channel is a consumer of this loop.
+        """
+        data = self.serialize(message)
+        queue = self.channels.get(channel)
+        if queue is not None:
+            queue.put_nowait(data)
+            return
+        await self._get_shard(channel).publish(channel, data)
+
+    async def group_send(self, group, message):
+        """
+        Sends a message to the local members of a group, then publishes it for the other loops and processes.
+        """
+        data = self.serialize(message)
+        group_channel = self._get_group_channel_name(group)
+        for channel in self.groups.get(group_channel, ()):
+            queue = self.channels.get(channel)
+            if queue is not None:
+                queue.put_nowait(data)
+        shard = self._get_shard(group_channel)
+        await shard.publish(group_channel, data)
+
+
+class HybridShardConnection(RedisSingleShardConnection):
+    """
+    Redis connection of a shard ignoring the messages published by its own loop.
+    """
+    def _receive_message(self, message):
+        if message is not None and message['data'][:ORIGIN_SIZE] == self.channel_layer.origin:
+            # Already delivered locally by the sender
+            return
+        super()._receive_message(message)
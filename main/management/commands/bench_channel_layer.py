@@ -0,0 +1,65 @@
+import asyncio
+import statistics
+import time
+
+from channels_redis.core import RedisChannelLayer
+from channels_redis.pubsub import RedisPubSubChannelLayer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from main.layers import HybridChannelLayer
+
+
+# Channel layers compared by the benchmark, all on the Redis shards of the topics layer
+BACKENDS = {
+    'redis': RedisChannelLayer,
+    'pubsub': RedisPubSubChannelLayer,
+    'hybrid': HybridChannelLayer,
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the latency of group sends to consumers of the same process for each channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=list(BACKENDS),
+                            help='Channel layers to benchmark')
+        parser.add_argument('--subscribers', type=int, default=50, help='Number of channels in the group')
+        parser.add_argument('--messages', type=int, default=500, help='Number of group sends')
+
+    def handle(self, *args, **options):
+        hosts = ["redis://" + shard + "/0" for shard in settings.CHANNEL_LAYER_SHARDS]
+        self.stdout.write(f"{'backend':<10}{'median ms':>12}{'p95 ms':>10}{'p99 ms':>10}{'sends/s':>10}")
+        for name in options['backends']:
+            layer = BACKENDS[name](hosts=hosts)
+            latencies, elapsed = asyncio.run(self.run(layer, options['subscribers'], options['messages']))
+            latencies.sort()
+            self.stdout.write(
+                f"{name:<10}{statistics.median(latencies) * 1000:>12.3f}"
+                f"{latencies[int(len(latencies) * 0.95)] * 1000:>10.3f}"
+                f"{latencies[int(len(latencies) * 0.99)] * 1000:>10.3f}"
+                f"{len(latencies) / elapsed:>10.0f}")
+        self.stdout.write(self.style.SUCCESS('Benchmark finished.'))
+
+    async def run(self, layer, subscriber_count, message_count):
+        # Creating the channels of the subscribers, all in this process
+        group = f'bench_{time.monotonic_ns()}'
+        channels = [await layer.new_channel() for _ in range(subscriber_count)]
+        for channel in channels:
+            await layer.group_add(group, channel)
+        # Letting the subscriptions settle before measuring
+        await asyncio.sleep(0.5)
+
+        # Each latency is the time until every subscriber received the message
+        latencies = []
+        started = time.perf_counter()
+        for number in range(message_count):
+            sent = time.perf_counter()
+            await layer.group_send(group, {'type': 'bench.message', 'number': number})
+            await asyncio.gather(*(layer.receive(channel) for channel in channels))
+            latencies.append(time.perf_counter() - sent)
+        elapsed = time.perf_counter() - started
+
+        for channel in channels:
+            await layer.group_discard(group, channel)
+        await layer.flush()
+        return latencies, elapsed
@@ -0,0 +1,113 @@
+import random
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.db.models import Count, Q
+from django.utils import timezone
+from main.models import League, Match, Player, Race, Region, Season, Team, Tournament
+from main import services
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks concurrent match edits and checks that the wins, games and series counters stay exact'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Number of concurrent editors')
+        parser.add_argument('--edits', type=int, default=200, help='Number of edits of each editor')
+        parser.add_argument('--matches', type=int, default=4, help='Number of edited matches')
+
+    def handle(self, *args, **options):
+        # The benchmark writes a lot of rows, so it runs in a throwaway test database
+        self.stdout.write(self.style.SUCCESS('Creating test database...'))
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            tournament, players, matches = self.create_fixtures(options['matches'])
+
+            # Running the editors concurrently, every edit is one transaction
+            self.stdout.write(self.style.SUCCESS(
+                f"Running {options['threads']} editors x {options['edits']} edits..."))
+            retries = []
+            editors = [
+                threading.Thread(target=self.edit, args=(tournament.pk, players, matches, options['edits'], retries))
+                for _ in range(options['threads'])
+            ]
+            started = time.perf_counter()
+            for editor in editors:
+                editor.start()
+            for editor in editors:
+                editor.join()
+            elapsed = time.perf_counter() - started
+
+            edits = options['threads'] * options['edits']
+            self.stdout.write(self.style.SUCCESS(
+                f'{edits} edits in {elapsed:.2f}s: {edits / elapsed:.0f} edits/s, {len(retries)} retried'))
+
+            # Comparing the counters with the values computed from the matches
+            errors = self.check_counters(tournament, players)
+            for error in errors:
+                self.stdout.write(self.style.ERROR(error))
+            if not errors:
+                self.stdout.write(self.style.SUCCESS('All counters are exact.'))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def create_fixtures(self, match_count):
+        # Creating two teams of two players and a tournament between them
+        user = User.objects.create(username='bench')
+        region = Region.objects.create(name='Bench')
+        league = League.objects.create(name='Bench')
+        race = Race.objects.create(name='Bench')
+        season = Season.objects.create(
+            number=1, start_datetime=timezone.now(), is_finished=False, can_register=False)
+        teams = [Team.objects.create(name=f'Bench {i}', tag=f'B{i}', logo='', region=region, user=user)
+                 for i in range(2)]
+        players = [
+            Player.objects.create(username=f'Bench {i}', mmr=0, league=league, race=race, wins=0,
+                                  total_games=0, team=teams[i % 2], user=user)
+            for i in range(4)
+        ]
+        tournament = Tournament.objects.create(
+            team_one=teams[0], team_two=teams[1], match_start_time=timezone.now(), season=season,
+            stage=1, is_finished=False)
+        matches = [Match.objects.create(tournament=tournament, user=user).pk for _ in range(match_count)]
+        return tournament, [player.pk for player in players], matches
+
+    def edit(self, tournament_id, players, matches, edits, retries):
+        # Randomly changing the winner and the players of the matches, the first player is picked
+        # from the first team and the second player from the second team
+        candidates = {'winner': players, 'player_one': players[0::2], 'player_two': players[1::2]}
+        try:
+            for _ in range(edits):
+                column = random.choice(list(candidates))
+                args = (random.choice(matches), tournament_id, column, random.choice(candidates[column]))
+                while True:
+                    try:
+                        services.patch_match(*args)
+                        break
+                    except OperationalError:
+                        # Deadlocks and lock timeouts roll back the whole edit, which is retried
+                        retries.append(args)
+        finally:
+            connections.close_all()
+
+    def check_counters(self, tournament, players):
+        errors = []
+        matches = Match.objects.filter(tournament=tournament)
+        for player in Player.objects.filter(pk__in=players):
+            counts = matches.aggregate(
+                wins=Count('pk', filter=Q(winner=player)),
+                games=Count('pk', filter=Q(player_one=player)) + Count('pk', filter=Q(player_two=player)))
+            if player.wins != counts['wins']:
+                errors.append(f'{player.username}: {player.wins} wins instead of {counts["wins"]}')
+            if player.total_games != counts['games']:
+                errors.append(f'{player.username}: {player.total_games} games instead of {counts["games"]}')
+
+        tournament.refresh_from_db()
+        for field, team_id in (('team_one_wins', tournament.team_one_id), ('team_two_wins', tournament.team_two_id)):
+            expected = matches.filter(winner__team=team_id).count()
+            if getattr(tournament, field) != expected:
+                errors.append(f'{field}: {getattr(tournament, field)} instead of {expected}')
+        return errors
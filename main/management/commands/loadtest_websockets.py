@@ -0,0 +1,324 @@
+import asyncio
+import datetime
+import json
+import random
+import threading
+import time
+import tracemalloc
+
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, connections
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from main.models import GroupStage, League, Manager, Match, Player, Race, Region, Season, Team, Tournament
+from main import broadcast, services
+
+
+# Websocket routes the simulated clients are spread over
+ROUTES = ('match', 'tournament_status', 'tournaments_admin', 'groups', 'information')
+
+# In-memory channel layers, so the harness runs without a Redis channel layer
+MEMORY_LAYERS = {
+    'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+    'topics': {'BACKEND': 'channels.layers.InMemoryChannelLayer'},
+}
+
+# Counters compared with a baseline run, and whether a higher value is better
+COMPARED = (
+    ('latency_ms', 'p50', False),
+    ('latency_ms', 'p99', False),
+    ('queries_per_change', 'mean', False),
+    ('memory_per_connection_bytes', None, False),
+    ('broadcast_throughput', 'deliveries_per_second', True),
+)
+
+
+def percentiles(values):
+    # Summary of a list of latencies in milliseconds
+    if not values:
+        return {'count': 0, 'p50': None, 'p90': None, 'p99': None, 'max': None}
+    values = sorted(values)
+    pick = lambda ratio: round(values[min(int(len(values) * ratio), len(values) - 1)] * 1000, 3)
+    return {'count': len(values), 'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99),
+            'max': round(values[-1] * 1000, 3)}
+
+
+class Client:
+    # Simulated websocket client reading the frames of one topic
+    def __init__(self, route, topic, path, first_message):
+        self.route = route
+        self.topic = topic
+        self.path = path
+        self.first_message = first_message
+        self.communicator = None
+        self.subscribed = asyncio.Event()
+        self.reader = None
+
+
+class Command(BaseCommand):
+    help = ('Opens simulated websocket clients on all routes in this process, drives match edits and '
+            'records update latency, queries per change, memory per connection and broadcast throughput')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=1000, help='Number of simulated websocket clients')
+        parser.add_argument('--edits', type=int, default=200, help='Number of edits')
+        parser.add_argument('--rate', type=float, default=20, help='Edits per second')
+        parser.add_argument('--tournaments', type=int, default=20, help='Number of tournaments of the season')
+        parser.add_argument('--layer', default='memory', choices=['memory', 'redis'],
+                            help='In-memory channel layers, or the configured CHANNEL_LAYERS')
+        parser.add_argument('--redis-db', type=int, default=15,
+                            help='Redis database of the topics, flushed before and after the run')
+        parser.add_argument('--settle', type=float, default=2, help='Seconds to wait for the last updates')
+        parser.add_argument('--output', help='JSON file of the results, loadtest-<time>.json by default')
+        parser.add_argument('--baseline', help='JSON file of a previous run to compare the results with')
+
+    def handle(self, *args, **options):
+        from server7x.asgi import application
+
+        # The clients and the edits use a throwaway database and Redis database
+        self.stdout.write(self.style.SUCCESS('Creating test database...'))
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        redis_url = settings.REDIS_URL.rsplit('/', 1)[0] + f"/{options['redis_db']}"
+        layers = MEMORY_LAYERS if options['layer'] == 'memory' else settings.CHANNEL_LAYERS
+        original_publish = broadcast.publish
+        try:
+            with override_settings(REDIS_URL=redis_url, CHANNEL_LAYERS=layers):
+                broadcast.get_redis().flushdb()
+                fixtures = self.create_fixtures(options['tournaments'])
+                # Recording when each version of a topic was caused, to measure the latency of clients
+                self.published = {}
+                self.current = threading.local()
+                broadcast.publish = self.recording_publish(original_publish)
+                results = asyncio.run(self.run(application, fixtures, options))
+                broadcast.get_redis().flushdb()
+        finally:
+            broadcast.publish = original_publish
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        results['config'] = {key: options[key] for key in ('clients', 'edits', 'rate', 'tournaments', 'layer')}
+        results['finished_at'] = timezone.now().isoformat()
+        output = options['output'] or f"loadtest-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+        with open(output, 'w') as file:
+            json.dump(results, file, indent=2)
+        self.report(results)
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                self.compare(results, json.load(file))
+        self.stdout.write(self.style.SUCCESS(f'Results written to {output}'))
+
+    def create_fixtures(self, tournament_count):
+        # One season of teams with a manager and two players each, tournaments between pairs of
+        # teams with two matches each, and one group of the first teams
+        admin = User.objects.create(username='loadtest-admin', is_staff=True)
+        region = Region.objects.create(name='Load test')
+        league = League.objects.create(name='Load test')
+        race = Race.objects.create(name='Load test')
+        season = Season.objects.create(
+            number=1, start_datetime=timezone.now(), is_finished=False, can_register=False)
+        group = GroupStage.objects.create(groupMark='A', season=season)
+        teams, managers = [], []
+        for i in range(tournament_count * 2):
+            user = User.objects.create(username=f'loadtest-manager-{i}')
+            team = Team.objects.create(name=f'Load test {i}', tag=f'L{i}', logo='', region=region, user=user)
+            Manager.objects.create(user=user, team=team)
+            for j in range(2):
+                Player.objects.create(username=f'Load test {i}.{j}', mmr=0, league=league, race=race,
+                                      wins=0, total_games=0, team=team, user=user)
+            teams.append(team)
+            managers.append((user.pk, Token.objects.create(user=user).key))
+        group.teams.set(teams[:4])
+
+        tournaments = []
+        for i in range(tournament_count):
+            team_one, team_two = teams[2 * i], teams[2 * i + 1]
+            tournament = Tournament.objects.create(
+                team_one=team_one, team_two=team_two, match_start_time=timezone.now(), season=season,
+                stage=1, is_finished=False, group=group if i < 2 else None)
+            matches = [Match.objects.create(tournament=tournament, user=admin).pk for _ in range(2)]
+            players = {
+                'player_one': list(Player.objects.filter(team=team_one).values_list('pk', flat=True)),
+                'player_two': list(Player.objects.filter(team=team_two).values_list('pk', flat=True)),
+            }
+            players['winner'] = players['player_one'] + players['player_two']
+            tournaments.append((tournament.pk, matches, players))
+        return {'admin_token': Token.objects.create(user=admin).key, 'managers': managers,
+                'tournaments': tournaments}
+
+    def recording_publish(self, publish):
+        # Wraps broadcast.publish to remember when the edit causing each version started
+        def recording(topic, message_type, payload, retain=False):
+            version = publish(topic, message_type, payload, retain)
+            self.published[(topic, version)] = getattr(self.current, 'started', None) or time.perf_counter()
+            return version
+        return recording
+
+    def make_clients(self, fixtures, count):
+        clients = []
+        for i in range(count):
+            route = ROUTES[i % len(ROUTES)]
+            if route == 'match':
+                tournament_id = random.choice(fixtures['tournaments'])[0]
+                client = Client(route, f'match_{tournament_id}', '/ws/match/', {
+                    'token': fixtures['admin_token'], 'action': 'subscribe', 'group': tournament_id,
+                    'version': None})
+            elif route == 'tournament_status':
+                user_id, token = random.choice(fixtures['managers'])
+                client = Client(route, f'manager_{user_id}', '/ws/tournament_status/', {
+                    'token': token, 'action': 'subscribe', 'group': user_id, 'version': None})
+            elif route == 'tournaments_admin':
+                client = Client(route, 'admin_tournaments', '/ws/tournaments_admin/', {
+                    'token': fixtures['admin_token'], 'action': 'subscribe', 'version': None})
+            elif route == 'groups':
+                client = Client(route, 'groups_standings', '/ws/groups/', {
+                    'token': fixtures['admin_token'], 'action': 'subscribe', 'version': None})
+            else:
+                client = Client(route, 'info', '/ws/information/?version=', None)
+            clients.append(client)
+        return clients
+
+    async def read(self, client, latencies):
+        # Reads the frames of a client, every frame after the first one is an update
+        queue = client.communicator.output_queue
+        while True:
+            message = await queue.get()
+            received = time.perf_counter()
+            if message['type'] != 'websocket.send':
+                continue
+            if message.get('text') == 'ping':
+                # Clients answer heartbeats, which also acknowledges the frames they read
+                await client.communicator.send_to(text_data='pong')
+                continue
+            frame = json.loads(message['text'])
+            if not client.subscribed.is_set():
+                client.subscribed.set()
+                continue
+            started = self.published.get((client.topic, frame.get('version')))
+            if started is not None:
+                latencies[client.route].append(received - started)
+
+    async def connect(self, application, client, latencies):
+        # Opens the connection of a client and subscribes it
+        client.communicator = WebsocketCommunicator(application, client.path)
+        await client.communicator.connect()
+        client.reader = asyncio.ensure_future(self.read(client, latencies))
+        if client.first_message is not None:
+            await client.communicator.send_json_to(client.first_message)
+
+    async def run(self, application, fixtures, options):
+        latencies = {route: [] for route in ROUTES}
+        clients = self.make_clients(fixtures, options['clients'])
+
+        # Opening the connections in batches, memory is traced until every client got its snapshot
+        self.stdout.write(self.style.SUCCESS(f"Opening {len(clients)} connections..."))
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        for offset in range(0, len(clients), 100):
+            await asyncio.gather(*(self.connect(application, client, latencies)
+                                   for client in clients[offset:offset + 100]))
+        await asyncio.wait([asyncio.ensure_future(client.subscribed.wait()) for client in clients], timeout=30)
+        connect_seconds = time.perf_counter() - started
+        memory_per_connection = (tracemalloc.get_traced_memory()[0] - memory_before) / len(clients)
+        tracemalloc.stop()
+        subscribed = sum(client.subscribed.is_set() for client in clients)
+
+        # Driving the edits at the requested rate, one at a time
+        self.stdout.write(self.style.SUCCESS(f"Running {options['edits']} edits at {options['rate']}/s..."))
+        queries = []
+        started = time.perf_counter()
+        for number in range(options['edits']):
+            delay = started + number / options['rate'] - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            queries.append(await database_sync_to_async(self.edit)(fixtures))
+        edits_seconds = time.perf_counter() - started
+        await asyncio.sleep(options['settle'])
+
+        for client in clients:
+            client.reader.cancel()
+        for offset in range(0, len(clients), 100):
+            await asyncio.gather(*(client.communicator.disconnect() for client in clients[offset:offset + 100]),
+                                 return_exceptions=True)
+
+        deliveries = sum(len(values) for values in latencies.values())
+        duration = edits_seconds + options['settle']
+        return {
+            'connections': {'requested': len(clients), 'subscribed': subscribed,
+                            'by_route': {route: sum(client.route == route for client in clients) for route in ROUTES}},
+            'connect_seconds': round(connect_seconds, 3),
+            'memory_per_connection_bytes': round(memory_per_connection),
+            'edits': len(queries),
+            'publishes': len(self.published),
+            'deliveries': deliveries,
+            'queries_per_change': {'mean': round(sum(queries) / len(queries), 2) if queries else None,
+                                   'max': max(queries, default=None)},
+            'latency_ms': percentiles([value for values in latencies.values() for value in values]),
+            'latency_ms_by_route': {route: percentiles(values) for route, values in latencies.items()},
+            'broadcast_throughput': {'deliveries_per_second': round(deliveries / duration, 1),
+                                     'publishes_per_second': round(len(self.published) / duration, 1)},
+        }
+
+    def edit(self, fixtures):
+        # Mostly match edits by managers, sometimes a new start time set by an admin. The queries of
+        # the edit and of the topics published on commit are counted
+        count = [0]
+
+        def counter(execute, sql, params, many, context):
+            count[0] += 1
+            return execute(sql, params, many, context)
+
+        tournament_id, matches, players = random.choice(fixtures['tournaments'])
+        self.current.started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(counter):
+                while True:
+                    try:
+                        if random.random() < 0.1:
+                            services.update_tournament(
+                                tournament_id, 'match_start_time',
+                                timezone.now() + datetime.timedelta(minutes=random.randint(0, 600)))
+                        else:
+                            column = random.choice(list(players))
+                            services.patch_match(
+                                random.choice(matches), tournament_id, column, random.choice(players[column]))
+                        break
+                    except OperationalError:
+                        # Lock timeouts roll back the whole edit, which is retried
+                        continue
+        finally:
+            self.current.started = None
+        return count[0]
+
+    def report(self, results):
+        self.stdout.write(
+            f"{results['connections']['subscribed']}/{results['connections']['requested']} clients subscribed "
+            f"in {results['connect_seconds']}s, {results['memory_per_connection_bytes']} bytes per connection")
+        self.stdout.write(
+            f"{results['edits']} edits, {results['publishes']} publishes, {results['deliveries']} deliveries, "
+            f"{results['queries_per_change']['mean']} queries per change")
+        self.stdout.write(f"{'route':<20}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        rows = list(results['latency_ms_by_route'].items()) + [('all', results['latency_ms'])]
+        for route, summary in rows:
+            self.stdout.write(f"{route:<20}{summary['count']:>8}" + ''.join(
+                f"{summary[key] if summary[key] is not None else '-':>10}" for key in ('p50', 'p90', 'p99', 'max')))
+        self.stdout.write(
+            f"{results['broadcast_throughput']['deliveries_per_second']} deliveries/s, "
+            f"{results['broadcast_throughput']['publishes_per_second']} publishes/s")
+
+    def compare(self, results, baseline):
+        # Showing the change of the main counters, regressions in red
+        for section, key, higher_is_better in COMPARED:
+            current = results[section] if key is None else results[section][key]
+            previous = baseline.get(section) if key is None else (baseline.get(section) or {}).get(key)
+            if current is None or not previous:
+                continue
+            change = (current - previous) / previous * 100
+            line = f"{section}{'.' + key if key else ''}: {previous} -> {current} ({change:+.1f}%)"
+            regressed = change < -5 if higher_is_better else change > 5
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from main import stats
+
+
+class Command(BaseCommand):
+    # Help message for the command
+    help = 'Recomputes the match statistics of getStatistics from all matches'
+
+    def handle(self, *args, **options):
+        # Replacing every counter in one transaction, readers keep seeing the previous ones meanwhile
+        counted = stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Statistics rebuilt from {counted} matches.'))
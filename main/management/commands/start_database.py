@@ -27,6 +27,10 @@ class Command(BaseCommand):
         # Loading league frames into the database.
         self.stdout.write(self.style.SUCCESS('Loading league frames...'))
         call_command('load_league_frames')
+
+        # Counting the existing matches into the statistics.
+        self.stdout.write(self.style.SUCCESS('Rebuilding statistics...'))
+        call_command('rebuild_statistics')
         
         # Displaying a success message indicating the successful completion of the database start process.
         self.stdout.write(self.style.SUCCESS('Database started successfully.'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from main import metrics
+
+
+class Command(BaseCommand):
+    # Help message for the command
+    help = 'Shows the send queue metrics of the websocket topic families, added up over all processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', default='depth', choices=['depth', 'sent', 'dropped', 'disconnected', 'lag'],
+                            help='Counter the topic families are sorted by')
+
+    def handle(self, *args, **options):
+        # Reading the counters written to Redis by the processes
+        totals = metrics.collect()
+        if not totals:
+            self.stdout.write(self.style.WARNING('No metrics written in the last intervals.'))
+            return
+
+        # Displaying one line per topic family, the busiest first
+        self.stdout.write(f"{'topic':<32}{'depth':>8}{'sent':>10}{'dropped':>10}{'disconnected':>14}{'lag':>8}")
+        for topic, counters in sorted(totals.items(), key=lambda item: item[1][options['sort']], reverse=True):
+            self.stdout.write(
+                f"{topic:<32}{counters['depth']:>8}{counters['sent']:>10}{counters['dropped']:>10}"
+                f"{counters['disconnected']:>14}{counters['lag']:>8.1f}")
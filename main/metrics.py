@@ -0,0 +1,150 @@
+# Import necessary modules
+import json
+import os
+import re
+import socket
+import time
+
+from django.conf import settings
+from main import broadcast, timers
+
+
+# Counters of the websocket topic families in this process, e.g. `match` for all the `match_<id>`
+# topics, so their number stays bounded however many tournaments and managers are served:
+# - depth: frames waiting in the send queues of the connections
+# - sent: frames sent to clients
+# - dropped: frames dropped from send queues, mostly when a full queue was collapsed to the
+#   latest version
+# - disconnected: connections closed for lagging behind
+# - lag: longest time in seconds a sent frame waited in its queue since the last flush
+_topics = {}
+
+# Suffix of the topics of one tournament or user, dropped from their family name
+_ID_SUFFIX = re.compile(r'_\d+$')
+
+
+def _counters(topic):
+    family = _ID_SUFFIX.sub('', topic)
+    counters = _topics.get(family)
+    if counters is None:
+        counters = _topics[family] = {'depth': 0, 'sent': 0, 'dropped': 0, 'disconnected': 0, 'lag': 0.0}
+    return counters
+
+
+def _metrics_key():
+    # Each process writes its own hash, readers add them up
+    return f'metrics:topics:{socket.gethostname()}:{os.getpid()}'
+
+
+# Function to record frames added to or removed from send queues
+def queued(topic, count):
+    """
+    Records frames added to a send queue, or removed from it with a negative count.
+
+    Args:
+        topic (str): Name of the topic.
+        count (int): Number of frames.
+
+    Returns:
+        None
+    """
+    _counters(topic)['depth'] += count
+    _schedule_flush()
+
+
+# Function to record a frame sent to a client
+def sent(topic, lag):
+    """
+    Records a frame sent to a client.
+
+    Args:
+        topic (str): Name of the topic.
+        lag (float): Seconds the frame waited in the send queue.
+
+    Returns:
+        None
+    """
+    counters = _counters(topic)
+    counters['sent'] += 1
+    counters['lag'] = max(counters['lag'], lag)
+    _schedule_flush()
+
+
+# Function to record frames dropped from a send queue
+def dropped(topic, count):
+    """
+    Records frames dropped from a send queue, e.g. when a full queue was collapsed.
+
+    Args:
+        topic (str): Name of the topic.
+        count (int): Number of dropped frames.
+
+    Returns:
+        None
+    """
+    _counters(topic)['dropped'] += count
+    _schedule_flush()
+
+
+# Function to record a connection closed for lagging behind
+def disconnected(topic):
+    """
+    Records a connection closed because its client stayed behind for too long.
+
+    Args:
+        topic (str): Name of the topic.
+
+    Returns:
+        None
+    """
+    _counters(topic)['disconnected'] += 1
+    _schedule_flush()
+
+
+def _schedule_flush():
+    # Changes are written to Redis at most once per interval, the deadline is only set once
+    heap = timers.get_heap()
+    if ('metrics',) not in heap:
+        heap.schedule(('metrics',), settings.WEBSOCKET_METRICS_INTERVAL, flush)
+
+
+# Function to write the counters of this process to Redis
+async def flush():
+    """
+    Writes the counters of this process to its Redis hash, one JSON field per topic family.
+
+    The hash expires when the process stops flushing, after a quiet period or when it exits, and
+    the lag is reset for the next interval.
+
+    Returns:
+        None
+    """
+    if not _topics:
+        return
+    key = _metrics_key()
+    mapping = {topic: json.dumps(dict(counters, time=time.time())) for topic, counters in _topics.items()}
+    for counters in _topics.values():
+        counters['lag'] = 0.0
+    client = broadcast.get_async_redis()
+    await client.hset(key, mapping=mapping)
+    await client.expire(key, settings.WEBSOCKET_METRICS_INTERVAL * 6)
+
+
+# Function to read the counters of all processes
+def collect():
+    """
+    Reads and adds up the counters of all processes from Redis.
+
+    Returns:
+        dict: Dictionary mapping topic families to their counters, the lag being the longest one.
+    """
+    client = broadcast.get_redis()
+    totals = {}
+    for key in client.scan_iter('metrics:topics:*'):
+        for topic, value in client.hgetall(key).items():
+            counters = json.loads(value)
+            total = totals.setdefault(topic, {'depth': 0, 'sent': 0, 'dropped': 0, 'disconnected': 0, 'lag': 0.0})
+            for name in ('depth', 'sent', 'dropped', 'disconnected'):
+                total[name] += counters[name]
+            total['lag'] = max(total['lag'], counters['lag'])
+    return totals
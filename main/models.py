@@ -76,6 +76,12 @@ class Tournament(models.Model):
     next_stage_tournament = models.ForeignKey(
         'Tournament', on_delete=models.CASCADE, null=True, blank=True, default=None, related_name='next_stage_tournament_related_name')
 
+    class Meta:
+        indexes = [
+            # Bracket lookups of the sibling and the parent of a tournament
+            models.Index(fields=['season', 'stage', 'inline_number']),
+        ]
+
     def __str__(self):
         # Returns a string representation of the tournament
         return f"{self.group if self.group else self.season}{f'[{self.stage}]' if not self.group else ''}:  {self.team_one} vs {self.team_two}"
@@ -263,4 +269,26 @@ class Map(models.Model):
 
     def __str__(self):
         # Returns a string representation of the map
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+# Model for the match statistics, maintained on every change of a match, see main.stats
+class MatchStatistic(models.Model):
+    # IDs of the season, the map and the races, 0 when the match has none. The races of the
+    # players are ordered, so a matchup has one row whoever plays first
+    season = models.IntegerField()
+    map = models.IntegerField()
+    race_one = models.IntegerField()
+    race_two = models.IntegerField()
+    winner_race = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['season', 'map', 'race_one', 'race_two', 'winner_race'],
+                                    name='unique_match_statistic'),
+        ]
+
+    def __str__(self):
+        # Returns a string representation of the statistic
+        return f"{self.season}/{self.map}: {self.race_one} vs {self.race_two}, {self.winner_race} won {self.count}"
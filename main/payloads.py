@@ -0,0 +1,390 @@
+# Import necessary modules
+from collections import namedtuple
+
+from django.db.models import Q, Exists, OuterRef, Count
+from django.utils import timezone
+from main.models import Tournament, Match, Manager, Season, Map, PlayerToTournament, GroupStage, Player
+from main import broadcast, seasons
+from main.serializers import MatchesSerializer, TeamsSerializer
+from main.utils import get_season_data
+
+
+# Function to build the match list of a tournament
+def match_list(tournament_id):
+    """
+    Builds the list of matches of a tournament sent to `/ws/match/` subscribers.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+
+    Returns:
+        list: Serialized matches of the tournament.
+    """
+    matches = Match.objects.filter(tournament=tournament_id)
+    return MatchesSerializer(matches, many=True).data
+
+
+# Function to get the cached match detail of a tournament
+def match_detail(tournament_id):
+    """
+    Retrieves the match list of a tournament, fetched on demand by feeds carrying only summaries.
+
+    The list is the snapshot retained for the `match_<id>` topic, so it is built once and
+    replaced only when the matches of the tournament change.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+
+    Returns:
+        str or None: JSON encoded match list, or None if the tournament doesn't exist.
+    """
+    topic = f'match_{tournament_id}'
+    _, text = broadcast.latest(topic)
+    if text is None:
+        # Only existing tournaments get a snapshot kept in Redis
+        if not Tournament.objects.filter(pk=tournament_id).exists():
+            return None
+        _, text = broadcast.snapshot(topic, 'new_match_list', lambda: match_list(tournament_id))
+    return text
+
+
+# Function to build the tournament feed of a manager
+def manager_feed(user_id):
+    """
+    Builds the tournament feed sent to `/ws/tournament_status/` subscribers of a manager.
+
+    The feed contains the tournaments of the manager's team in the current season and
+    the maps of the season. Finished tournaments only carry the number of their matches, the
+    matches themselves are fetched on demand, see match_detail.
+
+    Args:
+        user_id (int): ID of the manager's user.
+
+    Returns:
+        dict: Dictionary with 'tournaments' and 'maps' lists.
+    """
+    try:
+        # Get the current season that is not finished
+        season = seasons.current_season()
+        # Get the team associated with the manager
+        team = Manager.objects.select_related('team').get(user=user_id).team
+    except (Season.DoesNotExist, Manager.DoesNotExist):
+        return {'tournaments': [], 'maps': []}
+
+    # Get tournaments involving the team in the current season, ordered by match start time
+    tournaments = Tournament.objects.filter(
+        Q(team_one=team) | Q(team_two=team), season=season).select_related(
+        'team_one', 'team_two', 'winner', 'asked_team').annotate(
+        matches_count=Count('match')).order_by('match_start_time')
+
+    # Prepare response data to send to clients
+    response_data = []
+    for tournament in tournaments:
+        # Determine opponent team and team number
+        opponent = tournament.team_two if tournament.team_one == team else tournament.team_one
+        team_in_tour_num = 1 if tournament.team_one == team else 2
+
+        # Serialize opponent team data
+        opponent_data = TeamsSerializer(opponent).data
+
+        # Get players of opponent team participating in the tournament
+        opp_players_to_tournament = PlayerToTournament.objects.filter(
+            user=opponent.user_id, Season=season).select_related('player')
+        opponent_data['players'] = [{
+            'id': player.player.id,
+            'username': player.player.username
+        } for player in opp_players_to_tournament]
+
+        # Determine if the team has been asked for finishing the tournament
+        asked_team = True if tournament.asked_team == team else False if tournament.ask_for_finished else None
+
+        # Prepare data for tournaments
+        if not tournament.is_finished:
+            response_data.append({
+                'id': tournament.id,
+                'startTime': tournament.match_start_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'opponent': opponent_data,
+                'isFinished': tournament.is_finished,
+                'teamInTournament': team_in_tour_num,
+                'askForFinished': tournament.ask_for_finished,
+                'teamOneWins': tournament.team_one_wins,
+                'teamTwoWins': tournament.team_two_wins,
+                'askedTeam': asked_team,
+                'tournamentInGroup': True if tournament.group_id is not None else False,
+            })
+        else:
+            # If tournament is finished, include the number of matches
+            response_data.append({
+                'id': tournament.id,
+                'startTime': tournament.match_start_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'opponent': opponent_data,
+                'isFinished': tournament.is_finished,
+                'teamInTournament': team_in_tour_num,
+                'teamOneWins': tournament.team_one_wins,
+                'teamTwoWins': tournament.team_two_wins,
+                'matchesCount': tournament.matches_count,
+                'winner': tournament.winner_id,
+                'tournamentInGroup': True if tournament.group_id is not None else False,
+            })
+
+    maps_data = [{
+        'id': map.id,
+        'name': map.name
+    } for map in Map.objects.filter(seasons=season)]
+
+    return {
+        'tournaments': response_data,
+        'maps': maps_data
+    }
+
+
+# Function to build the tournament list of the current season for admins
+def admin_tournaments():
+    """
+    Builds the tournament list sent to `/ws/admin/` subscribers.
+
+    Args:
+        None
+
+    Returns:
+        dict: Dictionary with 'tournaments' and 'maps' lists of the current season.
+    """
+    try:
+        # Get the current ongoing season
+        season = seasons.current_season()
+    except Season.DoesNotExist:
+        return {'tournaments': [], 'maps': []}
+
+    # Get all tournaments of the season, flagging those with matches in the same query.
+    # They are ordered by ID, so windows of the list are stable across versions
+    tournaments = Tournament.objects.filter(season=season).select_related(
+        'team_one', 'team_two').annotate(
+        matches_exists=Exists(Match.objects.filter(tournament=OuterRef('pk')))).order_by('id')
+
+    # Prepare tournament data to be sent as response
+    tournaments_data = [{
+        'id': tournament.id,
+        'season': season.number,
+        'startTime': tournament.match_start_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'isFinished': tournament.is_finished,
+        'teamOne': tournament.team_one_id,
+        'teamOneName': tournament.team_one.name,
+        'teamOneWins': tournament.team_one_wins,
+        'teamTwo': tournament.team_two_id,
+        'teamTwoName': tournament.team_two.name,
+        'teamTwoWins': tournament.team_two_wins,
+        'stage': tournament.stage,
+        'group': tournament.group_id,
+        'winner': tournament.winner_id,
+        'askedTeam': tournament.asked_team_id,
+        'askForFinished': tournament.ask_for_finished,
+        'matchesExists': tournament.matches_exists,
+        'inlineNumber': tournament.inline_number
+    } for tournament in tournaments]
+
+    maps_data = [{
+        'id': map.id,
+        'name': map.name
+    } for map in Map.objects.filter(seasons=season)]
+
+    return {
+        'tournaments': tournaments_data,
+        'maps': maps_data
+    }
+
+
+# Largest number of tournaments in a window of the admin list
+ADMIN_WINDOW_MAX = 200
+
+
+class TournamentWindow(namedtuple('TournamentWindow', ['stage', 'group', 'offset', 'limit'])):
+    """
+    Slice of the admin tournament list viewed by an admin.
+
+    The tournaments are filtered by stage and/or group, then the page [offset, offset + limit)
+    is kept. Windows are hashable, so admins viewing the same window share its encoded slice.
+    """
+    @classmethod
+    def parse(cls, data):
+        """
+        Reads a window sent by a client, e.g. {"stage": 1, "offset": 0, "limit": 50}.
+
+        Args:
+            data (dict): Window with optional 'stage', 'group', 'offset' and 'limit' keys.
+
+        Returns:
+            TournamentWindow: The window.
+
+        Raises:
+            ValueError: If a value isn't an integer in its range.
+        """
+        if not isinstance(data, dict):
+            raise ValueError('Window must be an object')
+        stage, group = data.get('stage'), data.get('group')
+        offset, limit = data.get('offset', 0), data.get('limit', ADMIN_WINDOW_MAX)
+        for value in (stage, group):
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+                raise ValueError('Stage and group must be integers')
+        for value in (offset, limit):
+            if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+                raise ValueError('Offset and limit must be positive integers')
+        return cls(stage, group, offset, min(limit, ADMIN_WINDOW_MAX))
+
+    def apply(self, payload):
+        """
+        Keeps the tournaments of the window in an admin tournament list.
+
+        Args:
+            payload (dict): Payload built by admin_tournaments.
+
+        Returns:
+            dict: Payload with the tournaments of the window, the maps, and a 'window' key with
+                the offset, the limit and the number of tournaments matching the filter.
+        """
+        tournaments = [
+            tournament for tournament in payload['tournaments']
+            if (self.stage is None or tournament['stage'] == self.stage)
+            and (self.group is None or tournament['group'] == self.group)
+        ]
+        return {
+            'tournaments': tournaments[self.offset:self.offset + self.limit],
+            'maps': payload['maps'],
+            'window': {'offset': self.offset, 'limit': self.limit, 'total': len(tournaments)}
+        }
+
+
+# Function to count the tournaments of the current season
+def admin_counts():
+    """
+    Counts the tournaments of the current season sent to `admin_counts` subscribers, so admins
+    viewing a window of the list still see the totals.
+
+    Returns:
+        dict: Dictionary with 'total' and 'finished' counts, and the same counts by stage and by
+            group under 'stages' and 'groups'.
+    """
+    counts = {'total': 0, 'finished': 0, 'stages': {}, 'groups': {}}
+    try:
+        season = seasons.current_season()
+    except Season.DoesNotExist:
+        return counts
+
+    # One aggregate query over the stages and groups of the season
+    rows = Tournament.objects.filter(season=season).values('stage', 'group').annotate(
+        total=Count('id'), finished=Count('id', filter=Q(is_finished=True)))
+    for row in rows:
+        buckets = [counts, counts['stages'].setdefault(str(row['stage']), {'total': 0, 'finished': 0})]
+        if row['group'] is not None:
+            buckets.append(counts['groups'].setdefault(str(row['group']), {'total': 0, 'finished': 0}))
+        for bucket in buckets:
+            bucket['total'] += row['total']
+            bucket['finished'] += row['finished']
+    return counts
+
+
+# Function to build the group standings of the current season
+def group_standings():
+    """
+    Builds the number of wins of each team in each group sent to `/ws/groups/` subscribers.
+
+    Args:
+        None
+
+    Returns:
+        dict or None: Dictionary mapping group IDs to dictionaries of team IDs and wins,
+            or None if the current season has no groups.
+    """
+    try:
+        # Getting the active season that is not finished
+        season = seasons.current_season()
+    except Season.DoesNotExist:
+        return None
+
+    # Counting wins of each team in the group tournaments of the season
+    wins = {}
+    winners = Tournament.objects.filter(
+        season=season, group__isnull=False, winner__isnull=False).values_list('winner_id', flat=True)
+    for winner_id in winners:
+        wins[winner_id] = wins.get(winner_id, 0) + 1
+
+    # Collecting teams of each group with their wins
+    groups_data = {}
+    for group in GroupStage.objects.filter(season=season).prefetch_related('teams'):
+        groups_data[str(group.pk)] = {
+            str(team.pk): wins.get(team.pk, 0) for team in group.teams.all()
+        }
+
+    return groups_data or None
+
+
+# Function to count the players of the leagues shown on the landing page
+def players_by_league():
+    """
+    Counts the players of the grandmaster, master and diamond leagues.
+
+    Returns:
+        dict: Dictionary mapping league IDs ('7', '6', '5') to player counts.
+    """
+    counts = {'7': 0, '6': 0, '5': 0}
+    rows = Player.objects.filter(league__in=[7, 6, 5]).values('league').annotate(count=Count('id'))
+    for row in rows:
+        counts[str(row['league'])] = row['count']
+    return counts
+
+
+# Function to summarize the last finished seasons
+def previous_seasons():
+    """
+    Summarizes the last two finished seasons.
+
+    Returns:
+        dict: Dictionary mapping season numbers to their tournament count and winner name.
+    """
+    finished = Season.objects.filter(is_finished=True).select_related('winner').annotate(
+        tournaments_count=Count('tournament')).order_by('-number')[:2]
+    return {
+        str(season.number): {
+            'tournamentsCount': season.tournaments_count,
+            'winner': season.winner.name if season.winner else None
+        } for season in finished
+    }
+
+
+# Function to build the landing page snapshot
+def info_snapshot():
+    """
+    Builds the landing page data sent to `/ws/information/` subscribers and `getInfo` requests.
+
+    The 'state' key tells the current season state: 0 when no season is open for registration or
+    running, 1 while registration is open and 2 once the season has started.
+
+    Returns:
+        dict: Dictionary with the season state, previous seasons and players by league.
+    """
+    info = {
+        'state': 0,
+        'previusSeasons': previous_seasons(),
+        'playersByLeague': players_by_league()
+    }
+    try:
+        season = seasons.current_season()
+    except Season.DoesNotExist:
+        return info
+
+    if season.start_datetime > timezone.now():
+        # The season has not started yet, registration may be open
+        if season.can_register:
+            info['state'] = 1
+            info['season'] = season.number
+        return info
+
+    # The season has started, include its groups and playoff
+    groups_data, playoff_data = get_season_data(season.number)
+    if groups_data:
+        info['state'] = 2
+        info['startedSeason'] = {
+            'groups': groups_data,
+            'playoff': playoff_data
+        }
+        info['season'] = season.number
+    return info
@@ -1,4 +1,6 @@
-from rest_framework import permissions    
+from rest_framework import permissions
+from main.auth import request_identity
+from main.models import Player
 
 class IsAdminOrReadOnly(permissions.BasePermission):
     """
@@ -20,7 +22,8 @@ class IsAdminOrReadOnly(permissions.BasePermission):
             # Allow read-only access for safe methods (GET, HEAD, OPTIONS).
             return True
         # Allow modification only if the user is an admin.
-        return bool(request.user and request.user.is_staff)
+        identity = request_identity(request)
+        return identity is not None and identity.is_staff
 
 
 class IsAdminOrOwnerOrReadOnly(permissions.BasePermission):
@@ -44,7 +47,10 @@ class IsAdminOrOwnerOrReadOnly(permissions.BasePermission):
             # Allow read-only access for safe methods (GET, HEAD, OPTIONS).
             return True
         # Allow modification if the user is the owner of the object or is an admin.
-        return obj.user == request.user or bool(request.user and request.user.is_staff)
+        identity = request_identity(request)
+        if identity is None:
+            return False
+        return obj.user_id == identity.user_id or identity.is_staff
 
 
 class CanEditMatchField(permissions.BasePermission):
@@ -68,7 +74,13 @@ class CanEditMatchField(permissions.BasePermission):
             return True
         
         # Allow modification if the user is one of the players or is an admin.
-        if request.user and obj.player_one and obj.player_two:
-            if (request.user == obj.player_one.user) or (request.user == obj.player_two.user):
-                return True
-        return bool(request.user and request.user.is_staff)
+        identity = request_identity(request)
+        if identity is None:
+            return False
+        if identity.is_staff:
+            return True
+        if obj.player_one_id is None or obj.player_two_id is None:
+            return False
+        # The users of both players are compared with one query, without loading the players
+        return Player.objects.filter(
+            pk__in=[obj.player_one_id, obj.player_two_id], user_id=identity.user_id).exists()
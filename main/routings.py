@@ -7,4 +7,5 @@ websocket_routes = [
         path('ws/tournaments_admin/', AdminConsumer.as_asgi()),
         path('ws/groups/', groupsConsumer.as_asgi()),
         path('ws/information/', InfoConsumer.as_asgi()),
+        path('ws/topics/', TopicsConsumer.as_asgi()),
     ]
\ No newline at end of file
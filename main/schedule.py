@@ -0,0 +1,96 @@
+# Import necessary modules
+import time
+
+from django.db.models import Min
+from django.utils import timezone
+from main.models import Season, Tournament
+from main import broadcast, payloads, scoreboard
+
+
+# Redis hash of the planned refreshes: topic -> timestamp of the boundary they run at
+PLANNED_KEY = 'schedule:planned'
+
+# Functions recomputing and publishing the topics refreshed at their boundaries: topic -> function
+_refreshers = {}
+
+
+# Function to refresh a topic at the boundaries of its payload
+def register(topic, boundary, refresh):
+    """
+    Registers a retained topic whose payload changes with time.
+
+    Its retained payload expires at the next boundary and a Celery task refreshes it at that time,
+    which plans the refresh at the following boundary when it publishes.
+
+    Args:
+        topic (str): Name of the retained topic.
+        boundary (callable): Function without arguments returning the next time the payload changes
+            without any write, or None if it doesn't.
+        refresh (callable): Function without arguments recomputing and publishing the payload.
+
+    Returns:
+        None
+    """
+    _refreshers[topic] = refresh
+    broadcast.expire_at_boundary(topic, boundary, plan)
+
+
+# Function to plan the refresh of a topic
+def plan(topic, at):
+    """
+    Schedules the refresh of a topic at a boundary, unless one is already planned before it.
+
+    The earlier refresh plans the following one, so a topic has a single pending refresh at a time
+    however many tournaments are upcoming.
+
+    Args:
+        topic (str): Name of the registered topic.
+        at (datetime): Time of the boundary.
+
+    Returns:
+        None
+    """
+    client = broadcast.get_redis()
+    planned = client.hget(PLANNED_KEY, topic)
+    timestamp = at.timestamp()
+    if planned is not None and time.time() < float(planned) <= timestamp:
+        return
+    client.hset(PLANNED_KEY, topic, timestamp)
+    # Imported here, main.tasks runs the refreshes of this module
+    from main import tasks
+    tasks.refresh_topic.apply_async(args=[topic], eta=at)
+
+
+# Function to refresh a topic
+def refresh(topic):
+    """
+    Recomputes and publishes the payload of a registered topic, run at its boundaries.
+
+    Args:
+        topic (str): Name of the registered topic.
+
+    Returns:
+        None
+    """
+    _refreshers[topic]()
+
+
+def season_start():
+    # The landing page changes when the open season starts
+    return Season.objects.filter(
+        is_finished=False, start_datetime__gt=timezone.now()).aggregate(start=Min('start_datetime'))['start']
+
+
+def tournament_start():
+    # The scoreboard changes when the next tournament starts
+    return Tournament.objects.filter(
+        is_finished=False, match_start_time__gt=timezone.now()).aggregate(start=Min('match_start_time'))['start']
+
+
+def _publish_info():
+    broadcast.publish('info', 'send_groups', payloads.info_snapshot(), retain=True)
+
+
+# The retained topics whose payload depends on the current time
+register('info', season_start, _publish_info)
+register('scoreboard', tournament_start, scoreboard.republish)
@@ -0,0 +1,188 @@
+# Import necessary modules
+import datetime
+import json
+import threading
+
+from django.utils import timezone
+from rest_framework import serializers
+from main.models import Match, Tournament
+from main import broadcast
+
+
+# Redis hash of the live tournaments: tournament ID -> JSON encoded scoreboard entry
+SCOREBOARD_KEY = 'scoreboard:tournaments'
+
+# Tournaments changed by the transaction of the current thread, refreshed once it commits
+_pending = threading.local()
+
+# Same format as the start times returned by TournamentsSerializer
+_start_time_field = serializers.DateTimeField()
+
+
+def _sort_key(entry):
+    # Entries are ordered by start time, parsed since the encoded times may omit the microseconds
+    return datetime.datetime.fromisoformat(entry['match_start_time'].replace('Z', '+00:00')), entry['id']
+
+
+def _entries(tournaments):
+    # Builds the entries of live tournaments, with the winners of their matches in one query
+    winners = {tournament.pk: [] for tournament in tournaments}
+    matches = Match.objects.filter(tournament__in=list(winners)).order_by('pk').values_list('tournament_id', 'winner_id')
+    for tournament_id, winner_id in matches:
+        winners[tournament_id].append(winner_id)
+    return {
+        tournament.pk: {
+            'id': tournament.pk,
+            'season': tournament.season.number,
+            'match_start_time': _start_time_field.to_representation(tournament.match_start_time),
+            'is_finished': tournament.is_finished,
+            'team_one': tournament.team_one_id,
+            'team_one_wins': tournament.team_one_wins,
+            'team_two': tournament.team_two_id,
+            'team_two_wins': tournament.team_two_wins,
+            'stage': tournament.stage,
+            'group': tournament.group_id,
+            'match_winners': winners[tournament.pk]
+        } for tournament in tournaments
+    }
+
+
+# Function to refresh the scoreboard entries of tournaments
+def refresh(tournament_ids):
+    """
+    Recomputes the scoreboard entries of some tournaments and publishes the scoreboard.
+
+    Only the given tournaments are read from the database: live ones are written to the Redis hash
+    and the others are removed from it. Upcoming ones join the scoreboard when its retained payload
+    expires at their start, see main.schedule.
+
+    Args:
+        tournament_ids (iterable): IDs of the changed tournaments.
+
+    Returns:
+        int or None: Version of the published scoreboard, None if no entry changed.
+    """
+    tournament_ids = list(set(tournament_ids))
+    if not tournament_ids:
+        return None
+    if broadcast.latest('scoreboard')[1] is None:
+        # The scoreboard was never built or Redis lost it, so it is built whole
+        return republish()
+    now = timezone.now()
+    tournaments = list(Tournament.objects.filter(pk__in=tournament_ids).select_related('season'))
+    live = [tournament for tournament in tournaments
+            if not tournament.is_finished and tournament.match_start_time <= now]
+    entries = {key: json.dumps(entry) for key, entry in _entries(live).items()}
+
+    upcoming = any(not tournament.is_finished and tournament.match_start_time > now for tournament in tournaments)
+
+    client = broadcast.get_redis()
+    # Changes of upcoming or finished tournaments don't change the scoreboard
+    current = dict(zip(tournament_ids, client.hmget(SCOREBOARD_KEY, tournament_ids)))
+    changed = [tournament_id for tournament_id in tournament_ids if current[tournament_id] != entries.get(tournament_id)]
+    if not changed:
+        if upcoming:
+            # An upcoming tournament may start before the scoreboard expires
+            broadcast.move_boundary('scoreboard')
+        return None
+    pipeline = client.pipeline()
+    for tournament_id in changed:
+        if tournament_id in entries:
+            pipeline.hset(SCOREBOARD_KEY, tournament_id, entries[tournament_id])
+        else:
+            pipeline.hdel(SCOREBOARD_KEY, tournament_id)
+    pipeline.execute()
+    return publish()
+
+
+# Function to rebuild the whole scoreboard
+def rebuild():
+    """
+    Rebuilds the scoreboard from all live tournaments, e.g. after Redis lost it.
+
+    Returns:
+        list: The scoreboard, see payload.
+    """
+    now = timezone.now()
+    tournaments = Tournament.objects.filter(is_finished=False).select_related('season')
+    live = [tournament for tournament in tournaments if tournament.match_start_time <= now]
+    entries = _entries(live)
+    client = broadcast.get_redis()
+    pipeline = client.pipeline()
+    pipeline.delete(SCOREBOARD_KEY)
+    if entries:
+        pipeline.hset(SCOREBOARD_KEY, mapping={key: json.dumps(entry) for key, entry in entries.items()})
+    pipeline.execute()
+    return sorted(entries.values(), key=_sort_key)
+
+
+# Function to rebuild and publish the whole scoreboard
+def republish():
+    """
+    Rebuilds the scoreboard from all live tournaments and publishes it.
+
+    Returns:
+        int: Version of the published scoreboard.
+    """
+    rebuild()
+    return publish()
+
+
+# Function to build the scoreboard from the Redis hash
+def payload():
+    """
+    Builds the scoreboard sent to `scoreboard` subscribers and `get_current_tournaments` requests.
+
+    Returns:
+        list: Entries of the tournaments started and not finished, ordered by start time, with the
+            fields of TournamentsSerializer and the winners of their matches under 'match_winners'.
+    """
+    entries = [json.loads(entry) for entry in broadcast.get_redis().hvals(SCOREBOARD_KEY)]
+    return sorted(entries, key=_sort_key)
+
+
+# Function to publish the scoreboard
+def publish():
+    """
+    Publishes the scoreboard kept in Redis as the retained snapshot of the `scoreboard` topic.
+
+    Returns:
+        int: Version of the published scoreboard.
+    """
+    return broadcast.publish('scoreboard', 'send_tournaments', payload(), retain=True)
+
+
+# Function to get the encoded scoreboard
+def snapshot():
+    """
+    Retrieves the encoded scoreboard, rebuilding it if Redis has none.
+
+    Returns:
+        tuple: (version, JSON encoded scoreboard).
+    """
+    return broadcast.snapshot('scoreboard', 'send_tournaments', rebuild)
+
+
+# Function to refresh tournaments once the current transaction is committed
+def refresh_on_commit(tournament_id):
+    """
+    Refreshes the scoreboard entry of a tournament after commit, all the tournaments changed by a
+    transaction are refreshed and published together.
+
+    Args:
+        tournament_id (int): ID of the changed tournament.
+
+    Returns:
+        None
+    """
+    ids = getattr(_pending, 'ids', None)
+    if ids is None:
+        ids = _pending.ids = set()
+    # Ids left by a rolled back transaction are refreshed with the next one, which is harmless
+    ids.add(tournament_id)
+    broadcast.on_commit_once('scoreboard', _refresh_pending)
+
+
+def _refresh_pending():
+    ids, _pending.ids = _pending.ids, set()
+    refresh(ids)
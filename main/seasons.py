@@ -0,0 +1,144 @@
+# Import necessary modules
+import contextvars
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from main.models import Season
+from main import broadcast
+
+
+# Cache key of the current season, its value is a dict of field values or NO_SEASON
+CACHE_KEY = 'season:current'
+# Cached value marking that no season is open
+NO_SEASON = 0
+# Redis channel telling every process to drop its cached season
+INVALIDATION_CHANNEL = 'season:invalidate'
+# Key of the commit hook invalidating the caches, also marking a transaction that changed a season
+HOOK_KEY = 'season:invalidate'
+
+# Current season cached by this process: (cached value, time it was read), trusted only while the
+# invalidation listener runs
+_local = None
+_local_lock = threading.Lock()
+# Number of invalidations received, so a season read before one of them isn't kept after it
+_generation = 0
+
+# Current season of the request being processed, see CurrentSeasonMiddleware
+_memo = contextvars.ContextVar('current_season', default=None)
+
+
+def _values(season):
+    # Field values of a season, as they are cached
+    return {field.attname: getattr(season, field.attname) for field in Season._meta.concrete_fields}
+
+
+def _instance(values):
+    # Builds a season from its cached field values, without any query
+    if values == NO_SEASON:
+        raise Season.DoesNotExist('No current season')
+    return Season.from_db(DEFAULT_DB_ALIAS, list(values), list(values.values()))
+
+
+def _forget(data=None):
+    # Drops the season cached by this process
+    global _local, _generation
+    with _local_lock:
+        _local = None
+        _generation += 1
+
+
+# Receives the invalidations sent by every process
+_listener = broadcast.InvalidationListener(INVALIDATION_CHANNEL, _forget, _forget)
+
+
+def _resolve():
+    # Reads the current season from the process cache, then Redis, then the database
+    global _local
+    listening = _listener.running()
+    local = _local
+    if listening and local is not None and time.monotonic() - local[1] < settings.SEASON_CACHE_TTL:
+        return local[0]
+    read, generation = time.monotonic(), _generation
+    values = cache.get(CACHE_KEY)
+    if values is None:
+        try:
+            values = _values(Season.objects.get(is_finished=False))
+        except Season.DoesNotExist:
+            values = NO_SEASON
+        cache.set(CACHE_KEY, values, settings.SEASON_CACHE_TTL)
+    if listening:
+        with _local_lock:
+            if generation == _generation:
+                _local = (values, read)
+    return values
+
+
+# Function to get the current season
+def current_season():
+    """
+    Retrieves the season that isn't finished, like `Season.objects.get(is_finished=False)`.
+
+    The season is cached in this process and in Redis, and memoized for the request being
+    processed, so a request runs at most one query for it and usually none. Saving or deleting a
+    season invalidates the caches of every process once committed, and a transaction that changed
+    a season reads it from the database until it is committed.
+
+    Returns:
+        Season: The current season, a fresh instance on every call.
+
+    Raises:
+        Season.DoesNotExist: If no season is open.
+        Season.MultipleObjectsReturned: If several seasons are open.
+    """
+    if broadcast.hook_pending(HOOK_KEY):
+        return Season.objects.get(is_finished=False)
+    memo = _memo.get()
+    if memo is not None and 'season' in memo:
+        return _instance(memo['season'])
+    values = _resolve()
+    if memo is not None:
+        memo['season'] = values
+    return _instance(values)
+
+
+# Function to invalidate the cached current season
+def invalidate():
+    """
+    Drops the cached current season in every process after a season changed.
+
+    The caches are dropped at once and again after commit: the transaction reads the season from
+    the database meanwhile, and other transactions can't keep the season as it was before.
+
+    Returns:
+        None
+    """
+    if transaction.get_connection().in_atomic_block:
+        _drop()
+    broadcast.on_commit_once(HOOK_KEY, _drop)
+
+
+def _drop():
+    _forget()
+    memo = _memo.get()
+    if memo is not None:
+        memo.pop('season', None)
+    cache.delete(CACHE_KEY)
+    _listener.publish()
+
+
+class CurrentSeasonMiddleware:
+    """
+    Django middleware memoizing the current season for the duration of a request.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _memo.set({})
+        try:
+            return self.get_response(request)
+        finally:
+            _memo.reset(token)
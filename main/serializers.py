@@ -4,6 +4,7 @@ from djoser.serializers import UserSerializer, TokenSerializer
 from rest_framework import status
 from django.contrib.auth import get_user_model
 from main.models import *
+from main import auth, seasons
 import re
 from django.utils import timezone
 
@@ -88,7 +89,7 @@ class TournamentsSerializer(serializers.ModelSerializer):
     def get_season(self, obj):
         if hasattr(obj, 'season'):
             return obj.season.number
-        return Season.objects.get(is_finished=False).number
+        return seasons.current_season().number
 
     # Method to check if tournament is finished
     def get_is_finished(self, obj):
@@ -99,7 +100,7 @@ class TournamentsSerializer(serializers.ModelSerializer):
     # Method to create a new tournament
     def create(self, validated_data):
         is_finished = False
-        season = Season.objects.get(is_finished=False)
+        season = seasons.current_season()
         tournament = Tournament.objects.create(
             season=season, is_finished=is_finished, **validated_data)
         return tournament
@@ -297,9 +298,11 @@ class TournamentRegistrationSerializer(serializers.ModelSerializer):
         if season.is_finished:
             raise serializers.ValidationError(
                 "Season is already finished", code=status.HTTP_400_BAD_REQUEST)
-        try:
-            manager = Manager.objects.get(user=user, team=team)
-        except Manager.DoesNotExist:
+        # A manager registering their own team is known from the identity of the request
+        request = self.context.get('request')
+        identity = auth.request_identity(request) if request is not None else None
+        own_team = identity is not None and str(identity.user_id) == str(user) and str(identity.team_id) == str(team)
+        if not own_team and not Manager.objects.filter(user=user, team=team).exists():
             raise serializers.ValidationError(
                 "You can only register for your team", code=status.HTTP_403_FORBIDDEN)
 
@@ -0,0 +1,651 @@
+# Import necessary modules
+from django.core.exceptions import ValidationError, FieldDoesNotExist, ObjectDoesNotExist
+from django.db import transaction
+from django.db.models import Q, F, Case, When, Value
+from django.utils import timezone
+from main.models import Tournament, Match, Player, Map, Team
+from main import bracket, broadcast, scoreboard, seasons, signals, stats
+
+
+# Each function below is one unit of work for a websocket action: it is called with a single
+# database_sync_to_async hop, loads the rows it needs up front and writes in one transaction.
+# The websocket topics are published by the signal receivers once the transaction is committed,
+# or explicitly after UPDATE queries, which send no signals.
+
+
+# Function to move a point of the series score between the teams of a tournament
+def move_series_point(tournament_id, from_team_id, to_team_id):
+    """
+    Moves one point of the series score of a tournament from a team to another in one UPDATE.
+
+    The team losing the point is None when a match gets its first winner, and teams that don't play
+    in the tournament are ignored.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+        from_team_id (int): ID of the team losing the point.
+        to_team_id (int): ID of the team winning the point.
+
+    Returns:
+        None
+    """
+    if from_team_id == to_team_id:
+        return
+
+    def delta(team_field):
+        # +1 if the team of the field wins the point, -1 if it loses it
+        return (Case(When(**{team_field: to_team_id}, then=Value(1)), default=Value(0))
+                - Case(When(**{team_field: from_team_id}, then=Value(1)), default=Value(0)))
+
+    updated = Tournament.objects.filter(pk=tournament_id).update(
+        team_one_wins=F('team_one_wins') + delta('team_one'),
+        team_two_wins=F('team_two_wins') + delta('team_two'))
+    if updated:
+        # UPDATE queries send no signals, so the new score is published here
+        signals.publish_tournament(Tournament.objects.only('team_one', 'team_two').get(pk=tournament_id),
+                                   ('team_one_wins', 'team_two_wins'))
+
+
+# Function to update a column of a match
+@transaction.atomic
+def patch_match(match_id, tournament_id, column, value):
+    """
+    Updates a column of a match of a tournament, with the counters depending on it.
+
+    Changing the winner moves one win between the players and one point of the series score
+    between their teams, changing a player moves one game between the players, and the win too if
+    the replaced player won the match. A None value clears the winner or the player, taking its
+    counters back. Counters are changed with conditional UPDATEs relative to their current value,
+    and the match row is locked, so concurrent edits don't lose updates.
+
+    Args:
+        match_id (int): ID of the match.
+        tournament_id (int): ID of the tournament the match belongs to.
+        column (str): Name of the updated column.
+        value: New value of the column, a primary key for foreign keys, None to clear them.
+
+    Returns:
+        Match: The updated match.
+
+    Raises:
+        Match.DoesNotExist: If the match doesn't belong to the tournament.
+        Player.DoesNotExist: If the new winner or player doesn't exist, or the new winner doesn't
+            play the match.
+        ValidationError: If the new winner or player isn't a valid primary key.
+        Map.DoesNotExist: If the new map doesn't exist.
+    """
+    match = Match.objects.select_for_update().get(pk=match_id, tournament=tournament_id)
+
+    if column in ('winner', 'player_one', 'player_two'):
+        old_id = getattr(match, column + '_id')
+        new_id = None if value is None else Player._meta.pk.to_python(value)
+        if column == 'winner' and new_id is not None and new_id not in (match.player_one_id, match.player_two_id):
+            # Only a player of the match can win it
+            raise Player.DoesNotExist
+        # Players whose counters change, None stands for a cleared column
+        ids = [player_id for player_id in (old_id, new_id) if player_id is not None]
+        # Teams of the previous and the new player
+        teams = dict(Player.objects.filter(pk__in=ids).values_list('pk', 'team_id'))
+        if new_id is not None and new_id not in teams:
+            raise Player.DoesNotExist
+        if old_id == new_id:
+            return match
+
+        def moved(counter):
+            # Expression moving one unit of a counter from the previous to the new player
+            return Case(When(pk=new_id, then=F(counter) + 1), default=F(counter) - 1)
+
+        players = Player.objects.filter(pk__in=ids)
+        if column == 'winner':
+            players.update(wins=moved('wins'))
+            move_series_point(tournament_id, teams.get(old_id), teams.get(new_id))
+        elif old_id is not None and match.winner_id == old_id:
+            # The replaced player won the match, the new player takes over the win
+            players.update(total_games=moved('total_games'), wins=moved('wins'))
+            move_series_point(tournament_id, teams.get(old_id), teams.get(new_id))
+            match.winner_id = new_id
+        else:
+            players.update(total_games=moved('total_games'))
+        setattr(match, column + '_id', new_id)
+    elif column == 'map':
+        match.map = Map.objects.get(pk=value)
+    else:
+        # For any other column, simply update the match attribute
+        setattr(match, column, value)
+
+    match.save()
+    return match
+
+
+# Function to add a match to a tournament
+def create_match(tournament_id, user_id):
+    """
+    Creates an empty match in a tournament.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+        user_id (int): ID of the user creating the match.
+
+    Returns:
+        Match: The created match.
+
+    Raises:
+        Tournament.DoesNotExist: If the tournament doesn't exist.
+    """
+    tournament = Tournament.objects.get(pk=tournament_id)
+    return Match.objects.create(tournament=tournament, user_id=user_id)
+
+
+# Function to delete a match of a tournament
+@transaction.atomic
+def delete_match(match_id, tournament_id):
+    """
+    Deletes a match of a tournament.
+
+    Args:
+        match_id (int): ID of the match.
+        tournament_id (int): ID of the tournament the match belongs to.
+
+    Returns:
+        bool: True if the match was deleted, False if it doesn't belong to the tournament.
+    """
+    deleted, _ = Match.objects.filter(pk=match_id, tournament=tournament_id).delete()
+    return deleted > 0
+
+
+# Function to build the winner of a tournament from its series score
+def score_winner():
+    """
+    Builds an expression of the team with more wins in a tournament, None on a draw.
+
+    Returns:
+        Case: The expression, usable in UPDATE queries.
+    """
+    return Case(
+        When(team_one_wins__gt=F('team_two_wins'), then=F('team_one')),
+        When(team_two_wins__gt=F('team_one_wins'), then=F('team_two')),
+        default=None)
+
+
+# Function to apply a state transition to a tournament
+def transition_tournament(tournament_id, condition, **changes):
+    """
+    Applies a state transition to a tournament as one conditional UPDATE.
+
+    The tournament is only changed if it is still in the expected state, so of concurrent
+    transitions from the same state only one wins, without reading the row first.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+        condition (Q): Expected state of the tournament.
+        **changes: New values of the fields, may be expressions.
+
+    Returns:
+        bool: True if the transition won.
+    """
+    if not Tournament.objects.filter(condition, pk=tournament_id).update(**changes):
+        return False
+    # UPDATE queries send no signals, so the new state is published here
+    signals.publish_tournament(Tournament.objects.only('team_one', 'team_two').get(pk=tournament_id), changes)
+    return True
+
+
+# Function to start a tournament of a team immediately
+@transaction.atomic
+def start_tournament_now(tournament_id, team_id):
+    """
+    Moves the start time of a tournament that has not started yet to now.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+        team_id (int): ID of the team of the manager starting the tournament.
+
+    Returns:
+        bool: True if the start time was moved.
+
+    Raises:
+        Tournament.DoesNotExist: If the tournament doesn't exist or the team doesn't play in it.
+    """
+    now = timezone.now()
+    playing = Q(team_one=team_id) | Q(team_two=team_id)
+    if transition_tournament(tournament_id, playing & Q(match_start_time__gte=now), match_start_time=now):
+        return True
+    # The transition is lost when the tournament already started, or doesn't exist for the team
+    if not Tournament.objects.filter(playing, pk=tournament_id).exists():
+        raise Tournament.DoesNotExist
+    return False
+
+
+# Function to handle the finish handshake of a tournament
+@transaction.atomic
+def finish_tournament(tournament_id, team_id):
+    """
+    Asks to finish a tournament, or finishes it when the other team already asked.
+
+    The winner is the team with more wins. Only the transition finishing the tournament places the
+    winner in the next stage of the bracket.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+        team_id (int): ID of the team of the manager.
+
+    Returns:
+        bool: True if the tournament was finished, False if finishing was asked or the tournament
+            is already finished.
+
+    Raises:
+        Tournament.DoesNotExist: If the tournament doesn't exist or the team doesn't play in it.
+    """
+    running = (Q(team_one=team_id) | Q(team_two=team_id)) & Q(is_finished=False)
+    asked_by_other_team = Q(ask_for_finished=True) & Q(asked_team__isnull=False) & ~Q(asked_team=team_id)
+
+    # The finish may advance the winner, the bracket rows are locked before the tournament
+    bracket.lock(tournament_id)
+    # Asked by the other team -> finished
+    if transition_tournament(
+            tournament_id, running & asked_by_other_team,
+            is_finished=True, ask_for_finished=False, asked_team=None, winner=score_winner()):
+        bracket.advance(Tournament.objects.get(pk=tournament_id))
+        return True
+
+    # Running -> asked by this team
+    if not transition_tournament(
+            tournament_id, running & ~asked_by_other_team, ask_for_finished=True, asked_team=team_id):
+        # Lost to a concurrent finish, or the tournament doesn't exist for the team
+        if not Tournament.objects.filter(Q(team_one=team_id) | Q(team_two=team_id), pk=tournament_id).exists():
+            raise Tournament.DoesNotExist
+    return False
+
+
+# Function to set the winner of a tournament
+@transaction.atomic
+def set_tournament_winner(tournament_id, winner_id):
+    """
+    Finishes a tournament with the given winner.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+        winner_id (int): ID of the winning team.
+
+    Returns:
+        bool: True if the tournament changed, False if it was already finished with this winner.
+
+    Raises:
+        Tournament.DoesNotExist: If the tournament doesn't exist.
+        Team.DoesNotExist: If the team doesn't exist.
+    """
+    if not Team.objects.filter(pk=winner_id).exists():
+        raise Team.DoesNotExist
+    if transition_tournament(
+            tournament_id, Q(is_finished=False) | ~Q(winner=winner_id),
+            is_finished=True, ask_for_finished=False, asked_team=None, winner=winner_id):
+        return True
+    if not Tournament.objects.filter(pk=tournament_id).exists():
+        raise Tournament.DoesNotExist
+    return False
+
+
+# Function to set the finished flag of a tournament
+@transaction.atomic
+def set_tournament_finished(tournament_id, value):
+    """
+    Finishes a tournament, deciding the winner from the series score, or reopens it.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+        value (bool): New value of the flag.
+
+    Returns:
+        bool: True if the flag changed.
+
+    Raises:
+        Tournament.DoesNotExist: If the tournament doesn't exist.
+    """
+    if value is True:
+        # Running -> finished
+        won = transition_tournament(
+            tournament_id, Q(is_finished=False),
+            is_finished=True, ask_for_finished=False, asked_team=None, winner=score_winner())
+    else:
+        # Finished -> running
+        won = transition_tournament(tournament_id, Q(is_finished=True), is_finished=value, winner=None)
+    if not won and not Tournament.objects.filter(pk=tournament_id).exists():
+        raise Tournament.DoesNotExist
+    return won
+
+
+# Function to set the winner of a tournament and move it to the next stage
+@transaction.atomic
+def advance_winner(tournament_id, winner_id):
+    """
+    Finishes a tournament with the given winner and places the winner in the next stage.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+        winner_id (int): ID of the winning team.
+
+    Returns:
+        bool: True if the tournament changed, False if it was already finished with this winner.
+
+    Raises:
+        Tournament.DoesNotExist: If the tournament doesn't exist.
+        Team.DoesNotExist: If the team doesn't exist.
+    """
+    # The bracket rows are locked before the tournament, in the same order as the sibling advance
+    bracket.lock(tournament_id)
+    if not set_tournament_winner(tournament_id, winner_id):
+        return False
+    # Only the winning transition moves the winner in the bracket
+    bracket.advance(Tournament.objects.get(pk=tournament_id))
+    return True
+
+
+# Function to accept the start time suggested for a tournament
+@transaction.atomic
+def accept_time_suggestion(tournament_id, team_id):
+    """
+    Moves the start time of a tournament to the time suggested by a team.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+        team_id (int): ID of the team of the manager accepting the suggestion.
+
+    Returns:
+        bool: True if the suggestion was accepted, False if there is no suggestion.
+
+    Raises:
+        Tournament.DoesNotExist: If the tournament doesn't exist or the team doesn't play in it.
+    """
+    playing = Q(team_one=team_id) | Q(team_two=team_id)
+    # Time suggested -> accepted
+    if transition_tournament(
+            tournament_id, playing & Q(ask_for_other_time__isnull=False),
+            match_start_time=F('ask_for_other_time'), ask_for_other_time=None, asked_team=None):
+        return True
+    if not Tournament.objects.filter(playing, pk=tournament_id).exists():
+        raise Tournament.DoesNotExist
+    return False
+
+
+# Function to update a field of a tournament
+@transaction.atomic
+def update_tournament_field(tournament_id, field, value):
+    """
+    Updates a field of a tournament.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+        field (str): Name of the field.
+        value: New value of the field, a primary key for the teams.
+
+    Returns:
+        Tournament: The updated tournament.
+
+    Raises:
+        FieldDoesNotExist: If the tournament has no such field.
+        Tournament.DoesNotExist: If the tournament doesn't exist.
+        Team.DoesNotExist: If the new team doesn't exist.
+    """
+    Tournament._meta.get_field(field)
+    tournament = Tournament.objects.get(pk=tournament_id)
+    if field in ('team_one', 'team_two'):
+        value = Team.objects.get(pk=value)
+    setattr(tournament, field, value)
+    tournament.save()
+    return tournament
+
+
+# Function to create a tournament in the current season
+@transaction.atomic
+def create_tournament(match_start_time, team_one_id, team_two_id, stage, inline_number=None):
+    """
+    Creates a tournament between two teams in the current season.
+
+    Args:
+        match_start_time (str): Start time of the tournament.
+        team_one_id (int): ID of the first team.
+        team_two_id (int): ID of the second team.
+        stage (int): Stage of the tournament.
+        inline_number (int): Position of the tournament in its stage.
+
+    Returns:
+        Tournament: The created tournament.
+
+    Raises:
+        ValidationError: If both teams are the same.
+        Season.DoesNotExist: If there is no current season.
+        Team.DoesNotExist: If a team doesn't exist.
+    """
+    if team_one_id == team_two_id:
+        raise ValidationError("Teams can't be equal")
+    season = seasons.current_season()
+    return Tournament.objects.create(
+        season=season,
+        match_start_time=match_start_time,
+        team_one=Team.objects.get(pk=team_one_id),
+        team_two=Team.objects.get(pk=team_two_id),
+        stage=stage,
+        is_finished=False,
+        inline_number=inline_number)
+
+
+# Function to update a field of a tournament from an admin action
+def update_tournament(tournament_id, field, value):
+    """
+    Applies an admin update of a tournament field.
+
+    Finishing decides the winner from the series score, setting the winner also moves it to the
+    next stage of the bracket, and other fields are simply updated.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+        field (str): Name of the field.
+        value: New value of the field.
+
+    Returns:
+        None
+
+    Raises:
+        FieldDoesNotExist: If the tournament has no such field.
+        ObjectDoesNotExist: If the tournament or a referenced row doesn't exist.
+        ValidationError: If the value is invalid.
+    """
+    if field == 'is_finished':
+        set_tournament_finished(tournament_id, value)
+    elif field == 'winner':
+        advance_winner(tournament_id, value)
+    else:
+        update_tournament_field(tournament_id, field, value)
+
+
+# Function to create tournaments in the current season with one query
+def create_tournaments(rows):
+    """
+    Creates tournaments in the current season with one bulk INSERT.
+
+    Bulk inserts send no signals, so the tournament topics are published here.
+
+    Args:
+        rows (list): Dictionaries with the `match_start_time`, `team_one`, `team_two`, `stage` and
+            optional `inline_number` keys of the create_tournament action.
+
+    Returns:
+        int: Number of created tournaments.
+
+    Raises:
+        ValidationError: If both teams of a tournament are the same.
+        Season.DoesNotExist: If there is no current season.
+        Team.DoesNotExist: If a team doesn't exist.
+    """
+    if not rows:
+        return 0
+    team_ids = set()
+    for row in rows:
+        if row['team_one'] == row['team_two']:
+            raise ValidationError("Teams can't be equal")
+        team_ids.update((row['team_one'], row['team_two']))
+    if Team.objects.filter(pk__in=team_ids).count() != len(team_ids):
+        raise Team.DoesNotExist
+    season = seasons.current_season()
+
+    created = Tournament.objects.bulk_create([
+        Tournament(
+            season=season,
+            match_start_time=row['match_start_time'],
+            team_one_id=row['team_one'],
+            team_two_id=row['team_two'],
+            stage=row['stage'],
+            is_finished=False,
+            inline_number=row.get('inline_number'))
+        for row in rows
+    ])
+    signals.publish_team_feeds(team_ids)
+    signals.publish_admin_topics()
+    signals.publish_info()
+    if all(tournament.pk is not None for tournament in created):
+        for tournament in created:
+            scoreboard.refresh_on_commit(tournament.pk)
+    else:
+        # The database didn't return the IDs of the bulk insert, the scoreboard is rebuilt whole
+        broadcast.on_commit_once('scoreboard_rebuild', scoreboard.republish)
+    return len(rows)
+
+
+# Largest number of operations accepted in one batch message
+BATCH_MAX_OPERATIONS = 500
+
+# Errors of an operation that roll back its batch
+BATCH_ERRORS = (ObjectDoesNotExist, ValidationError, KeyError, TypeError, ValueError)
+
+
+class BatchError(Exception):
+    """
+    Raised when an operation of a batch fails, after the whole batch was rolled back.
+
+    Attributes:
+        index (int): Position of the failed operation in the batch, None if the batch itself is
+            invalid or its bulk writes failed.
+        error (Exception): The error raised by the operation.
+    """
+    def __init__(self, index, error):
+        super().__init__(f'Operation {index} failed: {error!r}')
+        self.index = index
+        self.error = error
+
+
+# Function to check the operations of a batch
+def batch_operations(operations):
+    """
+    Checks the operations of a batch message.
+
+    Args:
+        operations: The `operations` value of the message.
+
+    Returns:
+        list: The operations.
+
+    Raises:
+        BatchError: If the operations are not a list of objects or are too many.
+    """
+    if (not isinstance(operations, list) or len(operations) > BATCH_MAX_OPERATIONS
+            or not all(isinstance(operation, dict) for operation in operations)):
+        raise BatchError(None, ValidationError('Invalid operations'))
+    return operations
+
+
+# Function to apply a batch of match actions
+@transaction.atomic
+def apply_match_batch(tournament_id, user_id, is_admin, operations):
+    """
+    Applies a batch of match actions of a tournament in one transaction.
+
+    Operations have the shape of the single `update`, `create` and `delete` messages. Updates are
+    applied in order, then deletes and creates are written in bulk. If an operation fails the whole
+    batch is rolled back, and subscribers get one match list once the batch is committed.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+        user_id (int): ID of the user creating matches.
+        is_admin (bool): Flag indicating whether the user may delete matches.
+        operations (list): The operations.
+
+    Returns:
+        int: Number of applied operations.
+
+    Raises:
+        BatchError: If an operation failed.
+    """
+    creates = 0
+    deletes = []
+    for index, operation in enumerate(batch_operations(operations)):
+        try:
+            action = operation['action']
+            if action == 'update':
+                patch_match(operation['updated_field'], tournament_id,
+                            operation['updated_column'], operation['updated_value'])
+            elif action == 'create':
+                creates += 1
+            elif action == 'delete':
+                # Only admins can delete matches, like with single messages
+                if is_admin:
+                    deletes.append(operation['match_pk'])
+            else:
+                raise ValidationError(f'Unknown action {action}')
+        except BATCH_ERRORS as error:
+            raise BatchError(index, error)
+
+    try:
+        if deletes:
+            Match.objects.filter(pk__in=deletes, tournament=tournament_id).delete()
+        if creates:
+            tournament = Tournament.objects.get(pk=tournament_id)
+            Match.objects.bulk_create([Match(tournament=tournament, user_id=user_id) for _ in range(creates)])
+            # Bulk inserts send no signals
+            stats.apply([], [stats.key(tournament.season_id)] * creates)
+            signals.publish_match_list(tournament_id)
+    except BATCH_ERRORS as error:
+        raise BatchError(None, error)
+    return len(operations)
+
+
+# Function to apply a batch of admin tournament actions
+@transaction.atomic
+def apply_admin_batch(operations):
+    """
+    Applies a batch of admin tournament actions in one transaction.
+
+    Operations have the shape of the single `create_tournament`, `update` and `set_winner` messages.
+    Updates are applied in order, winners moving to the next stage like with the `update` action,
+    then the tournaments are created with one bulk INSERT. If an operation fails the whole batch
+    is rolled back, and every topic is published once after commit.
+
+    Args:
+        operations (list): The operations.
+
+    Returns:
+        int: Number of applied operations.
+
+    Raises:
+        BatchError: If an operation failed.
+    """
+    rows = []
+    for index, operation in enumerate(batch_operations(operations)):
+        try:
+            action = operation['action']
+            if action == 'create_tournament':
+                rows.append(operation)
+            elif action == 'update':
+                update_tournament(operation['tournament_id'], operation['field'], operation['value'])
+            elif action == 'set_winner':
+                advance_winner(operation['tournament_id'], operation['winner_id'])
+            else:
+                raise ValidationError(f'Unknown action {action}')
+        except BATCH_ERRORS + (FieldDoesNotExist,) as error:
+            raise BatchError(index, error)
+
+    try:
+        create_tournaments(rows)
+    except BATCH_ERRORS as error:
+        raise BatchError(None, error)
+    return len(operations)
+
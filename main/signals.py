@@ -0,0 +1,259 @@
+# Import necessary modules
+import json
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from main.models import Match, Tournament, Manager, Season, Player
+from main import auth, broadcast, payloads, scoreboard, seasons, stats, tasks
+
+
+# Function to publish the match list of a tournament
+def publish_match_list(tournament_id):
+    """
+    Publishes the match list of a tournament to the `match_<id>` topic after commit.
+
+    The list is retained, so it is also the cached match detail of the tournament, replaced only
+    when its matches change.
+
+    Args:
+        tournament_id (int): ID of the tournament.
+
+    Returns:
+        None
+    """
+    broadcast.publish_on_commit(
+        f'match_{tournament_id}', 'new_match_list',
+        lambda: payloads.match_list(tournament_id), retain=True)
+    # The match winners are shown on the live scoreboard
+    scoreboard.refresh_on_commit(tournament_id)
+
+
+# Function to publish the feeds of the managers of a tournament
+def publish_manager_feeds(tournament):
+    """
+    Publishes the tournament feeds of the managers of both teams of a tournament.
+
+    Args:
+        tournament (Tournament): The tournament that changed.
+
+    Returns:
+        None
+    """
+    publish_team_feeds([tournament.team_one_id, tournament.team_two_id])
+
+
+# Function to publish the feeds of the managers of teams
+def publish_team_feeds(team_ids):
+    """
+    Publishes the tournament feeds of the managers of teams after commit.
+
+    Args:
+        team_ids (iterable): IDs of the teams.
+
+    Returns:
+        None
+    """
+    managers = Manager.objects.filter(team__in=team_ids).values_list('user_id', flat=True)
+    for user_id in managers:
+        broadcast.publish_on_commit(
+            f'manager_{user_id}', 'send_tournaments',
+            lambda user_id=user_id: payloads.manager_feed(user_id))
+
+
+# Function to publish the topics shared by all admins
+def publish_admin_topics():
+    """
+    Publishes the tournament list, its counts and the group standings of the current season after
+    commit.
+
+    Returns:
+        None
+    """
+    broadcast.publish_on_commit('admin_tournaments', 'send_tournaments', payloads.admin_tournaments)
+    broadcast.publish_on_commit('admin_counts', 'send_tournaments', payloads.admin_counts)
+    broadcast.publish_on_commit('groups_standings', 'send_groups', payloads.group_standings)
+
+
+# Function to publish the landing page snapshot
+def publish_info():
+    """
+    Rebuilds the landing page snapshot kept in Redis and sends it to `/ws/information/` after commit.
+
+    Returns:
+        None
+    """
+    broadcast.publish_on_commit('info', 'send_groups', payloads.info_snapshot, retain=True)
+
+
+# Function to publish the landing page snapshot if the league counts changed
+def publish_info_if_leagues_changed():
+    """
+    Rebuilds the landing page snapshot if the player counts by league no longer match it.
+
+    Players are saved on every match update, while their league rarely changes, so the counts are
+    compared first with one aggregate query.
+
+    Returns:
+        None
+    """
+    _, text = broadcast.latest('info')
+    if text is None or json.loads(text)['playersByLeague'] != payloads.players_by_league():
+        broadcast.publish('info', 'send_groups', payloads.info_snapshot(), retain=True)
+
+
+# Fields of a tournament shown on the landing page, the scores follow the winners of its matches
+TOURNAMENT_INFO_FIELDS = ('team_one', 'team_two', 'team_one_wins', 'team_two_wins', 'winner', 'season', 'stage',
+                          'group', 'inline_number')
+
+
+# Function to publish every topic showing a tournament
+def publish_tournament(tournament, fields=None):
+    """
+    Publishes the manager feeds, the admin topics, the landing page and the scoreboard after a
+    tournament changed.
+
+    Called by the signal receivers, and directly after UPDATE queries, which send no signals. The
+    landing page is only rebuilt when a field it shows changed.
+
+    Args:
+        tournament (Tournament): The tournament that changed.
+        fields (iterable): Names of the changed fields, None if they aren't known.
+
+    Returns:
+        None
+    """
+    # Send the updated feeds to the managers of both teams
+    publish_manager_feeds(tournament)
+    # Send the updated tournament list and standings to the admins
+    publish_admin_topics()
+    # Group and playoff results are part of the landing page, the finish handshake isn't
+    if fields is None or not set(fields).isdisjoint(TOURNAMENT_INFO_FIELDS):
+        publish_info()
+    # Scores and start times are shown on the live scoreboard
+    scoreboard.refresh_on_commit(tournament.pk)
+
+
+@receiver(post_save, sender=Match)
+@receiver(post_delete, sender=Match)
+def match_changed(sender, instance, **kwargs):
+    # Send the updated match list to the subscribers of the tournament
+    publish_match_list(instance.tournament_id)
+
+
+@receiver(pre_save, sender=Match)
+@receiver(pre_delete, sender=Match)
+def match_changing(sender, instance, **kwargs):
+    # Remember the statistic row the match counts in before the change
+    if instance.pk is not None:
+        instance._statistic_keys = list(stats.match_keys(Match.objects.filter(pk=instance.pk)).values())
+
+
+@receiver(post_save, sender=Match)
+def match_saved(sender, instance, **kwargs):
+    # Move the match to the statistic row of its new players, winner and map
+    stats.apply(instance.__dict__.pop('_statistic_keys', []),
+                stats.match_keys(Match.objects.filter(pk=instance.pk)).values())
+
+
+@receiver(post_delete, sender=Match)
+def match_deleted(sender, instance, **kwargs):
+    stats.apply(instance.__dict__.pop('_statistic_keys', []), [])
+
+
+@receiver(pre_save, sender=Player)
+def player_changing(sender, instance, **kwargs):
+    # The statistics of the matches of a player depend on their race
+    if instance.pk is not None and Player.objects.filter(pk=instance.pk).exclude(race=instance.race_id).exists():
+        instance._statistic_keys = list(stats.match_keys(stats.player_matches(instance.pk)).values())
+
+
+@receiver(post_save, sender=Player)
+def player_saved(sender, instance, **kwargs):
+    if '_statistic_keys' in instance.__dict__:
+        stats.apply(instance.__dict__.pop('_statistic_keys'),
+                    stats.match_keys(stats.player_matches(instance.pk)).values())
+
+
+@receiver(pre_save, sender=Tournament)
+def tournament_changing(sender, instance, **kwargs):
+    # Remember the fields shown on the landing page before the change
+    if instance.pk is not None:
+        instance._info_state = Tournament.objects.filter(pk=instance.pk).values_list(*TOURNAMENT_INFO_FIELDS).first()
+
+
+@receiver(post_save, sender=Tournament)
+@receiver(post_delete, sender=Tournament)
+def tournament_changed(sender, instance, **kwargs):
+    # Send the tournament to everyone showing it, new and deleted tournaments change every field
+    previous = instance.__dict__.pop('_info_state', None)
+    fields = None
+    if previous is not None and kwargs.get('created') is False:
+        fields = [field for field, value in zip(TOURNAMENT_INFO_FIELDS, previous)
+                  if getattr(instance, Tournament._meta.get_field(field).attname) != value]
+    publish_tournament(instance, fields)
+
+
+@receiver(post_save, sender=Season)
+@receiver(post_delete, sender=Season)
+def season_changed(sender, instance, **kwargs):
+    # Every process drops its cached current season
+    seasons.invalidate()
+    # The season state is part of the landing page, the publish plans its refresh at the season start
+    publish_info()
+
+
+# Fields of a season deciding when its registration closes
+SEASON_START_FIELDS = ('start_datetime', 'can_register', 'is_finished')
+
+
+@receiver(pre_save, sender=Season)
+def season_changing(sender, instance, **kwargs):
+    # Remember the start state of the season before the change
+    if instance.pk is not None:
+        instance._start_state = Season.objects.filter(pk=instance.pk).values_list(*SEASON_START_FIELDS).first()
+
+
+@receiver(post_save, sender=Season)
+def season_saved(sender, instance, **kwargs):
+    # Saves that don't change the start state keep the task already scheduled
+    state = tuple(getattr(instance, field) for field in SEASON_START_FIELDS)
+    if instance.__dict__.pop('_start_state', None) == state:
+        return
+    # Registration closes when the season starts, at once if it already has
+    if not instance.is_finished and instance.can_register:
+        season_id, start = instance.pk, instance.start_datetime
+        transaction.on_commit(lambda: tasks.start_season.apply_async(args=[season_id], eta=start))
+
+
+@receiver(post_save, sender=Player)
+@receiver(post_delete, sender=Player)
+def player_changed(sender, instance, **kwargs):
+    # League counts are part of the landing page
+    broadcast.on_commit_once('info:leagues', publish_info_if_leagues_changed)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    # Forget the cached identity, or the cached invalidity, of the token
+    auth.invalidate_tokens([instance.key])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    # Logins only update last_login, which isn't part of the cached identity
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    # The staff flag of the user may have changed
+    auth.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=Manager)
+@receiver(post_delete, sender=Manager)
+def manager_changed(sender, instance, **kwargs):
+    # The team of the user may have changed
+    auth.invalidate_user(instance.user_id)
@@ -0,0 +1,154 @@
+# Import necessary modules
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+from main.models import Match, MatchStatistic, Map
+
+
+# IDs of the races in the statistics
+ZERG, TERRAN, PROTOSS = 1, 2, 3
+
+# Matchups of the statistics: (name, ordered races, race whose wins are counted, name of its wins)
+MATCHUPS = (
+    ('tvz', (ZERG, TERRAN), TERRAN, 'tvzTerranWins'),
+    ('tvp', (TERRAN, PROTOSS), TERRAN, 'tvpTerranWins'),
+    ('pvz', (ZERG, PROTOSS), PROTOSS, 'pvzProtossWins'),
+)
+
+# Fields of a match the statistics depend on, read in one joined query
+_KEY_FIELDS = ('tournament__season_id', 'map_id', 'player_one__race_id', 'player_two__race_id', 'winner__race_id')
+
+
+# Function to build the statistic key of a match
+def key(season, map_id=None, race_one=None, race_two=None, winner_race=None):
+    """
+    Builds the key of the statistic row a match counts in.
+
+    Args:
+        season (int): ID of the season of the match.
+        map_id (int): ID of the map, None if not set.
+        race_one (int): Race of the first player, None if not set.
+        race_two (int): Race of the second player, None if not set.
+        winner_race (int): Race of the winner, None if not set.
+
+    Returns:
+        tuple: (season, map, race_one, race_two, winner_race) with the races of the players ordered
+            and 0 for missing values.
+    """
+    race_one, race_two = sorted((race_one or 0, race_two or 0))
+    return season or 0, map_id or 0, race_one, race_two, winner_race or 0
+
+
+# Function to read the statistic keys of matches
+def match_keys(matches):
+    """
+    Reads the statistic rows matches count in.
+
+    Args:
+        matches (QuerySet): The matches.
+
+    Returns:
+        dict: Statistic key of each match by match ID.
+    """
+    return {row[0]: key(*row[1:]) for row in matches.values_list('pk', *_KEY_FIELDS)}
+
+
+# Function to get the matches of a player
+def player_matches(player_id):
+    """
+    Selects the matches whose statistics depend on the race of a player.
+
+    Args:
+        player_id (int): ID of the player.
+
+    Returns:
+        QuerySet: Matches the player played or won.
+    """
+    return Match.objects.filter(Q(player_one=player_id) | Q(player_two=player_id) | Q(winner=player_id))
+
+
+# Function to move matches between statistic rows
+def apply(removed, added):
+    """
+    Updates the counters after matches changed, in the transaction of the change.
+
+    Args:
+        removed (iterable): Keys the matches counted in before the change.
+        added (iterable): Keys the matches count in after the change.
+
+    Returns:
+        None
+    """
+    deltas = Counter(added)
+    deltas.subtract(Counter(removed))
+    for row_key, delta in deltas.items():
+        if delta == 0:
+            continue
+        fields = dict(zip(('season', 'map', 'race_one', 'race_two', 'winner_race'), row_key))
+        if not MatchStatistic.objects.filter(**fields).update(count=F('count') + delta):
+            # The unique constraint makes concurrent creations of the row safe
+            MatchStatistic.objects.get_or_create(**fields)
+            MatchStatistic.objects.filter(**fields).update(count=F('count') + delta)
+
+
+# Function to recompute the statistics
+@transaction.atomic
+def rebuild():
+    """
+    Recomputes every counter from the matches, e.g. after races of players changed in bulk.
+
+    Returns:
+        int: Number of counted matches.
+    """
+    counts = Counter()
+    rows = Match.objects.values(*_KEY_FIELDS).annotate(matches=Count('pk')).order_by()
+    for row in rows:
+        counts[key(*(row[field] for field in _KEY_FIELDS))] += row['matches']
+    MatchStatistic.objects.all().delete()
+    MatchStatistic.objects.bulk_create([
+        MatchStatistic(season=season, map=map_id, race_one=race_one, race_two=race_two,
+                       winner_race=winner_race, count=count)
+        for (season, map_id, race_one, race_two, winner_race), count in counts.items() if count
+    ])
+    return sum(counts.values())
+
+
+def _matchup_stats(rows):
+    # Counters of the matchups from statistic rows
+    stats = {}
+    for name, races, winner_race, wins_name in MATCHUPS:
+        stats[name + 'Count'] = sum(row.count for row in rows if (row.race_one, row.race_two) == races)
+        stats[wins_name] = sum(row.count for row in rows
+                               if (row.race_one, row.race_two) == races and row.winner_race == winner_race)
+    return stats
+
+
+# Function to build the match statistics
+def match_statistics(season=None):
+    """
+    Builds the match statistics of `getStatistics` from the counters.
+
+    Args:
+        season (int): ID of the season to count the matches of, all seasons if None.
+
+    Returns:
+        tuple: (match statistics, statistics of each map).
+    """
+    rows = MatchStatistic.objects.filter(count__gt=0)
+    if season is not None:
+        rows = rows.filter(season=season)
+    rows = list(rows)
+
+    match_stats = {
+        'totalMatches': sum(row.count for row in rows),
+        'mirrors': sum(row.count for row in rows if row.race_one == row.race_two != 0),
+    }
+    match_stats.update(_matchup_stats(rows))
+
+    maps = []
+    for map_id, name in Map.objects.order_by('pk').values_list('pk', 'name'):
+        map_data = {'id': map_id, 'name': name}
+        map_data.update(_matchup_stats([row for row in rows if row.map == map_id]))
+        maps.append(map_data)
+    return match_stats, maps
@@ -1,7 +1,9 @@
 # Import necessary modules
 from server7x.celery import app
-from .models import LeagueFrame, League, Team, Race
+from django.utils import timezone
+from .models import LeagueFrame, League, Team, Race, Season
 from .utils import get_blizzard_league_data, form_character_data, get_avatar
+from . import schedule, seasons
 import asyncio
 import logging
 
@@ -94,3 +96,39 @@ def update_players_data():
                 if avatar is not None:
                     player.avatar = avatar
                 player.save()
+
+
+# Define a Celery task to close the registration of a season when it starts
+
+
+@app.task
+def start_season(season_id):
+    """
+    Celery task to close the registration of a season once it has started.
+
+    It is scheduled at the start of the season whenever the season is saved with registration open.
+    The conditional update only matches an open, unfinished season whose start has passed, so the
+    transition runs once however many times the task is scheduled or delivered, and a task left by
+    a start moved later does nothing.
+    """
+    closed = Season.objects.filter(
+        pk=season_id, is_finished=False, can_register=True, start_datetime__lte=timezone.now()
+    ).update(can_register=False)
+    if closed:
+        # UPDATE sends no signals
+        seasons.invalidate()
+        logging.info(f'Registration closed for season {season_id}')
+
+
+# Define a Celery task to refresh a topic at a boundary of its payload
+
+
+@app.task
+def refresh_topic(topic):
+    """
+    Celery task to recompute and push a topic whose payload depends on time.
+
+    It is scheduled at the next boundary of the topic, e.g. the start of a season or a tournament,
+    when the payload changes without any database write. See main.schedule.
+    """
+    schedule.refresh(topic)
@@ -1,3 +1,1354 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import threading
+import time
+import zlib
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from main.models import League, Manager, Map, Match, Player, Race, Region, Season, Team, Tournament
+from main.payloads import ADMIN_WINDOW_MAX, TournamentWindow
+from main import auth, bracket, broadcast, metrics, payloads, schedule, scoreboard, seasons, services, stats, tasks, timers
+from main.consumers import Subscription
+from main.layers import HybridChannelLayer
+from server7x.asgi import application
+
+
+# Patterns of the Redis keys written by the code under test, dropped before each test
+REDIS_KEY_PATTERNS = ('topic:*', 'scoreboard:*', 'schedule:*', 'metrics:topics:*')
+
+
+# Function to create the rows shared by the tests: two teams of one player each in an open season
+def make_league():
+    """
+    Creates two teams with one manager and one player each, in an open season.
+
+    Returns:
+        dict: The created rows by name.
+    """
+    region = Region.objects.create(name='EU')
+    league = League.objects.create(name='GM')
+    # The statistics identify the races by ID
+    races = {
+        race_id: Race.objects.create(pk=race_id, name=name)
+        for race_id, name in ((stats.ZERG, 'Zerg'), (stats.TERRAN, 'Terran'), (stats.PROTOSS, 'Protoss'))
+    }
+    season = Season.objects.create(
+        number=1, start_datetime=timezone.now(), is_finished=False, can_register=False)
+    rows = {'league': league, 'races': races, 'season': season}
+    for number, race_id in ((1, stats.TERRAN), (2, stats.ZERG)):
+        user = User.objects.create(username=f'manager{number}')
+        team = Team.objects.create(name=f'Team {number}', tag=f'T{number}', logo='logo.png', region=region, user=user)
+        Manager.objects.create(user=user, team=team)
+        rows[f'user{number}'] = user
+        rows[f'team{number}'] = team
+        rows[f'player{number}'] = Player.objects.create(
+            username=f'player{number}', mmr=1, league=league, race=races[race_id], wins=0, total_games=0,
+            team=team, user=user)
+    rows['tournament'] = Tournament.objects.create(
+        team_one=rows['team1'], team_two=rows['team2'], match_start_time=timezone.now(), season=season,
+        stage=1, is_finished=False)
+    return rows
+
+
+# Function to read the frames a connection received until it goes quiet
+async def receive_all(communicator, timeout=0.2):
+    """
+    Receives the frames sent to a test connection until none arrives for a while.
+
+    Args:
+        communicator (WebsocketCommunicator): The test connection.
+        timeout (float): Seconds of silence ending the reception.
+
+    Returns:
+        list: The text or bytes of the received frames.
+    """
+    frames = []
+    while not await communicator.receive_nothing(timeout):
+        message = await communicator.receive_output()
+        frames.append(message.get('text') or message.get('bytes'))
+    return frames
+
+
+class RedisTestMixin:
+    """
+    Starts each test with empty topics and caches, the tests run against the Redis of the settings.
+
+    The Celery tasks planned by publishes are not queued, their mocks are kept as `refresh_topic`
+    and `start_season`.
+    """
+    def setUp(self):
+        super().setUp()
+        # Hooks registered by setUpTestData never run, they would keep the ones of the test out
+        transaction.get_connection().run_on_commit.clear()
+        client = broadcast.get_redis()
+        for pattern in REDIS_KEY_PATTERNS:
+            for key in client.scan_iter(pattern):
+                client.delete(key)
+        cache.clear()
+        # Payloads and frames kept by this process for the topics of the previous test
+        with broadcast._payloads_lock:
+            broadcast._payloads.clear()
+        with broadcast._frames_lock:
+            broadcast._frames.clear()
+        auth._forget()
+        seasons._forget()
+        for name in ('refresh_topic', 'start_season'):
+            patcher = mock.patch.object(getattr(tasks, name), 'apply_async')
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    def publish(self, topic, payload, retain=False):
+        # Publishes a version outside of any transaction hook, returns its number
+        return broadcast.publish(topic, 'send_groups', payload, retain)
+
+
+class ReplayLogTests(RedisTestMixin, TestCase):
+    """
+    Versions kept by the replay log of main.broadcast, and clients resuming from them.
+    """
+    topic = 'replay_test'
+
+    def test_replay_returns_the_missed_versions(self):
+        versions = [self.publish(self.topic, {'number': number}) for number in range(3)]
+        self.assertEqual(versions, [1, 2, 3])
+        self.assertEqual(async_to_sync(broadcast.replay)(self.topic, 1),
+                         [(2, '{"number": 1}'), (3, '{"number": 2}')])
+        self.assertEqual(async_to_sync(broadcast.replay)(self.topic, 3), [])
+
+    def test_replay_needs_a_snapshot_when_versions_are_missing(self):
+        for number in range(3):
+            self.publish(self.topic, {'number': number})
+        # The log lost the first versions
+        broadcast.get_redis().delete(broadcast._log_key(self.topic))
+        self.publish(self.topic, {'number': 3})
+        self.assertIsNone(async_to_sync(broadcast.replay)(self.topic, 1))
+        self.assertEqual(async_to_sync(broadcast.replay)(self.topic, 3), [(4, '{"number": 3}')])
+        # A client from another history, e.g. before the counter was reset
+        self.assertIsNone(async_to_sync(broadcast.replay)(self.topic, 10))
+
+    async def test_resumed_client_receives_only_the_missed_versions(self):
+        for number in range(3):
+            await database_sync_to_async(self.publish)('info', {'number': number}, True)
+        communicator = WebsocketCommunicator(application, '/ws/information/?version=1')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(json.loads(await communicator.receive_from()), {'version': 2, 'data': {'number': 1}})
+        self.assertEqual(json.loads(await communicator.receive_from()), {'version': 3, 'data': {'number': 2}})
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_new_client_receives_the_snapshot(self):
+        for number in range(2):
+            await database_sync_to_async(self.publish)('info', {'number': number}, True)
+        communicator = WebsocketCommunicator(application, '/ws/information/?version=')
+        await communicator.connect()
+        self.assertEqual(json.loads(await communicator.receive_from()), {'version': 2, 'data': {'number': 1}})
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+
+class SharedPayloadTests(RedisTestMixin, TestCase):
+    """
+    Payloads encoded once by main.broadcast and shared by the subscribers of the process.
+    """
+    topic = 'shared_test'
+
+    async def test_group_messages_only_reference_the_log(self):
+        layer = get_channel_layer(broadcast.TOPICS_LAYER)
+        channel = await layer.new_channel()
+        await layer.group_add(self.topic, channel)
+        version = await database_sync_to_async(self.publish)(self.topic, {'number': 1})
+        message = await asyncio.wait_for(layer.receive(channel), 5)
+        await layer.group_discard(self.topic, channel)
+        self.assertEqual(set(message), {'type', 'topic', 'version', 'entry'})
+        self.assertEqual(message['version'], version)
+        self.assertEqual(await broadcast.fetch(self.topic, version, message['entry']), '{"number": 1}')
+
+    async def test_published_payloads_are_served_from_the_process(self):
+        version = await database_sync_to_async(self.publish)(self.topic, {'number': 1})
+        # The publisher doesn't read its own payload back
+        await broadcast.get_async_redis().delete(broadcast._log_key(self.topic))
+        self.assertEqual(await broadcast.fetch(self.topic, version, '0-0'), '{"number": 1}')
+
+    async def test_concurrent_fetches_read_the_log_once(self):
+        version = await database_sync_to_async(self.publish)(self.topic, {'number': 1})
+        entry = (await broadcast.get_async_redis().xrange(broadcast._log_key(self.topic)))[0][0]
+        # Another process published the version
+        with broadcast._payloads_lock:
+            broadcast._payloads.clear()
+        with mock.patch.object(broadcast, '_load', wraps=broadcast._load) as load:
+            texts = await asyncio.gather(*[broadcast.fetch(self.topic, version, entry) for _ in range(3)])
+        self.assertEqual(texts, ['{"number": 1}'] * 3)
+        self.assertEqual(load.call_count, 1)
+
+    def test_frames_are_encoded_once_per_encoding(self):
+        text = '{"number": 1}'
+        frame = broadcast.shared_frame(self.topic, 1, text, 'msgpack', None, True)
+        self.assertIs(broadcast.shared_frame(self.topic, 1, text, 'msgpack', None, True), frame)
+        self.assertIsNot(broadcast.shared_frame(self.topic, 1, text, 'msgpack', 'deflate', True), frame)
+        # Plain JSON frames are the published text itself
+        self.assertIs(broadcast.shared_frame(self.topic, 1, text, 'json', None, False), text)
+
+
+class FrameEncodingTests(RedisTestMixin, TestCase):
+    """
+    Frames negotiated and encoded by main.broadcast.
+    """
+    text = '{"a": [1, 2]}'
+
+    def test_negotiate_falls_back_to_json_text(self):
+        self.assertEqual(broadcast.negotiate('msgpack', 'deflate'), ('msgpack', 'deflate'))
+        self.assertEqual(broadcast.negotiate(None, None), ('json', None))
+        self.assertEqual(broadcast.negotiate('xml', 'gzip'), ('json', None))
+
+    def test_json_frames(self):
+        self.assertEqual(broadcast.encode_frame(self.text, 3, 'json', None, False), self.text)
+        self.assertEqual(json.loads(broadcast.encode_frame(self.text, 3, 'json', None, True)),
+                         {'version': 3, 'data': {'a': [1, 2]}})
+        self.assertEqual(json.loads(broadcast.encode_frame(self.text, 3, 'json', None, True, 'match_1')),
+                         {'topic': 'match_1', 'version': 3, 'data': {'a': [1, 2]}})
+
+    def test_msgpack_frames(self):
+        frame = broadcast.encode_frame(self.text, 3, 'msgpack', None, False)
+        self.assertEqual(msgpack.unpackb(frame), {'a': [1, 2]})
+        frame = broadcast.encode_frame(self.text, 3, 'msgpack', None, True, 'info')
+        self.assertEqual(msgpack.unpackb(frame), {'topic': 'info', 'version': 3, 'data': {'a': [1, 2]}})
+
+    def test_deflate_frames_are_binary(self):
+        frame = broadcast.encode_frame(self.text, 3, 'json', 'deflate', True)
+        self.assertIsInstance(frame, bytes)
+        self.assertEqual(json.loads(zlib.decompress(frame)), {'version': 3, 'data': {'a': [1, 2]}})
+        frame = broadcast.encode_frame(self.text, 3, 'msgpack', 'deflate', False)
+        self.assertEqual(msgpack.unpackb(zlib.decompress(frame)), {'a': [1, 2]})
+
+    async def test_clients_receive_the_negotiated_frames(self):
+        await database_sync_to_async(self.publish)('info', {'number': 1}, True)
+        communicator = WebsocketCommunicator(
+            application, '/ws/information/?version=&encoding=msgpack&compression=deflate')
+        await communicator.connect()
+        frame = await communicator.receive_from()
+        self.assertEqual(msgpack.unpackb(zlib.decompress(frame)), {'version': 1, 'data': {'number': 1}})
+        await communicator.disconnect()
+
+
+class TokenCacheTests(RedisTestMixin, TestCase):
+    """
+    Identities of websocket tokens cached by main.auth.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+        cls.token = Token.objects.create(user=cls.rows['user1'])
+
+    def test_identities_are_cached(self):
+        identity = auth.resolve_token(self.token.key)
+        self.assertEqual(identity, auth.Identity(self.rows['user1'].pk, False, self.rows['team1'].pk))
+        with self.assertNumQueries(0):
+            self.assertEqual(auth.resolve_token(self.token.key), identity)
+
+    def test_unknown_tokens_are_cached_as_invalid(self):
+        self.assertIsNone(auth.resolve_token('unknown'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(auth.resolve_token('unknown'))
+        self.assertIsNone(auth.resolve_token(None))
+
+    def test_changes_drop_the_cached_identity(self):
+        auth.resolve_token(self.token.key)
+        user = self.rows['user1']
+        with self.captureOnCommitCallbacks(execute=True):
+            user.is_staff = True
+            user.save()
+        self.assertTrue(auth.resolve_token(self.token.key).is_staff)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token.delete()
+        self.assertIsNone(auth.resolve_token(self.token.key))
+
+    def test_logins_keep_the_cached_identity(self):
+        auth.resolve_token(self.token.key)
+        user = self.rows['user1']
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            user.last_login = timezone.now()
+            user.save(update_fields=['last_login'])
+        self.assertEqual(callbacks, [])
+
+    async def test_concurrent_lookups_share_one_query(self):
+        with mock.patch.object(auth, 'resolve_token', wraps=auth.resolve_token) as resolve:
+            identities = await asyncio.gather(*[auth.aresolve_token(self.token.key) for _ in range(3)])
+        self.assertEqual(len(set(identities)), 1)
+        self.assertEqual(resolve.call_count, 1)
+
+    async def test_handshake_tokens_authenticate_the_connection(self):
+        scopes = []
+
+        async def inner(scope, receive, send):
+            scopes.append(scope)
+
+        middleware = auth.TokenAuthMiddleware(inner)
+        await middleware({'type': 'websocket', 'query_string': f'token={self.token.key}'.encode()}, None, None)
+        await middleware({'type': 'websocket', 'headers': [(b'authorization', f'Token {self.token.key}'.encode())]},
+                         None, None)
+        await middleware({'type': 'websocket', 'query_string': b''}, None, None)
+        self.assertEqual([scope['identity'] and scope['identity'].user_id for scope in scopes],
+                         [self.rows['user1'].pk, self.rows['user1'].pk, None])
+
+
+class InfoSnapshotTests(RedisTestMixin, TestCase):
+    """
+    Landing page snapshot shared by the `/ws/information/` connections.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+
+    def info_version(self):
+        return int(broadcast.get_redis().get(broadcast._version_key('info')) or 0)
+
+    def test_snapshot_tells_the_season_state(self):
+        season = self.rows['season']
+        self.assertEqual(payloads.info_snapshot()['state'], 0)
+        season.start_datetime = timezone.now() + datetime.timedelta(days=1)
+        season.can_register = True
+        season.save()
+        info = payloads.info_snapshot()
+        self.assertEqual((info['state'], info['season']), (1, 1))
+        self.assertEqual(info['playersByLeague'], payloads.players_by_league())
+
+    async def test_connections_share_the_retained_snapshot(self):
+        first = WebsocketCommunicator(application, '/ws/information/')
+        await first.connect()
+        snapshot = json.loads(await first.receive_from())
+        # The snapshot is built by the first connection only
+        with mock.patch('main.consumers.info_snapshot', side_effect=AssertionError):
+            second = WebsocketCommunicator(application, '/ws/information/')
+            await second.connect()
+            self.assertEqual(json.loads(await second.receive_from()), snapshot)
+        await first.disconnect()
+        await second.disconnect()
+
+    def test_tournament_changes_republish_the_fields_shown(self):
+        tournament = self.rows['tournament']
+        version = self.info_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            tournament.ask_for_finished = True
+            tournament.match_start_time = timezone.now()
+            tournament.save()
+        self.assertEqual(self.info_version(), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            tournament.winner = self.rows['team1']
+            tournament.save()
+        self.assertEqual(self.info_version(), version + 1)
+
+    def test_player_changes_republish_the_league_counts(self):
+        player = self.rows['player1']
+        with self.captureOnCommitCallbacks(execute=True):
+            player.mmr = 2
+            player.save()
+        version = self.info_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            player.mmr = 3
+            player.save()
+        self.assertEqual(self.info_version(), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            # Only the grandmaster, master and diamond leagues are counted
+            player.league = League.objects.create(pk=7, name='Grandmaster')
+            player.save()
+        self.assertEqual(self.info_version(), version + 1)
+        self.assertEqual(json.loads(broadcast.latest('info')[1])['playersByLeague'], payloads.players_by_league())
+
+
+class PatchMatchTests(TestCase):
+    """
+    Counters changed by services.patch_match.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+
+    def setUp(self):
+        self.match = Match.objects.create(tournament=self.rows['tournament'], user=self.rows['user1'])
+
+    def patch(self, column, value):
+        return services.patch_match(self.match.pk, self.rows['tournament'].pk, column, value)
+
+    def counters(self):
+        # (wins, total games) of both players, then the series score
+        players = Player.objects.in_bulk([self.rows['player1'].pk, self.rows['player2'].pk])
+        tournament = Tournament.objects.get(pk=self.rows['tournament'].pk)
+        return ((players[self.rows['player1'].pk].wins, players[self.rows['player1'].pk].total_games),
+                (players[self.rows['player2'].pk].wins, players[self.rows['player2'].pk].total_games),
+                (tournament.team_one_wins, tournament.team_two_wins))
+
+    def test_players_count_games(self):
+        self.patch('player_one', self.rows['player1'].pk)
+        self.patch('player_two', self.rows['player2'].pk)
+        self.assertEqual(self.counters(), ((0, 1), (0, 1), (0, 0)))
+
+    def test_winner_changes_move_the_win_and_the_point(self):
+        self.patch('player_one', self.rows['player1'].pk)
+        self.patch('player_two', self.rows['player2'].pk)
+        self.patch('winner', self.rows['player2'].pk)
+        self.assertEqual(self.counters(), ((0, 1), (1, 1), (0, 1)))
+        self.patch('winner', self.rows['player1'].pk)
+        self.assertEqual(self.counters(), ((1, 1), (0, 1), (1, 0)))
+        # Setting the same winner again changes nothing
+        self.patch('winner', self.rows['player1'].pk)
+        self.assertEqual(self.counters(), ((1, 1), (0, 1), (1, 0)))
+
+    def test_none_clears_the_winner(self):
+        self.patch('player_one', self.rows['player1'].pk)
+        self.patch('player_two', self.rows['player2'].pk)
+        self.patch('winner', self.rows['player1'].pk)
+        match = self.patch('winner', None)
+        self.assertIsNone(match.winner_id)
+        self.assertEqual(self.counters(), ((0, 1), (0, 1), (0, 0)))
+
+    def test_none_clears_a_player_and_its_win(self):
+        self.patch('player_one', self.rows['player1'].pk)
+        self.patch('player_two', self.rows['player2'].pk)
+        self.patch('winner', self.rows['player1'].pk)
+        match = self.patch('player_one', None)
+        self.assertIsNone(match.player_one_id)
+        self.assertIsNone(match.winner_id)
+        self.assertEqual(self.counters(), ((0, 0), (0, 1), (0, 0)))
+
+    def test_winner_must_play_the_match(self):
+        self.patch('player_one', self.rows['player1'].pk)
+        with self.assertRaises(Player.DoesNotExist):
+            self.patch('winner', self.rows['player2'].pk)
+        self.assertEqual(self.counters(), ((0, 1), (0, 0), (0, 0)))
+
+    def test_unknown_player_is_rejected(self):
+        with self.assertRaises(Player.DoesNotExist):
+            self.patch('player_one', 0)
+
+
+class ActionErrorTests(RedisTestMixin, TestCase):
+    """
+    Replies of the match and admin endpoints to actions the services reject.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+        cls.admin = User.objects.create(username='admin', is_staff=True)
+        cls.tokens = {user: Token.objects.create(user=user).key for user in (cls.admin, cls.rows['user1'])}
+        cls.match = Match.objects.create(tournament=cls.rows['tournament'], user=cls.rows['user1'])
+
+    async def connect(self, path, user, **data):
+        communicator = WebsocketCommunicator(application, path)
+        await communicator.connect()
+        await communicator.send_json_to({'token': self.tokens[user], 'action': 'subscribe', **data})
+        await receive_all(communicator)
+        return communicator
+
+    async def test_admin_actions_on_missing_rows_or_wrong_values(self):
+        tournament = self.rows['tournament'].pk
+        communicator = await self.connect('/ws/tournaments_admin/', self.admin)
+        for message, reply in (
+                ({'action': 'set_winner', 'tournament_id': 0, 'winner_id': self.rows['team1'].pk}, '{}'),
+                ({'action': 'set_winner', 'tournament_id': tournament, 'winner_id': 0}, '{}'),
+                ({'action': 'update', 'tournament_id': 0, 'field': 'stage', 'value': 2}, '{}'),
+                ({'action': 'update', 'tournament_id': tournament, 'field': 'stage', 'value': 'two'},
+                 'Incorrect Value'),
+                ({'action': 'update', 'tournament_id': tournament, 'field': 'unknown', 'value': 2},
+                 'Field not found'),
+                ({'action': 'create_tournament', 'match_start_time': '2024-01-01T15:00:00Z', 'team_one': 0,
+                  'team_two': self.rows['team2'].pk, 'stage': 1}, '{}')):
+            with self.subTest(message=message):
+                await communicator.send_json_to(message)
+                self.assertEqual(await receive_all(communicator), [reply])
+        await communicator.disconnect()
+
+    async def test_match_updates_with_wrong_values(self):
+        communicator = await self.connect('/ws/match/', self.rows['user1'], group=self.rows['tournament'].pk)
+        update = {'action': 'update', 'updated_field': self.match.pk}
+        await communicator.send_json_to(dict(update, updated_column='player_one', updated_value='one'))
+        self.assertEqual(await receive_all(communicator), ['Incorrect Value'])
+        # The winner must play the match
+        await communicator.send_json_to(dict(update, updated_column='winner', updated_value=self.rows['player1'].pk))
+        self.assertEqual(await receive_all(communicator), ['{}'])
+        await communicator.disconnect()
+
+
+class BracketAdvanceTests(TestCase):
+    """
+    Placement of winners by bracket.advance, as the admin and manager actions did before it.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+        cls.team3 = Team.objects.create(
+            name='Team 3', tag='T3', logo='logo.png', region=cls.rows['team1'].region, user=cls.rows['user1'])
+
+    def make_tournament(self, inline_number, winner=None, stage=1):
+        return Tournament.objects.create(
+            team_one=self.rows['team1'], team_two=self.rows['team2'], match_start_time=timezone.now(),
+            season=self.rows['season'], stage=stage, is_finished=winner is not None,
+            winner=winner, inline_number=inline_number)
+
+    def test_first_winner_waits_for_its_sibling(self):
+        tournament = self.make_tournament(0, self.rows['team1'])
+        self.make_tournament(1)
+        self.assertIsNone(bracket.advance(tournament))
+        self.assertFalse(Tournament.objects.filter(stage=2).exists())
+
+    def test_both_winners_create_the_next_stage_once(self):
+        first = self.make_tournament(2, self.rows['team1'])
+        second = self.make_tournament(3, self.rows['team2'])
+        parent = bracket.advance(second)
+        # The winner of the even sibling plays as team one
+        self.assertEqual((parent.stage, parent.inline_number), (2, 1))
+        self.assertEqual((parent.team_one_id, parent.team_two_id), (self.rows['team1'].pk, self.rows['team2'].pk))
+        self.assertFalse(parent.is_finished)
+        self.assertEqual(bracket.advance(first), parent)
+        self.assertEqual(Tournament.objects.filter(stage=2).count(), 1)
+        self.assertEqual(
+            set(Tournament.objects.filter(next_stage_tournament=parent).values_list('pk', flat=True)),
+            {first.pk, second.pk})
+
+    def test_new_winner_replaces_the_previous_one(self):
+        first = self.make_tournament(0, self.rows['team1'])
+        self.make_tournament(1, self.rows['team2'])
+        parent = bracket.advance(first)
+        first.winner = self.team3
+        first.save()
+        bracket.advance(first)
+        parent.refresh_from_db()
+        self.assertEqual((parent.team_one_id, parent.team_two_id), (self.team3.pk, self.rows['team2'].pk))
+
+    def test_tournaments_outside_the_bracket_are_ignored(self):
+        self.assertIsNone(bracket.advance(self.make_tournament(None, self.rows['team1'])))
+        self.assertIsNone(bracket.advance(self.make_tournament(4)))
+
+    def test_set_winner_paths_advance(self):
+        first = self.make_tournament(0)
+        second = self.make_tournament(1)
+        services.apply_admin_batch([
+            {'action': 'set_winner', 'tournament_id': first.pk, 'winner_id': self.rows['team1'].pk},
+            {'action': 'update', 'tournament_id': second.pk, 'field': 'winner', 'value': self.rows['team2'].pk},
+        ])
+        parent = Tournament.objects.get(stage=2, inline_number=0)
+        self.assertEqual((parent.team_one_id, parent.team_two_id), (self.rows['team1'].pk, self.rows['team2'].pk))
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentAdvanceTests(RedisTestMixin, TransactionTestCase):
+    """
+    Winners of both siblings set at the same time, on a database with row locks.
+    """
+    def test_sibling_winners_create_the_next_stage_once(self):
+        rows = make_league()
+        pairs = [[Tournament.objects.create(
+            team_one=rows['team1'], team_two=rows['team2'], match_start_time=timezone.now(), season=rows['season'],
+            stage=1, is_finished=False, inline_number=number) for number in (pair * 2, pair * 2 + 1)]
+            for pair in range(5)]
+        barrier = threading.Barrier(2)
+        errors = []
+
+        def set_winners(tournaments, winner):
+            # Each thread sets the winner of one sibling of every pair, both at the same time
+            try:
+                for tournament in tournaments:
+                    barrier.wait(timeout=10)
+                    services.advance_winner(tournament.pk, winner.pk)
+            except Exception as error:
+                errors.append(error)
+                barrier.abort()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=set_winners, args=([pair[index] for pair in pairs], rows[team]))
+                   for index, team in ((0, 'team1'), (1, 'team2'))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        parents = Tournament.objects.filter(stage=2).order_by('inline_number')
+        self.assertEqual([(parent.inline_number, parent.team_one_id, parent.team_two_id) for parent in parents],
+                         [(number, rows['team1'].pk, rows['team2'].pk) for number in range(5)])
+
+
+class DeadlineHeapTests(SimpleTestCase):
+    """
+    Deadlines kept by timers.DeadlineHeap, checked with expired() without waiting for the reaper.
+    """
+    async def callback(self):
+        pass
+
+    async def other_callback(self):
+        pass
+
+    async def test_expired_returns_the_due_deadlines(self):
+        heap = timers.DeadlineHeap()
+        heap.schedule('early', 10, self.callback)
+        heap.schedule('late', 20, self.other_callback)
+        now = time.monotonic()
+        self.assertEqual(heap.expired(now), [])
+        self.assertEqual(heap.expired(now + 15), [self.callback])
+        self.assertNotIn('early', heap)
+        self.assertEqual(heap.expired(now + 25), [self.other_callback])
+        self.assertEqual(len(heap), 0)
+        heap._reaper.cancel()
+
+    async def test_cancelled_deadlines_dont_fire(self):
+        heap = timers.DeadlineHeap()
+        heap.schedule('key', 10, self.callback)
+        heap.cancel('key', 'unknown')
+        self.assertEqual(heap.expired(time.monotonic() + 15), [])
+        self.assertEqual(len(heap), 0)
+        heap._reaper.cancel()
+
+    async def test_postponed_deadlines_fire_at_the_new_time(self):
+        heap = timers.DeadlineHeap()
+        for _ in range(10):
+            heap.schedule('key', 10, self.callback)
+        heap.schedule('key', 30, self.other_callback)
+        # Postponing doesn't push heap items
+        self.assertEqual(len(heap._heap), 1)
+        now = time.monotonic()
+        self.assertEqual(heap.expired(now + 15), [])
+        self.assertIn('key', heap)
+        self.assertEqual(heap.expired(now + 35), [self.other_callback])
+        heap._reaper.cancel()
+
+    async def test_advanced_deadlines_fire_once(self):
+        heap = timers.DeadlineHeap()
+        heap.schedule('key', 30, self.callback)
+        heap.schedule('key', 10, self.callback)
+        now = time.monotonic()
+        self.assertEqual(heap.expired(now + 15), [self.callback])
+        self.assertEqual(heap.expired(now + 35), [])
+        heap._reaper.cancel()
+
+    @override_settings(WEBSOCKET_AUTH_TIMEOUT=0.1)
+    async def test_connections_without_first_message_are_closed(self):
+        communicator = WebsocketCommunicator(application, '/ws/topics/')
+        await communicator.connect()
+        self.assertEqual(await communicator.receive_output(timeout=2), {'type': 'websocket.close'})
+        await communicator.disconnect()
+
+
+class FakeConnection:
+    """
+    Connection of a subscription under test, recording the frames it sends.
+
+    Attributes:
+        frames (list): Frames sent, decoded from JSON.
+        full (bool): Flag telling the subscription that the send window is full.
+        acknowledged (asyncio.Event): Event releasing the frames waiting for the window.
+        closed (bool): Flag set when the subscription closes the connection.
+    """
+    def __init__(self):
+        self.frames = []
+        self.full = False
+        self.acknowledged = asyncio.Event()
+        self.closed = False
+
+    def window_full(self):
+        return self.full
+
+    async def wait_acknowledged(self):
+        await self.acknowledged.wait()
+        self.full = False
+
+    async def send_frame(self, frame):
+        self.frames.append(json.loads(frame))
+
+    async def close_connection(self):
+        self.closed = True
+
+
+class SendQueueTests(SimpleTestCase):
+    """
+    Versions queued by Subscription for a connection, collapsed when the client falls behind.
+    """
+    topic = 'queue_test'
+
+    def subscribe(self):
+        connection = FakeConnection()
+        return connection, Subscription(connection, self.topic, {'version': None}, None)
+
+    def counters(self):
+        return dict(metrics._counters(self.topic))
+
+    async def stop(self, subscription):
+        # Let the writer run, then stop the deadlines of the test loop
+        await asyncio.sleep(0)
+        subscription.stop()
+        heap = timers.get_heap()
+        heap.cancel(*list(heap._entries))
+        heap._reaper.cancel()
+
+    @override_settings(WEBSOCKET_SEND_QUEUE_SIZE=3)
+    async def test_full_queue_collapses_to_the_latest_versions(self):
+        connection, subscription = self.subscribe()
+        connection.full = True
+        before = self.counters()
+        for version in range(1, 6):
+            subscription.enqueue(version, '{"number": %d}' % version, False)
+        # The fourth version replaced the three pending ones, the fifth queued behind it
+        self.assertEqual([item[0] for item in subscription.outbox], [4, 5])
+        self.assertEqual(self.counters()['dropped'] - before['dropped'], 3)
+        connection.acknowledged.set()
+        await asyncio.sleep(0.05)
+        self.assertEqual(connection.frames, [{'version': 4, 'data': {'number': 4}},
+                                             {'version': 5, 'data': {'number': 5}}])
+        self.assertEqual(self.counters()['depth'], before['depth'])
+        await self.stop(subscription)
+
+    async def test_versions_already_queued_are_skipped(self):
+        connection, subscription = self.subscribe()
+        subscription.enqueue(2, '{"number": 2}', False)
+        subscription.enqueue(1, '{"number": 1}', False)
+        subscription.enqueue(2, '{"number": 2}', False)
+        await asyncio.sleep(0.05)
+        self.assertEqual(connection.frames, [{'version': 2, 'data': {'number': 2}}])
+        await self.stop(subscription)
+
+    @override_settings(WEBSOCKET_MAX_LAG=0.1)
+    async def test_clients_lagging_behind_are_disconnected(self):
+        connection, subscription = self.subscribe()
+        connection.full = True
+        before = self.counters()
+        subscription.enqueue(1, '{"number": 1}', False)
+        # The reaper may be sleeping until a later deadline when the lag deadline is scheduled
+        await asyncio.sleep(timers.RESOLUTION + 0.2)
+        self.assertTrue(connection.closed)
+        self.assertEqual(connection.frames, [])
+        self.assertEqual(len(subscription.outbox), 0)
+        self.assertEqual(self.counters()['disconnected'] - before['disconnected'], 1)
+        await self.stop(subscription)
+
+
+class SendWindowTests(RedisTestMixin, TestCase):
+    """
+    Frames held back until the client acknowledges the ones it received.
+    """
+    @override_settings(WEBSOCKET_HEARTBEAT_INTERVAL=60, WEBSOCKET_SEND_WINDOW=1)
+    async def test_frames_wait_for_the_pong_of_the_client(self):
+        await database_sync_to_async(self.publish)('info', {'number': 1}, True)
+        communicator = WebsocketCommunicator(application, '/ws/topics/')
+        await communicator.connect()
+        await communicator.send_json_to({'action': 'subscribe', 'topic': 'info', 'version': None})
+        self.assertEqual(json.loads(await communicator.receive_from())['version'], 1)
+        # The first frame fills the window, the next version waits for its acknowledgement
+        await database_sync_to_async(self.publish)('info', {'number': 2}, True)
+        self.assertEqual(await receive_all(communicator), ['ping'])
+        await communicator.send_to(text_data='pong')
+        self.assertEqual(json.loads(await communicator.receive_from()),
+                         {'topic': 'info', 'version': 2, 'data': {'number': 2}})
+        await communicator.disconnect()
+
+
+class TopicsConsumerTests(RedisTestMixin, TestCase):
+    """
+    Topics and actions multiplexed over one `/ws/topics/` connection.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+        cls.token = Token.objects.create(user=cls.rows['user1']).key
+
+    async def connect(self, token=None):
+        communicator = WebsocketCommunicator(application, '/ws/topics/')
+        await communicator.connect()
+        if token is not None:
+            await communicator.send_json_to({'token': token})
+        return communicator
+
+    async def test_frames_are_labelled_with_their_topic(self):
+        communicator = await self.connect(self.token)
+        manager_topic = f"manager_{self.rows['user1'].pk}"
+        for topic in ('info', manager_topic):
+            await communicator.send_json_to({'action': 'subscribe', 'topic': topic, 'version': None})
+        frames = [json.loads(frame) for frame in await receive_all(communicator)]
+        self.assertEqual(sorted(frame['topic'] for frame in frames), ['info', manager_topic])
+        self.assertTrue(all(set(frame) == {'topic', 'version', 'data'} for frame in frames))
+        await database_sync_to_async(self.publish)('info', {'number': 1}, True)
+        self.assertEqual([json.loads(frame)['data'] for frame in await receive_all(communicator)], [{'number': 1}])
+        # Unsubscribed topics are no longer sent
+        await communicator.send_json_to({'action': 'unsubscribe', 'topic': 'info'})
+        await database_sync_to_async(self.publish)('info', {'number': 2}, True)
+        self.assertEqual(await receive_all(communicator), [])
+        await communicator.disconnect()
+
+    async def test_topics_need_permission(self):
+        communicator = await self.connect(self.token)
+        for topic in (f"manager_{self.rows['user2'].pk}", 'admin_tournaments', 'unknown', None):
+            await communicator.send_json_to({'action': 'subscribe', 'topic': topic})
+            self.assertEqual(json.loads(await communicator.receive_from()),
+                             {'action': 'subscribe', 'topic': topic, 'error': 'Topic not found'})
+        await communicator.disconnect()
+
+    async def test_manager_actions_check_the_tournament(self):
+        anonymous = await self.connect()
+        await anonymous.send_json_to({'action': 'finish', 'id': self.rows['tournament'].pk})
+        self.assertEqual(json.loads(await anonymous.receive_from())['error'], 'Forbidden')
+        await anonymous.disconnect()
+        communicator = await self.connect(self.token)
+        for tournament_id, error in (('one', 'Incorrect Value'), ([1], 'Incorrect Value'), (0, 'Not found')):
+            await communicator.send_json_to({'action': 'finish', 'id': tournament_id})
+            self.assertEqual(json.loads(await communicator.receive_from()),
+                             {'action': 'finish', 'topic': None, 'error': error})
+        await communicator.send_json_to({'action': 'finish', 'id': self.rows['tournament'].pk})
+        self.assertEqual(await receive_all(communicator), [])
+        tournament = await database_sync_to_async(Tournament.objects.get)(pk=self.rows['tournament'].pk)
+        self.assertEqual((tournament.ask_for_finished, tournament.asked_team_id), (True, self.rows['team1'].pk))
+        await communicator.disconnect()
+
+    async def test_messages_other_than_objects_close_the_connection(self):
+        communicator = await self.connect()
+        await communicator.send_to(text_data='[]')
+        self.assertEqual(await communicator.receive_output(), {'type': 'websocket.close'})
+        await communicator.disconnect()
+
+
+class HybridLayerTests(SimpleTestCase):
+    """
+    Messages of main.layers.HybridChannelLayer, delivered locally within a loop and through Redis
+    between loops.
+    """
+    group = 'hybrid_test'
+
+    def setUp(self):
+        self.layer = HybridChannelLayer(hosts=[settings.REDIS_URL])
+
+    async def receive_all(self, channel, timeout=0.3):
+        # Messages received by a channel until it goes quiet
+        messages = []
+        try:
+            while True:
+                messages.append(await asyncio.wait_for(self.layer.receive(channel), timeout))
+        except asyncio.TimeoutError:
+            return messages
+
+    async def test_local_members_receive_once(self):
+        channel = await self.layer.new_channel()
+        await self.layer.group_add(self.group, channel)
+        await self.layer.group_send(self.group, {'type': 'test.message', 'number': 1})
+        await self.layer.send(channel, {'type': 'test.message', 'number': 2})
+        self.assertEqual([message['number'] for message in await self.receive_all(channel)], [1, 2])
+        await self.layer.flush()
+
+    def test_other_loops_of_the_process_receive(self):
+        subscribed = threading.Event()
+        received = []
+
+        async def member():
+            # Member of the group in its own event loop, like the consumers of another thread
+            channel = await self.layer.new_channel()
+            await self.layer.group_add(self.group, channel)
+            subscribed.set()
+            received.extend(await self.receive_all(channel, timeout=2))
+            await self.layer.flush()
+
+        thread = threading.Thread(target=asyncio.run, args=(member(),))
+        thread.start()
+        self.assertTrue(subscribed.wait(5))
+
+        async def sender():
+            await self.layer.group_send(self.group, {'type': 'test.message', 'number': 1})
+            await self.layer.flush()
+
+        asyncio.run(sender())
+        thread.join()
+        self.assertEqual(received, [{'type': 'test.message', 'number': 1}])
+
+
+class TournamentWindowTests(SimpleTestCase):
+    """
+    Windows of the admin tournament list.
+    """
+    def test_parse_defaults_and_limit(self):
+        self.assertEqual(TournamentWindow.parse({}), TournamentWindow(None, None, 0, ADMIN_WINDOW_MAX))
+        self.assertEqual(TournamentWindow.parse({'stage': 2, 'group': 3, 'offset': 5, 'limit': 10}),
+                         TournamentWindow(2, 3, 5, 10))
+        self.assertEqual(TournamentWindow.parse({'limit': ADMIN_WINDOW_MAX + 1}).limit, ADMIN_WINDOW_MAX)
+
+    def test_parse_rejects_invalid_values(self):
+        for data in (None, [], {'stage': '1'}, {'group': True}, {'offset': -1}, {'limit': 1.5}, {'offset': False}):
+            with self.subTest(data=data), self.assertRaises(ValueError):
+                TournamentWindow.parse(data)
+
+    def test_apply_filters_and_pages(self):
+        tournaments = [{'id': number, 'stage': number % 2, 'group': number % 3} for number in range(12)]
+        payload = {'tournaments': tournaments, 'maps': ['map']}
+        window = TournamentWindow(stage=0, group=None, offset=1, limit=2)
+        self.assertEqual(window.apply(payload), {
+            'tournaments': [tournaments[2], tournaments[4]],
+            'maps': ['map'],
+            'window': {'offset': 1, 'limit': 2, 'total': 6}
+        })
+        sliced = TournamentWindow(stage=1, group=0, offset=0, limit=10).apply(payload)
+        self.assertEqual([tournament['id'] for tournament in sliced['tournaments']], [3, 9])
+
+
+class AdminWindowTests(RedisTestMixin, TestCase):
+    """
+    Windows and extra topics of the admin tournament list endpoint.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+        for stage in (1, 2, 2):
+            Tournament.objects.create(
+                team_one=cls.rows['team1'], team_two=cls.rows['team2'], match_start_time=timezone.now(),
+                season=cls.rows['season'], stage=stage, is_finished=False)
+        cls.token = Token.objects.create(user=User.objects.create(username='admin', is_staff=True)).key
+
+    async def test_admins_move_their_window(self):
+        communicator = WebsocketCommunicator(application, '/ws/tournaments_admin/')
+        await communicator.connect()
+        await communicator.send_json_to({'token': self.token, 'action': 'subscribe'})
+        self.assertEqual(len(json.loads(await communicator.receive_from())['tournaments']), 4)
+        await communicator.send_json_to({'action': 'window', 'window': {'stage': 2, 'limit': 1}})
+        sliced = json.loads(await communicator.receive_from())
+        self.assertEqual((len(sliced['tournaments']), sliced['window']['total']), (1, 2))
+        await communicator.send_json_to({'action': 'window', 'window': {'limit': -1}})
+        self.assertEqual(await receive_all(communicator), ['Incorrect Value'])
+        await communicator.disconnect()
+
+    async def test_admins_follow_the_counts_next_to_the_list(self):
+        communicator = WebsocketCommunicator(application, '/ws/tournaments_admin/')
+        await communicator.connect()
+        await communicator.send_json_to({'token': self.token, 'action': 'subscribe'})
+        await receive_all(communicator)
+        await communicator.send_json_to({'action': 'subscribe', 'topic': 'admin_counts', 'version': None})
+        frame = json.loads(await communicator.receive_from())
+        self.assertEqual((frame['topic'], frame['data']), ('admin_counts', await database_sync_to_async(
+            payloads.admin_counts)()))
+        # Only the topics of extra_topics may be followed
+        await communicator.send_json_to({'action': 'subscribe', 'topic': 'groups_standings', 'version': None})
+        self.assertEqual(await receive_all(communicator), [])
+        await communicator.disconnect()
+
+
+class MatchDetailTests(RedisTestMixin, TestCase):
+    """
+    Match lists of finished tournaments fetched on demand instead of being carried by the feed.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+        Tournament.objects.filter(pk=cls.rows['tournament'].pk).update(is_finished=True)
+        for _ in range(2):
+            Match.objects.create(tournament=cls.rows['tournament'], user=cls.rows['user1'])
+        cls.token = Token.objects.create(user=cls.rows['user1']).key
+
+    def test_feed_carries_only_the_number_of_matches(self):
+        tournament, = payloads.manager_feed(self.rows['user1'].pk)['tournaments']
+        self.assertEqual(tournament['matchesCount'], 2)
+        self.assertNotIn('matches', tournament)
+
+    def test_match_list_is_built_once(self):
+        text = payloads.match_detail(self.rows['tournament'].pk)
+        self.assertEqual(json.loads(text), json.loads(json.dumps(payloads.match_list(self.rows['tournament'].pk))))
+        with self.assertNumQueries(0):
+            self.assertEqual(payloads.match_detail(self.rows['tournament'].pk), text)
+        self.assertIsNone(payloads.match_detail(0))
+
+    def test_matches_are_served_over_rest(self):
+        client = APIClient()
+        client.force_authenticate(self.rows['user1'])
+        response = client.get(f"/api/v1/getTournamentMatches/{self.rows['tournament'].pk}/")
+        self.assertEqual((response.status_code, len(json.loads(response.content))), (200, 2))
+        self.assertEqual(client.get('/api/v1/getTournamentMatches/0/').status_code, 404)
+
+    async def test_matches_are_sent_on_demand(self):
+        communicator = WebsocketCommunicator(application, '/ws/topics/')
+        await communicator.connect()
+        await communicator.send_json_to({'token': self.token})
+        await communicator.send_json_to({'action': 'match_detail', 'id': self.rows['tournament'].pk})
+        detail = json.loads(await communicator.receive_from())
+        self.assertEqual((detail['action'], detail['id'], len(detail['matches'])),
+                         ('match_detail', self.rows['tournament'].pk, 2))
+        await communicator.send_json_to({'action': 'match_detail', 'id': 'x'})
+        self.assertEqual(json.loads(await communicator.receive_from()),
+                         {'action': 'match_detail', 'id': 'x', 'matches': None})
+        await communicator.disconnect()
+
+
+class ScoreboardTests(RedisTestMixin, TestCase):
+    """
+    Live tournaments kept in a Redis hash and refreshed one entry at a time.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+        now = timezone.now()
+        cls.earlier = Tournament.objects.create(
+            team_one=cls.rows['team2'], team_two=cls.rows['team1'], match_start_time=now - datetime.timedelta(hours=1),
+            season=cls.rows['season'], stage=1, is_finished=False)
+        cls.upcoming = Tournament.objects.create(
+            team_one=cls.rows['team1'], team_two=cls.rows['team2'], match_start_time=now + datetime.timedelta(hours=1),
+            season=cls.rows['season'], stage=1, is_finished=False)
+        Tournament.objects.create(
+            team_one=cls.rows['team1'], team_two=cls.rows['team2'], match_start_time=now - datetime.timedelta(hours=2),
+            season=cls.rows['season'], stage=1, is_finished=True)
+
+    def entries(self):
+        return {entry['id']: entry for entry in scoreboard.payload()}
+
+    def test_only_live_tournaments_are_kept_in_start_order(self):
+        scoreboard.republish()
+        self.assertEqual([entry['id'] for entry in scoreboard.payload()],
+                         [self.earlier.pk, self.rows['tournament'].pk])
+        self.assertEqual(json.loads(broadcast.latest('scoreboard')[1]), scoreboard.payload())
+
+    def test_refresh_rewrites_the_changed_entries(self):
+        version = scoreboard.republish()
+        Match.objects.create(tournament=self.earlier, user=self.rows['user1'], winner=self.rows['player1'])
+        Tournament.objects.filter(pk=self.earlier.pk).update(team_one_wins=1)
+        self.assertGreater(scoreboard.refresh([self.earlier.pk, self.rows['tournament'].pk]), version)
+        entry = self.entries()[self.earlier.pk]
+        self.assertEqual((entry['team_one_wins'], entry['match_winners']), (1, [self.rows['player1'].pk]))
+        # Unchanged entries and upcoming tournaments publish nothing
+        self.assertIsNone(scoreboard.refresh([self.earlier.pk, self.upcoming.pk]))
+        Tournament.objects.filter(pk=self.earlier.pk).update(is_finished=True)
+        scoreboard.refresh([self.earlier.pk])
+        self.assertEqual(list(self.entries()), [self.rows['tournament'].pk])
+
+    def test_refresh_rebuilds_a_missing_scoreboard(self):
+        self.assertIsNotNone(scoreboard.refresh([self.upcoming.pk]))
+        self.assertEqual(list(self.entries()), [self.earlier.pk, self.rows['tournament'].pk])
+
+    def test_score_changes_are_refreshed_after_commit(self):
+        scoreboard.republish()
+        tournament = Tournament.objects.get(pk=self.rows['tournament'].pk)
+        tournament.team_two_wins = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            tournament.save()
+        self.assertEqual(self.entries()[tournament.pk]['team_two_wins'], 2)
+
+
+class ScheduleTests(RedisTestMixin, TestCase):
+    """
+    Retained payloads expiring at the next time they change and refreshed by a task at that time.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+        cls.start = (timezone.now() + datetime.timedelta(hours=1)).replace(microsecond=0)
+        Tournament.objects.create(
+            team_one=cls.rows['team1'], team_two=cls.rows['team2'], match_start_time=cls.start,
+            season=cls.rows['season'], stage=1, is_finished=False)
+
+    def expires(self, topic):
+        return float(broadcast.get_redis().hget(broadcast._latest_key(topic), 'expires'))
+
+    def test_payload_expires_at_the_next_start(self):
+        scoreboard.republish()
+        self.assertEqual(self.expires('scoreboard'), self.start.timestamp())
+        self.refresh_topic.assert_called_once_with(args=['scoreboard'], eta=self.start)
+
+    def test_expired_payload_is_missing(self):
+        scoreboard.republish()
+        broadcast.get_redis().hset(broadcast._latest_key('scoreboard'), 'expires', time.time() - 1)
+        self.assertEqual(broadcast.latest('scoreboard'), (0, None))
+
+    def test_only_the_earliest_refresh_is_planned(self):
+        schedule.plan('info', self.start)
+        schedule.plan('info', self.start + datetime.timedelta(hours=1))
+        self.assertEqual(self.refresh_topic.call_count, 1)
+        earlier = self.start - datetime.timedelta(minutes=30)
+        schedule.plan('info', earlier)
+        self.refresh_topic.assert_called_with(args=['info'], eta=earlier)
+
+    def test_earlier_tournament_moves_the_boundary(self):
+        scoreboard.republish()
+        earlier = self.start - datetime.timedelta(minutes=30)
+        tournament = Tournament.objects.create(
+            team_one=self.rows['team1'], team_two=self.rows['team2'], match_start_time=earlier,
+            season=self.rows['season'], stage=1, is_finished=False)
+        # The upcoming tournament doesn't change the scoreboard, only when it expires
+        self.assertIsNone(scoreboard.refresh([tournament.pk]))
+        self.assertEqual(self.expires('scoreboard'), earlier.timestamp())
+        self.refresh_topic.assert_called_with(args=['scoreboard'], eta=earlier)
+
+    def test_refresh_task_publishes_the_topic(self):
+        version = self.publish('info', {}, True)
+        tasks.refresh_topic('info')
+        retained_version, text = broadcast.latest('info')
+        self.assertGreater(retained_version, version)
+        self.assertEqual(json.loads(text), payloads.info_snapshot())
+
+
+class SeasonStartTests(RedisTestMixin, TestCase):
+    """
+    Registration closed by a task scheduled at the start of the season.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.season = Season.objects.create(
+            number=1, start_datetime=timezone.now() - datetime.timedelta(minutes=1), is_finished=False,
+            can_register=True)
+
+    def test_task_is_scheduled_when_the_start_state_changes(self):
+        season = Season.objects.get(pk=self.season.pk)
+        season.start_datetime += datetime.timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            season.save()
+        self.start_season.assert_called_once_with(args=[season.pk], eta=season.start_datetime)
+        # Other changes keep the task already scheduled
+        season.number = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            season.save()
+        self.assertEqual(self.start_season.call_count, 1)
+        season.can_register = False
+        with self.captureOnCommitCallbacks(execute=True):
+            season.save()
+        self.assertEqual(self.start_season.call_count, 1)
+
+    def test_task_closes_registration_once_started(self):
+        Season.objects.filter(pk=self.season.pk).update(start_datetime=timezone.now() + datetime.timedelta(days=1))
+        tasks.start_season(self.season.pk)
+        self.assertTrue(Season.objects.get(pk=self.season.pk).can_register)
+        Season.objects.filter(pk=self.season.pk).update(start_datetime=self.season.start_datetime)
+        tasks.start_season(self.season.pk)
+        self.assertFalse(Season.objects.get(pk=self.season.pk).can_register)
+
+    def test_reading_the_current_season_writes_nothing(self):
+        response = self.client.get('/api/v1/get_current_season/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Season.objects.get(pk=self.season.pk).can_register)
+
+
+class CurrentSeasonTests(RedisTestMixin, TestCase):
+    """
+    Current season cached in the process and Redis, and memoized for a request.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.season = Season.objects.create(
+            number=1, start_datetime=timezone.now(), is_finished=False, can_register=False)
+
+    def test_cached_season_runs_no_query(self):
+        self.assertEqual(seasons.current_season().pk, self.season.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(seasons.current_season().pk, self.season.pk)
+
+    def test_missing_season_is_cached(self):
+        Season.objects.update(is_finished=True)
+        self.assertRaises(Season.DoesNotExist, seasons.current_season)
+        with self.assertNumQueries(0):
+            self.assertRaises(Season.DoesNotExist, seasons.current_season)
+
+    def test_saving_a_season_invalidates_the_cache(self):
+        seasons.current_season()
+        season = Season.objects.get(pk=self.season.pk)
+        season.number = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            season.save()
+            # The transaction reads the season it changed
+            self.assertEqual(seasons.current_season().number, 2)
+        self.assertEqual(seasons.current_season().number, 2)
+
+    def test_season_is_read_once_per_request(self):
+        # The caches are dropped while the request runs, the memo is kept until its end
+        middleware = seasons.CurrentSeasonMiddleware(lambda request: [
+            seasons.current_season().pk, seasons._forget(), cache.clear(), seasons.current_season().pk])
+        with self.assertNumQueries(1):
+            self.assertEqual(middleware(None)[::3], [self.season.pk] * 2)
+        seasons._forget()
+        cache.clear()
+        with self.assertNumQueries(1):
+            middleware(None)
+
+
+class RequestIdentityTests(RedisTestMixin, TestCase):
+    """
+    Identity of the requester read once per REST request.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+        cls.token = Token.objects.create(user=cls.rows['user1'])
+
+    def test_identity_is_kept_on_the_request(self):
+        request = SimpleNamespace(auth=Token.objects.get(pk=self.token.pk))
+        with self.assertNumQueries(1):
+            identity = auth.request_identity(request)
+            self.assertIs(auth.request_identity(request), identity)
+        self.assertEqual(identity, auth.Identity(self.rows['user1'].pk, False, self.rows['team1'].pk))
+        self.assertIsNone(auth.request_identity(SimpleNamespace(auth=None)))
+
+    def test_views_read_the_cached_identity(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        client.get('/api/v1/status/')
+        with self.assertNumQueries(0):
+            response = client.get('/api/v1/status/')
+        self.assertEqual(response.json(), {'is_staff': False, 'is_manager': True})
+
+
+class RestTokenCacheTests(RedisTestMixin, TestCase):
+    """
+    REST tokens authenticated from the caches of the process and Redis.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+        cls.token = Token.objects.create(user=cls.rows['user1'])
+
+    def authenticate(self):
+        # Authenticates the token until the invalidation listener of the process dropped it
+        deadline = time.monotonic() + 2
+        user, token = auth.authenticate_token(self.token.key)
+        while user.first_name != 'Renamed' and time.monotonic() < deadline:
+            time.sleep(0.05)
+            user, token = auth.authenticate_token(self.token.key)
+        return user, token
+
+    def test_cached_tokens_run_no_query(self):
+        auth.authenticate_token(self.token.key)
+        self.assertIsNone(auth.authenticate_token('unknown'))
+        with self.assertNumQueries(0):
+            user, token = auth.authenticate_token(self.token.key)
+            self.assertIsNone(auth.authenticate_token('unknown'))
+        self.assertEqual((user.pk, token.key, token.user), (self.rows['user1'].pk, self.token.key, user))
+        self.assertEqual(token.identity, auth.Identity(user.pk, False, self.rows['team1'].pk))
+        # The fields left out of the cache are loaded if read
+        self.assertEqual(user.get_deferred_fields(), {'password', 'last_login'})
+
+    def test_user_changes_drop_the_cached_token(self):
+        auth.authenticate_token(self.token.key)
+        user = User.objects.get(pk=self.rows['user1'].pk)
+        user.first_name = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(self.authenticate()[0].first_name, 'Renamed')
+
+    def test_inactive_users_are_rejected(self):
+        User.objects.filter(pk=self.rows['user1'].pk).update(is_active=False)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(client.get('/api/v1/status/').status_code, 401)
+        client.credentials(HTTP_AUTHORIZATION='Token unknown')
+        self.assertEqual(client.get('/api/v1/status/').status_code, 401)
+
+
+# Function to count the match statistics with the queries getStatistics ran before main.stats
+def baseline_statistics():
+    """
+    Counts the match statistics from the matches, like getStatistics did before the counters.
+
+    Returns:
+        tuple: (match statistics, statistics of each map ordered by ID).
+    """
+    def matchup(races):
+        one, two = races
+        return Q(player_one__race=one, player_two__race=two) | Q(player_one__race=two, player_two__race=one)
+
+    tvz, tvp, pvz = matchup((2, 1)), matchup((2, 3)), matchup((3, 1))
+    match_stats = {
+        'totalMatches': Match.objects.count(),
+        'mirrors': Match.objects.filter(player_one__race=F('player_two__race')).count(),
+        'tvzCount': Match.objects.filter(tvz).count(),
+        'tvzTerranWins': Match.objects.filter(tvz, winner__race=2).count(),
+        'tvpCount': Match.objects.filter(tvp).count(),
+        'tvpTerranWins': Match.objects.filter(tvp, winner__race=2).count(),
+        'pvzCount': Match.objects.filter(pvz).count(),
+        'pvzProtossWins': Match.objects.filter(pvz, winner__race=3).count(),
+    }
+    maps = Map.objects.order_by('pk').annotate(
+        tvzCount=Count('match', filter=Q(match__in=Match.objects.filter(tvz))),
+        tvzTerranWins=Count('match', filter=Q(match__in=Match.objects.filter(tvz), match__winner__race=2)),
+        tvpCount=Count('match', filter=Q(match__in=Match.objects.filter(tvp))),
+        tvpTerranWins=Count('match', filter=Q(match__in=Match.objects.filter(tvp), match__winner__race=2)),
+        pvzCount=Count('match', filter=Q(match__in=Match.objects.filter(pvz))),
+        pvzProtossWins=Count('match', filter=Q(match__in=Match.objects.filter(pvz), match__winner__race=3)),
+    ).values('id', 'name', 'tvzCount', 'tvzTerranWins', 'tvpCount', 'tvpTerranWins', 'pvzCount', 'pvzProtossWins')
+    return match_stats, list(maps)
+
+
+class MatchStatisticsTests(TestCase):
+    """
+    Counters of main.stats, compared with the aggregation getStatistics ran before them.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.rows = make_league()
+        # A protoss player of the first team and a terran player of the second one, for mirrors
+        cls.protoss, cls.terran = [Player.objects.create(
+            username=f'player{number}', mmr=1, league=cls.rows['league'], race=cls.rows['races'][race_id],
+            wins=0, total_games=0, team=cls.rows[f'team{team}'], user=cls.rows[f'user{team}'])
+            for number, race_id, team in ((3, stats.PROTOSS, 1), (4, stats.TERRAN, 2))]
+        cls.maps = [Map.objects.create(name='Map one'), Map.objects.create(name='Map two')]
+
+    def create_match(self, player_one=None, player_two=None, winner=None, map=None):
+        return Match.objects.create(
+            tournament=self.rows['tournament'], user=self.rows['user1'], player_one=player_one,
+            player_two=player_two, winner=winner, map=map)
+
+    def assertMatchesBaseline(self):
+        self.assertEqual(stats.match_statistics(), baseline_statistics())
+
+    def test_counters_follow_match_changes(self):
+        terran, zerg = self.rows['player1'], self.rows['player2']
+        match = self.create_match(terran, zerg, terran, self.maps[0])
+        self.create_match(zerg, self.protoss, self.protoss, self.maps[1])
+        self.create_match(terran, self.terran)
+        self.create_match()
+        self.assertMatchesBaseline()
+
+        match.winner = zerg
+        match.map = self.maps[1]
+        match.save()
+        self.assertMatchesBaseline()
+
+        match.player_two = self.terran
+        match.winner = None
+        match.save()
+        self.assertMatchesBaseline()
+
+        match.delete()
+        self.assertMatchesBaseline()
+
+    def test_counters_follow_race_changes(self):
+        terran, zerg = self.rows['player1'], self.rows['player2']
+        self.create_match(terran, zerg, zerg, self.maps[0])
+        zerg.race = self.rows['races'][stats.PROTOSS]
+        zerg.save()
+        self.assertMatchesBaseline()
+
+    def test_batch_creates_are_counted(self):
+        services.apply_match_batch(self.rows['tournament'].pk, self.rows['user1'].pk, True,
+                                   [{'action': 'create'}, {'action': 'create'}])
+        self.assertMatchesBaseline()
+        self.assertEqual(stats.match_statistics()[0]['totalMatches'], 2)
+
+    def test_rebuild_matches_the_baseline(self):
+        terran, zerg = self.rows['player1'], self.rows['player2']
+        self.create_match(terran, zerg, terran, self.maps[0])
+        self.create_match(zerg, self.protoss, zerg)
+        # Writes without signals leave the counters behind until they are rebuilt
+        Match.objects.update(map=self.maps[1])
+        self.assertEqual(stats.rebuild(), 2)
+        self.assertMatchesBaseline()
+
+    def test_apply_moves_matches_between_rows(self):
+        season = self.rows['season'].pk
+        row = stats.key(season, self.maps[0].pk, stats.TERRAN, stats.ZERG, stats.TERRAN)
+        stats.apply([], [row, row])
+        stats.apply([row], [])
+        match_stats, maps = stats.match_statistics(season)
+        self.assertEqual((match_stats['tvzCount'], match_stats['tvzTerranWins']), (1, 1))
+        self.assertEqual(maps[0]['tvzCount'], 1)
+        self.assertEqual(stats.match_statistics(season + 1)[0]['totalMatches'], 0)
@@ -0,0 +1,126 @@
+# Import necessary modules
+import asyncio
+import heapq
+import itertools
+import time
+import weakref
+
+
+# Longest sleep of the reaper, so deadlines scheduled while it sleeps fire at most this late
+RESOLUTION = 1.0
+
+# Deadline heaps by event loop
+_heaps = weakref.WeakKeyDictionary()
+
+
+class DeadlineHeap:
+    """
+    Deadlines of the websocket connections of a process, kept in one heap.
+
+    A single reaper task sleeps until the earliest deadline and runs the callbacks of all expired
+    deadlines as one batch, instead of one sleeping task per connection. Deadlines are identified by
+    a key, e.g. (consumer, 'auth'). Postponing a deadline only updates its entry: the stale heap item
+    is pushed again with the new deadline when it expires, so refreshing idle deadlines on every
+    message doesn't grow the heap.
+    """
+    def __init__(self):
+        self._heap = []  # Items (deadline, sequence, key)
+        self._entries = {}  # Key -> [deadline, callback, queued deadline]
+        self._sequence = itertools.count()
+        self._reaper = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def schedule(self, key, delay, callback):
+        """
+        Sets the deadline of a key, replacing its previous deadline.
+
+        Args:
+            key (hashable): Identifier of the deadline.
+            delay (float): Seconds until the deadline.
+            callback (callable): Coroutine function called without arguments at the deadline.
+
+        Returns:
+            None
+        """
+        deadline = time.monotonic() + delay
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = [deadline, callback, None]
+        entry[0], entry[1] = deadline, callback
+        if entry[2] is None or deadline < entry[2]:
+            # Only earlier deadlines need a new heap item
+            entry[2] = deadline
+            heapq.heappush(self._heap, (deadline, next(self._sequence), key))
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.ensure_future(self._reap())
+
+    def cancel(self, *keys):
+        """
+        Removes the deadlines of keys, their heap items are dropped when they expire.
+
+        Args:
+            *keys (hashable): Identifiers of the deadlines.
+
+        Returns:
+            None
+        """
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def expired(self, now):
+        """
+        Pops the deadlines expired at a time.
+
+        Args:
+            now (float): Monotonic time.
+
+        Returns:
+            list: Callbacks of the expired deadlines.
+        """
+        callbacks = []
+        while self._heap and self._heap[0][0] <= now:
+            queued, _, key = heapq.heappop(self._heap)
+            entry = self._entries.get(key)
+            if entry is None or entry[2] != queued:
+                # Cancelled, or superseded by an earlier item
+                continue
+            if entry[0] > now:
+                # Postponed, queue it again at its current deadline
+                entry[2] = entry[0]
+                heapq.heappush(self._heap, (entry[0], next(self._sequence), key))
+                continue
+            del self._entries[key]
+            callbacks.append(entry[1])
+        return callbacks
+
+    async def _reap(self):
+        # Runs until no deadline is left, it is started again by the next schedule
+        while self._entries:
+            now = time.monotonic()
+            callbacks = self.expired(now)
+            if callbacks:
+                # A failing callback, e.g. on a connection closed meanwhile, doesn't stop the batch
+                await asyncio.gather(*(callback() for callback in callbacks), return_exceptions=True)
+                continue
+            delay = self._heap[0][0] - now if self._heap else RESOLUTION
+            await asyncio.sleep(min(max(delay, 0), RESOLUTION))
+
+
+# Function to get the deadline heap of the running event loop
+def get_heap():
+    """
+    Returns the deadline heap shared by the connections of the running event loop.
+
+    Returns:
+        DeadlineHeap: The heap.
+    """
+    loop = asyncio.get_running_loop()
+    heap = _heaps.get(loop)
+    if heap is None:
+        heap = _heaps[loop] = DeadlineHeap()
+    return heap
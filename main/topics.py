@@ -0,0 +1,93 @@
+# Import necessary modules
+import functools
+import re
+from collections import namedtuple
+
+from main import scoreboard
+from main.payloads import (match_list, manager_feed, admin_tournaments, admin_counts, group_standings, info_snapshot,
+                           TournamentWindow)
+
+
+# Provider of a family of topics:
+# - pattern: compiled regular expression matching the topic names, its groups are the arguments
+# - builder: function building the full payload from the arguments
+# - authorize: function of the identity (None if anonymous) and the arguments, True if allowed
+# - retained_type: message type of topics whose latest payload is kept in Redis, None otherwise
+# - window_type: class parsing the windows clients may view the topic through, None otherwise
+Provider = namedtuple('Provider', ['pattern', 'builder', 'authorize', 'retained_type', 'window_type'])
+
+# Registered providers, checked in order
+_providers = []
+
+
+# Function to register a topic provider
+def register(pattern, builder, authorize, retained_type=None, window_type=None):
+    """
+    Registers the provider of the topics whose names match a pattern.
+
+    Args:
+        pattern (str): Regular expression of the topic names, integer groups are the arguments of
+            the builder.
+        builder (callable): Function building the full payload from the arguments.
+        authorize (callable): Function of the identity and the arguments telling whether the
+            identity may subscribe.
+        retained_type (str): Message type of the topics if their latest payload is kept in Redis.
+        window_type (type): Class with a `parse(data)` method reading the windows of the topics, if
+            clients may view only a slice of them.
+
+    Returns:
+        None
+    """
+    _providers.append(Provider(re.compile(pattern), builder, authorize, retained_type, window_type))
+
+
+# Function to find the provider of a topic
+def resolve(topic, identity):
+    """
+    Finds the provider of a topic and checks that an identity may subscribe to it.
+
+    Args:
+        topic (str): Name of the topic.
+        identity (Identity): Identity of the user, None if anonymous.
+
+    Returns:
+        tuple or None: (snapshot builder without arguments, retained message type, window type),
+            or None if the topic doesn't exist or the identity may not subscribe to it.
+    """
+    if not isinstance(topic, str):
+        return None
+    for provider in _providers:
+        match = provider.pattern.fullmatch(topic)
+        if match is None:
+            continue
+        args = [int(arg) for arg in match.groups()]
+        if not provider.authorize(identity, *args):
+            return None
+        return functools.partial(provider.builder, *args), provider.retained_type, provider.window_type
+    return None
+
+
+def _authenticated(identity, *args):
+    return identity is not None
+
+
+def _staff(identity, *args):
+    return identity is not None and identity.is_staff
+
+
+def _own_manager_feed(identity, user_id):
+    return identity is not None and identity.team_id is not None and identity.user_id == user_id
+
+
+def _public(identity, *args):
+    return True
+
+
+# The topics of the dedicated websocket endpoints
+register(r'match_(\d+)', match_list, _authenticated, retained_type='new_match_list')
+register(r'manager_(\d+)', manager_feed, _own_manager_feed)
+register(r'admin_tournaments', admin_tournaments, _staff, window_type=TournamentWindow)
+register(r'admin_counts', admin_counts, _staff)
+register(r'groups_standings', group_standings, _staff)
+register(r'info', info_snapshot, _public, retained_type='send_groups')
+register(r'scoreboard', scoreboard.rebuild, _public, retained_type='send_tournaments')
@@ -10,12 +10,14 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models import Q, F, Count, Max
+from django.db.models import Q, Count, Max
+from django.http import HttpResponse
 
 from .permissions import *
 from .utils import distribute_teams_to_groups, image_compressor, get_season_data
+from . import auth, broadcast, scoreboard, seasons, services, stats
+from .payloads import info_snapshot, match_detail
 
 # Initialize configuration parser
 config = configparser.ConfigParser()
@@ -373,7 +375,7 @@ class SeasonsViewSet(viewsets.ModelViewSet):
         """
         try:
             # Check if any season is already created and not finished
-            season = Season.objects.get(is_finished=False)
+            season = seasons.current_season()
             if season:
                 # Raise permission denied if such a season exists
                 raise exceptions.PermissionDenied("Season is already created")
@@ -418,9 +420,10 @@ class TournamentsViewSet(viewsets.ModelViewSet):
         Returns:
             None
         """
+        season = seasons.current_season()
         # Check if a tournament with the same attributes already exists
         tournament = Tournament.objects.filter(
-            season=Season.objects.get(is_finished=False),
+            season=season,
             stage=serializer.validated_data['stage'],
             team_one=serializer.validated_data['team_one'],
             team_two=serializer.validated_data['team_two'],
@@ -440,7 +443,7 @@ class TournamentsViewSet(viewsets.ModelViewSet):
             try:
                 # Attempt to find a tournament with the same attributes but different team_two
                 tournament = Tournament.objects.get(
-                    season=Season.objects.get(is_finished=False),
+                    season=season,
                     stage=serializer.validated_data['stage'],
                     group=serializer.validated_data['group'],
                     team_one=serializer.validated_data['team_one'],
@@ -453,7 +456,7 @@ class TournamentsViewSet(viewsets.ModelViewSet):
                 try:
                     # Attempt to find a tournament with the same attributes but different team_one
                     tournament = Tournament.objects.get(
-                        season=Season.objects.get(is_finished=False),
+                        season=season,
                         stage=serializer.validated_data['stage'],
                         group=serializer.validated_data['group'],
                         team_two=serializer.validated_data['team_two'],
@@ -466,7 +469,7 @@ class TournamentsViewSet(viewsets.ModelViewSet):
                     try:
                         # Attempt to find a tournament with the same attributes but different group
                         tournament = Tournament.objects.get(
-                            season=Season.objects.get(is_finished=False),
+                            season=season,
                             stage=serializer.validated_data['stage'],
                             team_one=serializer.validated_data['team_one'],
                             team_two=serializer.validated_data['team_two'],
@@ -479,7 +482,7 @@ class TournamentsViewSet(viewsets.ModelViewSet):
                         try:
                             # Attempt to find a tournament with the same attributes but different match_start_time
                             tournament = Tournament.objects.get(
-                                season=Season.objects.get(is_finished=False),
+                                season=season,
                                 stage=serializer.validated_data['stage'],
                                 group=serializer.validated_data['group'],
                                 team_two=serializer.validated_data['team_two'],
@@ -493,8 +496,7 @@ class TournamentsViewSet(viewsets.ModelViewSet):
                             try:
                                 # Attempt to find a tournament with the same attributes but different group
                                 tournament = Tournament.objects.get(
-                                    season=Season.objects.get(
-                                        is_finished=False),
+                                    season=season,
                                     group=serializer.validated_data['group'],
                                     team_one=serializer.validated_data['team_one'],
                                     team_two=serializer.validated_data['team_two'],
@@ -830,7 +832,7 @@ class PlayerToTournamentViewSet(viewsets.ModelViewSet):
         """
         player_id = self.kwargs.get('pk')
         user = request.user
-        season = Season.objects.get(is_finished=False)
+        season = seasons.current_season()
         if user.is_anonymous:
             return Response({"error": "Authentication credentials were not provided"}, status=status.HTTP_401_UNAUTHORIZED)
         try:
@@ -1022,11 +1024,10 @@ def is_manager_or_staff(request):
     Returns:
         Response: HTTP response containing the user's staff and manager status.
     """
-    user = request.user
-    is_manager = Manager.objects.filter(user=user).exists()
+    identity = auth.request_identity(request)
     return Response(status=status.HTTP_200_OK, data={
-        "is_staff": request.user.is_staff,
-        "is_manager": is_manager})
+        "is_staff": identity is not None and identity.is_staff,
+        "is_manager": identity is not None and identity.team_id is not None})
 
 
 @api_view(['GET'])
@@ -1049,7 +1050,7 @@ def get_team_and_related_data(request):
         return Response({"error": "User ID is required in query parameter"}, status=status.HTTP_400_BAD_REQUEST)
 
     try:
-        manager = Manager.objects.get(user=user_id)
+        manager = Manager.objects.select_related('team__region').get(user=user_id)
     except:
         return Response({"error": "Manager not found"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -1064,7 +1065,7 @@ def get_team_and_related_data(request):
     team_region_name = team.region.name
     team_region_flag = team.region.flag_url.url
     try:
-        season = Season.objects.get(is_finished=False)
+        season = seasons.current_season()
     except:
         season = None
     is_reg_to_current_season = TournamentRegistration.objects.filter(
@@ -1133,19 +1134,19 @@ def get_current_tournaments(request):
     """
     Retrieves a list of ongoing tournaments.
 
-    This function retrieves a list of ongoing tournaments whose match start time is before or equal to
-    the current time and are not yet finished. It orders the tournaments by their match start time.
+    This function returns the live scoreboard shared with `scoreboard` topic subscribers: the
+    tournaments whose match start time is before or equal to the current time and are not yet
+    finished, ordered by their match start time, with the winners of their matches. The scoreboard
+    is kept in Redis and maintained on every change, so the request doesn't run any query.
 
     Args:
         request: HTTP request object.
 
     Returns:
-        Response: JSON response containing data of ongoing tournaments.
+        HttpResponse: JSON response containing data of ongoing tournaments.
     """
-    tournaments = Tournament.objects.filter(match_start_time__lte=timezone.now(
-    ), is_finished=False).order_by('match_start_time')
-    serializer = TournamentsSerializer(tournaments, many=True)
-    return Response(serializer.data)
+    _, text = scoreboard.snapshot()
+    return HttpResponse(text, content_type='application/json')
 
 
 @api_view(['GET'])
@@ -1153,9 +1154,9 @@ def get_current_season(request):
     """
     Retrieves the current season.
 
-    This function retrieves the current season object from the database
-    and checks if it has started. If the season has started, it updates
-    the registration status accordingly.
+    This function retrieves the current season object from the database.
+    It doesn't write anything: registration is closed by the `start_season`
+    task scheduled at the start of the season.
 
     Args:
         request: HTTP request object.
@@ -1165,12 +1166,9 @@ def get_current_season(request):
 
     """
     try:
-        season = Season.objects.get(is_finished=False)
+        season = seasons.current_season()
     except Season.DoesNotExist:
         return Response({"error": "No current season"}, status=status.HTTP_404_NOT_FOUND)
-    if season.start_datetime < timezone.now():
-        season.can_register = False
-        season.save()
     serializer = SeasonsSerializer(season)
     return Response(serializer.data)
 
@@ -1195,6 +1193,26 @@ def get_last_season(request):
     return Response(serializer.data)
 
 
+@api_view(['GET'])
+def get_info(request):
+    """
+    Retrieves the landing page data.
+
+    This function returns the snapshot shared with `/ws/information/` subscribers: the current
+    season state, the previous seasons and the players by league. The snapshot is kept in Redis,
+    so the request doesn't run any query once it is built.
+
+    Args:
+        request: HTTP request object.
+
+    Returns:
+        HttpResponse: JSON response containing the landing page data.
+
+    """
+    _, text = broadcast.snapshot('info', 'send_groups', info_snapshot)
+    return HttpResponse(text, content_type='application/json')
+
+
 @api_view(['GET'])
 def get_last_season_number(request):
     """
@@ -1239,7 +1257,7 @@ def randomizeGroups(request):
     """
 
     try:
-        season = Season.objects.get(is_finished=False)
+        season = seasons.current_season()
     except Season.DoesNotExist:
         return Response({"error": "Season not found"}, status=status.HTTP_404_NOT_FOUND)
     group_cnt = request.data.get('groupCnt')
@@ -1289,7 +1307,7 @@ def getPlayerToCurrentTournament(request):
 
     """
     try:
-        season = Season.objects.get(is_finished=False)
+        season = seasons.current_season()
     except Season.DoesNotExist:
         return Response({"error": "No current season"}, status=status.HTTP_404_NOT_FOUND)
     user = request.user
@@ -1319,7 +1337,7 @@ def registredToCurrentSeasonTeams(request):
 
     """
     try:
-        season = Season.objects.get(is_finished=False)
+        season = seasons.current_season()
     except Season.DoesNotExist:
         return Response({"error": "No current season"}, status=status.HTTP_404_NOT_FOUND)
     tournamentRegistrations = TournamentRegistration.objects.filter(
@@ -1351,7 +1369,7 @@ def groupsToCurrentSeason(request):
     """
     try:
         # Retrieve the current season that is not finished yet
-        season = Season.objects.get(is_finished=False)
+        season = seasons.current_season()
     except Season.DoesNotExist:
         return Response({"error": "No current season"}, status=status.HTTP_404_NOT_FOUND)
 
@@ -1402,7 +1420,7 @@ def postTeamToGroup(request):
             team_id=teamId, season__is_finished=False)
     except TournamentRegistration.DoesNotExist:
         return Response({"error": "Team not found"}, status=status.HTTP_404_NOT_FOUND)
-    season = Season.objects.get(is_finished=False)
+    season = seasons.current_season()
     try:
         groupStage = GroupStage.objects.get(
             season=season, groupMark=groupStageMark)
@@ -1450,7 +1468,7 @@ def deleteTeamFromGroup(request):
         team = Team.objects.get(id=teamId)
     except Team.DoesNotExist:
         return Response({"error": "Team not found"}, status=status.HTTP_404_NOT_FOUND)
-    season = Season.objects.get(is_finished=False)
+    season = seasons.current_season()
     groupStage = GroupStage.objects.get(season=season, teams=team)
     groupStage.teams.remove(team)
     groupStage.save()
@@ -1472,7 +1490,7 @@ def getToursToCurrentSeason(request):
         Response: HTTP response object containing tournament data or error message.
     """
     try:
-        season = Season.objects.get(is_finished=False)
+        season = seasons.current_season()
     except Season.DoesNotExist:
         return Response({"error": "No current season"}, status=status.HTTP_404_NOT_FOUND)
     matches = Tournament.objects.filter(season=season)
@@ -1498,7 +1516,7 @@ def deleteTournamentsToCurrentSeason(request):
         Response: HTTP response object indicating successful deletion or error message.
     """
     try:
-        season = Season.objects.get(is_finished=False)
+        season = seasons.current_season()
     except Season.DoesNotExist:
         return Response({"error": "No current season"}, status=status.HTTP_404_NOT_FOUND)
     matches = Tournament.objects.filter(season=season)
@@ -1515,6 +1533,7 @@ def getToursByManager(request):
 
     This function retrieves tournaments associated with the manager's team for the current season.
     It fetches the tournaments, processes them, and returns the relevant data in a response.
+    Finished tournaments only carry the number of their matches, see getTournamentMatches.
 
     Args:
         request: Request object containing metadata about the HTTP request.
@@ -1522,31 +1541,29 @@ def getToursByManager(request):
     Returns:
         Response: JSON response containing tournament data.
     """
-    user = request.user
-    season = Season.objects.get(is_finished=False)
-    if user.is_anonymous:
+    identity = auth.request_identity(request)
+    season = seasons.current_season()
+    if identity is None:
         return Response({"error": "Authentication credentials were not provided"}, status=status.HTTP_401_UNAUTHORIZED)
-    try:
-        manager = Manager.objects.get(user=user)
-    except Manager.DoesNotExist:
+    if identity.team_id is None:
         return Response({"error": "Manager not found"}, status=status.HTTP_404_NOT_FOUND)
-    team = manager.team
+    team_id = identity.team_id
     tournaments = Tournament.objects.filter(
-        Q(team_one=team) | Q(team_two=team), season=season)
+        Q(team_one=team_id) | Q(team_two=team_id), season=season)
     if tournaments.count() == 0:
         return Response([])
-    tournaments = tournaments.order_by('match_start_time')
+    tournaments = tournaments.annotate(matches_count=Count('match')).order_by('match_start_time')
     responseData = []
     for tournament in tournaments:
-        if tournament.asked_team is not None:
-            if tournament.asked_team.id != team.id:
+        if tournament.asked_team_id is not None:
+            if tournament.asked_team_id != team_id:
                 timeSuggested = tournament.ask_for_other_time
             else:
                 timeSuggested = None
         else:
             timeSuggested = None
-        opponent = tournament.team_two if tournament.team_one == team else tournament.team_one
-        team_in_tour_num = 1 if tournament.team_one == team else 2
+        opponent = tournament.team_two if tournament.team_one_id == team_id else tournament.team_one
+        team_in_tour_num = 1 if tournament.team_one_id == team_id else 2
         opponent_data = TeamsSerializer(opponent).data
         opp_players_to_tournament = PlayerToTournament.objects.filter(
             user=opponent.user, Season=season)
@@ -1567,8 +1584,6 @@ def getToursByManager(request):
                 'teamInTournament': team_in_tour_num
             })
         else:
-            matches = Match.objects.filter(tournament=tournament)
-            matches_data = MatchesSerializer(matches, many=True).data
             responseData.append({
                 'id': tournament.id,
                 'startTime': tournament.match_start_time,
@@ -1578,11 +1593,33 @@ def getToursByManager(request):
                 'teamInTournament': team_in_tour_num,
                 'team_one_wins': tournament.team_one_wins,
                 'team_two_wins': tournament.team_two_wins,
-                'matches': matches_data
+                'matchesCount': tournament.matches_count
             })
     return Response(responseData)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def getTournamentMatches(request, tournament_id):
+    """
+    Retrieves the matches of a tournament on demand.
+
+    The match list is the cached snapshot of the `match_<id>` topic, replaced only when the
+    matches of the tournament change, so it is returned without serializing it again.
+
+    Args:
+        request: Request object containing metadata about the HTTP request.
+        tournament_id (int): ID of the tournament.
+
+    Returns:
+        HttpResponse: JSON list of the matches of the tournament.
+    """
+    text = match_detail(tournament_id)
+    if text is None:
+        return Response({"error": "Tournament not found"}, status=status.HTTP_404_NOT_FOUND)
+    return HttpResponse(text, content_type='application/json')
+
+
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
 def setTimeSuggestion(request):
@@ -1598,25 +1635,23 @@ def setTimeSuggestion(request):
         Response: HTTP response indicating success or failure.
 
     """
-    user = request.user
+    identity = auth.request_identity(request)
     id = request.data.get('id')
     if id is None:
         return Response({"error": "id is required"}, status=status.HTTP_400_BAD_REQUEST)
-    if user.is_anonymous:
+    if identity is None:
         return Response({"error": "Authentication credentials were not provided"}, status=status.HTTP_401_UNAUTHORIZED)
-    try:
-        manager = Manager.objects.get(user=user)
-    except Manager.DoesNotExist:
+    if identity.team_id is None:
         return Response({"error": "Manager not found"}, status=status.HTTP_404_NOT_FOUND)
-    team = manager.team
+    team_id = identity.team_id
     try:
         tournament = Tournament.objects.get(id=id)
     except Tournament.DoesNotExist:
         return Response({"error": "Tournament not found"}, status=status.HTTP_404_NOT_FOUND)
-    if tournament.team_one != team and tournament.team_two != team:
+    if tournament.team_one_id != team_id and tournament.team_two_id != team_id:
         return Response({"error": "Tournament not found"}, status=status.HTTP_404_NOT_FOUND)
     tournament.ask_for_other_time = request.data.get('timeSuggestion')
-    tournament.asked_team = team
+    tournament.asked_team_id = team_id
     tournament.save()
     return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -1636,29 +1671,21 @@ def acceptTimeSuggestion(request):
         Response: HTTP response indicating success or failure.
 
     """
-    user = request.user
+    identity = auth.request_identity(request)
     id = request.data.get('id')
     if id is None:
         return Response({"error": "id is required"}, status=status.HTTP_400_BAD_REQUEST)
-    if user.is_anonymous:
+    if identity is None:
         return Response({"error": "Authentication credentials were not provided"}, status=status.HTTP_401_UNAUTHORIZED)
-    try:
-        manager = Manager.objects.get(user=user)
-    except Manager.DoesNotExist:
+    if identity.team_id is None:
         return Response({"error": "Manager not found"}, status=status.HTTP_404_NOT_FOUND)
-    team = manager.team
     try:
-        tournament = Tournament.objects.get(id=id)
+        # The suggestion is accepted with one conditional update, so it can't be accepted twice
+        accepted = services.accept_time_suggestion(id, identity.team_id)
     except Tournament.DoesNotExist:
         return Response({"error": "Tournament not found"}, status=status.HTTP_404_NOT_FOUND)
-    if tournament.team_one != team and tournament.team_two != team:
-        return Response({"error": "Tournament not found"}, status=status.HTTP_404_NOT_FOUND)
-    if tournament.ask_for_other_time is None:
+    if not accepted:
         return Response({"error": "Time suggestion not found"}, status=status.HTTP_404_NOT_FOUND)
-    tournament.match_start_time = tournament.ask_for_other_time
-    tournament.ask_for_other_time = None
-    tournament.asked_team = None
-    tournament.save()
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -1684,7 +1711,7 @@ def get_players_by_teams(request):
     if user.is_anonymous:
         return Response({"error": "Authentication credentials were not provided"}, status=status.HTTP_401_UNAUTHORIZED)
     try:
-        season = Season.objects.get(is_finished=False)
+        season = seasons.current_season()
     except Season.DoesNotExist:
         return Response({"error": "No current season"}, status=status.HTTP_404_NOT_FOUND)
     teams = TournamentRegistration.objects.filter(season=season).select_related(
@@ -1902,35 +1929,8 @@ def get_statistics(request):
         .annotate(playerCount=Count('id'))
     )
 
-    match_stats = {
-        'totalMatches': Match.objects.count(),
-        'mirrors': Match.objects.filter(player_one__race=F('player_two__race')).count(),
-        'tvzCount': Match.objects.filter(Q(player_one__race=2, player_two__race=1) | Q(player_one__race=1, player_two__race=2)).count(),
-        'tvzTerranWins': Match.objects.filter(Q(player_one__race=2, player_two__race=1) | Q(player_one__race=1, player_two__race=2), winner__race=2).count(),
-        'tvpCount': Match.objects.filter(Q(player_one__race=2, player_two__race=3) | Q(player_one__race=3, player_two__race=2)).count(),
-        'tvpTerranWins': Match.objects.filter(Q(player_one__race=2, player_two__race=3) | Q(player_one__race=3, player_two__race=2), winner__race=2).count(),
-        'pvzCount': Match.objects.filter(Q(player_one__race=3, player_two__race=1) | Q(player_one__race=1, player_two__race=3)).count(),
-        'pvzProtossWins': Match.objects.filter(Q(player_one__race=3, player_two__race=1) | Q(player_one__race=1, player_two__race=3), winner__race=3).count(),
-    }
-
-    maps_data = (
-        Map.objects
-        .annotate(
-            tvzCount=Count('match', filter=Q(match__in=Match.objects.filter(
-                Q(player_one__race=2, player_two__race=1) | Q(player_one__race=1, player_two__race=2)))),
-            tvzTerranWins=Count('match', filter=Q(match__in=Match.objects.filter(
-                Q(player_one__race=2, player_two__race=1) | Q(player_one__race=1, player_two__race=2)), match__winner__race=2)),
-            tvpCount=Count('match', filter=Q(match__in=Match.objects.filter(
-                Q(player_one__race=2, player_two__race=3) | Q(player_one__race=3, player_two__race=2)))),
-            tvpTerranWins=Count('match', filter=Q(match__in=Match.objects.filter(
-                Q(player_one__race=2, player_two__race=3) | Q(player_one__race=3, player_two__race=2)), match__winner__race=2)),
-            pvzCount=Count('match', filter=Q(match__in=Match.objects.filter(
-                Q(player_one__race=3, player_two__race=1) | Q(player_one__race=1, player_two__race=3)))),
-            pvzProtossWins=Count('match', filter=Q(match__in=Match.objects.filter(
-                Q(player_one__race=3, player_two__race=1) | Q(player_one__race=1, player_two__race=3)), match__winner__race=3)),
-        )
-        .values('id', 'name', 'tvzCount', 'tvzTerranWins', 'tvpCount', 'tvpTerranWins', 'pvzCount', 'pvzProtossWins')
-    )
+    # Match statistics are maintained on every change of a match, see main.stats
+    match_stats, maps_data = stats.match_statistics()
 
     response_data = {
         'playerCnt': players_cnt,
@@ -1939,7 +1939,7 @@ def get_statistics(request):
         'leagueStats': league_stats,
         'raceStats': list(race_stats),
         'matchStats': match_stats,
-        'maps': list(maps_data),
+        'maps': maps_data,
     }
     return Response(response_data)
 
@@ -2208,7 +2208,7 @@ def get_all_users(request):
 @api_view(['GET'])
 @permission_classes([permissions.IsAdminUser])
 def get_maps_by_season(request):
-    currnet_season = Season.objects.get(is_finished=False)
+    currnet_season = seasons.current_season()
     current_season_maps = Map.objects.filter(seasons=currnet_season)
     other_season_maps = Map.objects.exclude(seasons=currnet_season)
 
@@ -63,6 +63,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.gzip.GZipMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'main.seasons.CurrentSeasonMiddleware',
 ]
 
 
@@ -162,7 +163,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'main.auth.CachedTokenAuthentication',
     ]
 }
 
@@ -182,6 +183,42 @@ DJOSER = {
 
 REDIS_HOST = env('REDIS_HOST')
 REDIS_PORT = env('REDIS_PORT')
+REDIS_URL = "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/0"
+
+# Replay log of websocket topics: number of versions kept and their lifetime in seconds
+REPLAY_LOG_MAXLEN = env.int('REPLAY_LOG_MAXLEN', default=100)
+REPLAY_LOG_TTL = env.int('REPLAY_LOG_TTL', default=600)
+
+# Lifetime in seconds of cached token identities and of cached invalid tokens
+AUTH_CACHE_TTL = env.int('AUTH_CACHE_TTL', default=300)
+AUTH_NEGATIVE_CACHE_TTL = env.int('AUTH_NEGATIVE_CACHE_TTL', default=30)
+# Number of REST tokens each process keeps in memory, changes of their users invalidate them at once
+AUTH_LOCAL_CACHE_SIZE = env.int('AUTH_LOCAL_CACHE_SIZE', default=1024)
+
+# Lifetime in seconds of the cached current season, changes of the season invalidate it at once
+SEASON_CACHE_TTL = env.int('SEASON_CACHE_TTL', default=3600)
+
+# Websocket deadlines in seconds: authentication of new connections, idle connections and
+# heartbeats, idle reaping and heartbeats are disabled when 0
+WEBSOCKET_AUTH_TIMEOUT = env.int('WEBSOCKET_AUTH_TIMEOUT', default=5)
+WEBSOCKET_IDLE_TIMEOUT = env.int('WEBSOCKET_IDLE_TIMEOUT', default=0)
+WEBSOCKET_HEARTBEAT_INTERVAL = env.int('WEBSOCKET_HEARTBEAT_INTERVAL', default=0)
+
+# Websocket send queues: versions kept per connection before collapsing to the latest one, bytes
+# a connection may have sent without the client acknowledging them with a pong (0 disables, only
+# enforced with heartbeats), seconds a client may acknowledge nothing while versions wait, and
+# interval of the metrics in Redis
+WEBSOCKET_SEND_QUEUE_SIZE = env.int('WEBSOCKET_SEND_QUEUE_SIZE', default=8)
+WEBSOCKET_SEND_WINDOW = env.int('WEBSOCKET_SEND_WINDOW', default=262144)
+WEBSOCKET_MAX_LAG = env.int('WEBSOCKET_MAX_LAG', default=30)
+WEBSOCKET_METRICS_INTERVAL = env.int('WEBSOCKET_METRICS_INTERVAL', default=10)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/1",
+    }
+}
 
 CELERY_BROKER_URL = "redis://" + REDIS_HOST + ":" + REDIS_PORT + "/0"
 CELERY_BROKER_TRANSPORT_OPTIONS = {"visibility_timeout": 3600}
@@ -191,11 +228,23 @@ CELERY_ACCEPT_CONTENT = ["application/json"]
 CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 
+# Redis instances the topic groups are spread over, as comma separated host:port values
+CHANNEL_LAYER_SHARDS = env.list('CHANNEL_LAYER_SHARDS', default=[REDIS_HOST + ":" + REDIS_PORT])
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
             'hosts': [(REDIS_HOST, REDIS_PORT)],
         }
-    }
+    },
+    # Layer of the websocket topics: a group send is one pub/sub message per process subscribed to
+    # the group, whatever the number of subscribers, and groups are consistently hashed to a shard.
+    # Subscribers in the sending process get the message directly, without a Redis round trip
+    'topics': {
+        'BACKEND': 'main.layers.HybridChannelLayer',
+        'CONFIG': {
+            'hosts': ["redis://" + shard + "/0" for shard in CHANNEL_LAYER_SHARDS],
+        }
+    },
 }
\ No newline at end of file
@@ -48,6 +48,7 @@ urlpatterns = [
     path('api/v1/get_last_season/', views.get_last_season, name='get_last_season'),
     path('api/v1/get_last_season_number/',
          views.get_last_season_number, name='get_last_season_number'),
+    path('api/v1/getInfo/', views.get_info, name='get_info'),
     path('api/v1/player_to_tournament/<int:pk>/', views.PlayerToTournamentViewSet.as_view(
         {'delete': 'destroy'}), name='delete_player_to_tournament'),
     path('api/v1/getPlayerToCurrentTournament/',
@@ -69,6 +70,8 @@ urlpatterns = [
          views.acceptTimeSuggestion, name='acceptTimeSuggestion'),
     path('api/v1/getToursByManager/',
          views.getToursByManager, name='getToursByManager'),
+    path('api/v1/getTournamentMatches/<int:tournament_id>/',
+         views.getTournamentMatches, name='getTournamentMatches'),
     path('api/v1/randomizeGroups/', views.randomizeGroups, name='randomizeGroups'),
     path('api/v1/getPlayersByTeam/',
          views.get_players_by_teams, name='getPlayersByTeam'),